@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,6 +44,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'main.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -105,6 +108,35 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+def _env_int(name):
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+
+# Хеширование паролей (main.password_utils): алгоритм новых хешей —
+# pbkdf2_sha256, scrypt или argon2 (нужен пакет argon2-cffi). Остальные
+# хешеры списка нужны, чтобы проверять уже сохранённые пароли; при входе
+# они пересчитываются с текущим алгоритмом и параметрами. Параметры под
+# целевое время подбирает команда calibrate_password_hasher,
+# None — значение Django по умолчанию
+PASSWORD_HASH_ALGORITHM = os.environ.get('PASSWORD_HASH_ALGORITHM', 'pbkdf2_sha256')
+PASSWORD_PBKDF2_ITERATIONS = _env_int('PASSWORD_PBKDF2_ITERATIONS')
+PASSWORD_SCRYPT_WORK_FACTOR = _env_int('PASSWORD_SCRYPT_WORK_FACTOR')
+PASSWORD_ARGON2_TIME_COST = _env_int('PASSWORD_ARGON2_TIME_COST')
+
+_PASSWORD_HASHERS = {
+    'pbkdf2_sha256': 'main.password_utils.TunedPBKDF2PasswordHasher',
+    'scrypt': 'main.password_utils.TunedScryptPasswordHasher',
+    'argon2': 'main.password_utils.TunedArgon2PasswordHasher',
+}
+PASSWORD_HASHERS = [_PASSWORD_HASHERS[PASSWORD_HASH_ALGORITHM]] + [
+    hasher for algorithm, hasher in _PASSWORD_HASHERS.items() if algorithm != PASSWORD_HASH_ALGORITHM
+] + [
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 
@@ -130,3 +162,43 @@ STATICFILES_DIRS = [
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Замеры запросов (main.metrics_utils) пишет в БД фоновый поток процесса;
+# в тестах он выключен, замеры записываются явно flush_request_metrics
+REQUEST_METRICS_WRITER = sys.argv[1:2] != ['test']
+# Заголовок Server-Timing (число и время SQL запросов) получают только
+# сотрудники (is_staff); True — все клиенты, включая анонимных
+SERVER_TIMING_PUBLIC = False
+
+# Доступ к /metrics (Prometheus): запросы с этих адресов, суперпользователи
+# или заголовок Authorization: Bearer <METRICS_TOKEN>. Адреса сверяются с
+# REMOTE_ADDR: за обратным прокси на том же сервере это адрес прокси
+# (127.0.0.1), поэтому по умолчанию список пуст — добавляйте адреса, только
+# если сервер приложения недоступен снаружи в обход прокси
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+METRICS_ALLOWED_IPS = []
+
+# Фрагменты пазлов капчи, собранные командой build_captcha_tiles
+CAPTCHA_TILES_DIR = BASE_DIR / 'captcha_tiles'
+
+# Кеш: счетчики ограничения частоты входа и использованные токены капчи.
+# LocMemCache считает в каждом процессе отдельно; при нескольких процессах
+# сервера нужен общий кеш (Redis, Memcached или DatabaseCache)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+RATELIMIT_CACHE = 'default'
+
+# Обратные прокси (адреса или сети), от которых принимается X-Forwarded-For:
+# для их запросов лимиты по адресу считаются по клиенту из заголовка.
+# Прокси должен дописывать адрес клиента в X-Forwarded-For
+# (nginx: proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for)
+RATELIMIT_TRUSTED_PROXIES = ['127.0.0.1', '::1']
+
+# Лимиты попыток: {действие: {область: (попыток, окно в секундах)}},
+# по умолчанию main.ratelimit_utils.DEFAULT_RATE_LIMITS
+# RATE_LIMITS = {
+#     'login': {'ip': (30, 300), 'subnet': (100, 300), 'username': (10, 900)},
+# }
@@ -173,10 +173,21 @@ document.addEventListener('DOMContentLoaded', async function() {
         categories = window.forecastData.categories || [];
     }
     
-    updateBalanceValue(
-        incomeTransactions.reduce((s,t)=>s+(t.amount||0),0),
-        expensesTransactions.reduce((s,t)=>s+(t.amount||0),0)
-    );
+    // Итоговые доходы/расходы приходят с сервера (UserBalance), т.к. в странице
+    // есть только транзакции текущего месяца
+    function getTotals() {
+        const balance = window.forecastData && window.forecastData.balance;
+        if (balance) {
+            return { income: balance.total_income, expense: balance.total_expense };
+        }
+        return {
+            income: incomeTransactions.reduce((s, t) => s + (t.amount || 0), 0),
+            expense: expensesTransactions.reduce((s, t) => s + (t.amount || 0), 0)
+        };
+    }
+
+    const initialTotals = getTotals();
+    updateBalanceValue(initialTotals.income, initialTotals.expense);
 
     renderAccountsList(accounts);
     renderForecastAccounts(accounts);
@@ -343,9 +354,30 @@ document.addEventListener('DOMContentLoaded', async function() {
     const allCategoriesList = ['еда', 'транспорт', 'развлечения', 'жилье', 'здоровье', 'одежда', 'другое'];
 
     function getAvailableFunds() {
-        const totalIncome = incomeTransactions.reduce((s, t) => s + (t.amount || 0), 0);
-        const totalExpenses = expensesTransactions.reduce((s, t) => s + (t.amount || 0), 0);
-        return totalIncome - totalExpenses;
+        const totals = getTotals();
+        return totals.income - totals.expense;
+    }
+
+    // Сумма за месяц по помесячным итогам сервера (при их наличии) или по транзакциям
+    function getMonthlyTotal(transactionType, monthStart, categoryName = null) {
+        const rollups = window.forecastData && window.forecastData.rollups;
+        if (rollups) {
+            const monthKey = `${monthStart.getFullYear()}-${String(monthStart.getMonth() + 1).padStart(2, '0')}`;
+            return rollups
+                .filter(r => r.month === monthKey && r.transaction_type === transactionType &&
+                    (categoryName === null || r.category === categoryName))
+                .reduce((sum, r) => sum + r.total, 0);
+        }
+
+        const monthEnd = new Date(monthStart.getFullYear(), monthStart.getMonth() + 1, 0);
+        const source = transactionType === 'income' ? incomeTransactions : expensesTransactions;
+        return source
+            .filter(t => {
+                const tDate = new Date(t.date);
+                return (categoryName === null || t.category === categoryName) &&
+                    tDate >= monthStart && tDate <= monthEnd;
+            })
+            .reduce((sum, t) => sum + t.amount, 0);
     }
 
     function updateCurrentMonthDisplay() {
@@ -361,19 +393,8 @@ document.addEventListener('DOMContentLoaded', async function() {
         const monthStart = new Date(currentMonth.getFullYear(), currentMonth.getMonth(), 1);
         const monthEnd = new Date(currentMonth.getFullYear(), currentMonth.getMonth() + 1, 0);
         
-        const monthlyIncome = incomeTransactions
-            .filter(t => {
-                const tDate = new Date(t.date);
-                return tDate >= monthStart && tDate <= monthEnd;
-            })
-            .reduce((sum, t) => sum + t.amount, 0);
-        
-        const monthlyExpenses = expensesTransactions
-            .filter(t => {
-                const tDate = new Date(t.date);
-                return tDate >= monthStart && tDate <= monthEnd;
-            })
-            .reduce((sum, t) => sum + t.amount, 0);
+        const monthlyIncome = getMonthlyTotal('income', monthStart);
+        const monthlyExpenses = getMonthlyTotal('expense', monthStart);
         
         const surplus = monthlyIncome - monthlyExpenses;
         
@@ -404,7 +425,6 @@ document.addEventListener('DOMContentLoaded', async function() {
         categoryList.innerHTML = '';
         
         const monthStart = new Date(currentMonth.getFullYear(), currentMonth.getMonth(), 1);
-        const monthEnd = new Date(currentMonth.getFullYear(), currentMonth.getMonth() + 1, 0);
 
         if (categories.length === 0) {
             if (window.forecastData && window.forecastData.categories && window.forecastData.categories.length > 0) {
@@ -419,12 +439,7 @@ document.addEventListener('DOMContentLoaded', async function() {
         }
 
         categories.forEach((cat, index) => {
-            const spent = expensesTransactions
-                .filter(t => {
-                    const tDate = new Date(t.date);
-                    return t.category === cat.name && tDate >= monthStart && tDate <= monthEnd;
-                })
-                .reduce((sum, t) => sum + t.amount, 0);
+            const spent = getMonthlyTotal('expense', monthStart, cat.name);
             
             const progress = cat.budget > 0 ? Math.min((spent / cat.budget) * 100, 100) : 0;
             
@@ -598,16 +613,10 @@ document.addEventListener('DOMContentLoaded', async function() {
         }
         
         const monthStart = new Date(currentMonth.getFullYear(), currentMonth.getMonth(), 1);
-        const monthEnd = new Date(currentMonth.getFullYear(), currentMonth.getMonth() + 1, 0);
         
         const categoryData = {};
         categories.forEach(cat => {
-            const spent = expensesTransactions
-                .filter(t => {
-                    const tDate = new Date(t.date);
-                    return t.category === cat.name && tDate >= monthStart && tDate <= monthEnd;
-                })
-                .reduce((sum, t) => sum + t.amount, 0);
+            const spent = getMonthlyTotal('expense', monthStart, cat.name);
             
             categoryData[cat.name] = {
                 budget: cat.budget,
@@ -1104,13 +1113,56 @@ document.addEventListener('DOMContentLoaded', async function() {
     }
 
     function refreshFinancialOverview() {
-        const incomeTotal = incomeTransactions.reduce((sum, t) => sum + (t.amount || 0), 0);
-        const expenseTotal = expensesTransactions.reduce((sum, t) => sum + (t.amount || 0), 0);
-        updateBalanceValue(incomeTotal, expenseTotal);
+        const totals = getTotals();
+        updateBalanceValue(totals.income, totals.expense);
         renderCharts(incomeTransactions, expensesTransactions);
         updatePlanningView();
     }
 
+    // Догружаем транзакции за последний год (старше текущего месяца) постранично
+    // после первой отрисовки — они нужны только графикам по периодам
+    async function loadOlderTransactions() {
+        const until = window.forecastData && window.forecastData.transactions_since;
+        if (!until) return;
+
+        const since = new Date();
+        since.setDate(since.getDate() - 365);
+        const knownIds = new Set([...incomeTransactions, ...expensesTransactions].map(t => t.id));
+        let cursor = null;
+
+        try {
+            do {
+                const params = new URLSearchParams({
+                    since: since.toISOString().slice(0, 10),
+                    until: until,
+                    fields: 'id,name,amount,transaction_type,category,date',
+                    limit: 2000
+                });
+                if (cursor) params.set('cursor', cursor);
+
+                const response = await fetch(`/forecast/api/transactions/?${params}`, {
+                    headers: { 'Accept': 'application/json' },
+                    credentials: 'same-origin'
+                });
+                const data = await response.json();
+                if (!data.success) break;
+
+                data.transactions.forEach(t => {
+                    if (knownIds.has(t.id)) return;
+                    knownIds.add(t.id);
+                    const item = { id: t.id, name: t.name, amount: parseFloat(t.amount), category: t.category, date: t.date };
+                    if (t.transaction_type === 'income') incomeTransactions.push(item);
+                    else if (t.transaction_type === 'expense') expensesTransactions.push(item);
+                });
+                cursor = data.next_cursor;
+            } while (cursor);
+        } catch (error) {
+            console.error('Не удалось загрузить историю транзакций:', error);
+        }
+
+        refreshFinancialOverview();
+    }
+
     function resetAccountModal() {
         const nameInput = document.getElementById('accountName');
         const amountInput = document.getElementById('accountAmount');
@@ -1188,4 +1240,5 @@ document.addEventListener('DOMContentLoaded', async function() {
     }
 
     refreshFinancialOverview();
-});
\ No newline at end of file
+    loadOlderTransactions();
+});
@@ -1,3 +1,162 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
 from django.test import TestCase
+from django.utils import timezone
+
+from forecast.views import build_period_summary
+from main.models import Account, Transaction
+
+
+class MonthlyRollupApiTests(TestCase):
+    """Тесты API помесячных итогов"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='forecastuser', password='pass12345')
+        self.client.force_login(self.user)
+        Transaction.objects.create(
+            user=self.user, name='Продукты', amount=Decimal('120.50'),
+            transaction_type='expense', category='еда',
+            date=timezone.make_aware(datetime(2025, 3, 10, 12, 0)),
+        )
+
+    def test_rollups_for_month(self):
+        response = self.client.get('/forecast/api/rollups/', {'month': '2025-03'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['rollups'], [{
+            'month': '2025-03',
+            'category': 'еда',
+            'transaction_type': 'expense',
+            'total': 120.5,
+            'count': 1,
+        }])
+
+    def test_rollups_invalid_month(self):
+        response = self.client.get('/forecast/api/rollups/', {'month': 'март'})
+        self.assertEqual(response.status_code, 400)
+
+
+class SummaryApiTests(TestCase):
+    """Тесты серверной сводки для графиков"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='summaryuser', password='pass12345')
+        self.client.force_login(self.user)
+        self.now = timezone.make_aware(datetime(2025, 4, 16, 12, 0))  # среда
+        for day, amount, tx_type in ((14, '1000', 'income'), (16, '250', 'expense'), (2, '100', 'expense')):
+            Transaction.objects.create(
+                user=self.user, name='Операция', amount=Decimal(amount), transaction_type=tx_type,
+                date=timezone.make_aware(datetime(2025, 4, day, 10, 0)),
+            )
+        Transaction.objects.create(
+            user=self.user, name='Прошлый год', amount=Decimal('999'), transaction_type='income',
+            date=timezone.make_aware(datetime(2024, 12, 31, 10, 0)),
+        )
+
+    def test_month_buckets_by_day(self):
+        with self.assertNumQueries(1):
+            summary = build_period_summary(self.user, 'month', now=self.now)
+        self.assertEqual(len(summary['labels']), 30)
+        self.assertEqual(summary['income'][13], 1000.0)
+        self.assertEqual(summary['expense'][15], 250.0)
+        self.assertEqual(summary['expense'][1], 100.0)
+        self.assertEqual(summary['totals'], {'income': 1000.0, 'expense': 350.0, 'savings': 650.0})
+        self.assertEqual(summary['savings_percent'], 65)
+        self.assertAlmostEqual(summary['averages']['expense'], 350.0 / 30)
+
+    def test_week_and_year_buckets(self):
+        week = build_period_summary(self.user, 'week', now=self.now)
+        self.assertEqual(week['income'], [1000.0, 0, 0, 0, 0, 0, 0])
+        self.assertEqual(week['expense'][2], 250.0)
+
+        year = build_period_summary(self.user, 'year', now=self.now)
+        self.assertEqual(year['income'][3], 1000.0)
+        self.assertEqual(year['totals']['income'], 1000.0)
+
+    def test_api_rejects_unknown_period(self):
+        self.assertEqual(self.client.get('/forecast/api/summary/', {'period': 'day'}).status_code, 400)
+        response = self.client.get('/forecast/api/summary/', {'period': 'year'})
+        self.assertTrue(response.json()['success'])
+
+
+class TransactionsApiTests(TestCase):
+    """Тесты постраничной выдачи транзакций"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='pageuser', password='pass12345')
+        self.client.force_login(self.user)
+        account = Account.objects.create(user=self.user, name='Карта', amount=Decimal('0'))
+        same_moment = timezone.make_aware(datetime(2025, 5, 20, 9, 0))
+        for day in range(1, 6):
+            Transaction.objects.create(
+                user=self.user, name=f'Покупка {day}', amount=Decimal('10'), transaction_type='expense',
+                category='еда', date=timezone.make_aware(datetime(2025, 5, day, 9, 0)), account=account,
+            )
+        # Несколько транзакций с одинаковой датой — курсор должен различать их по id
+        for _ in range(3):
+            Transaction.objects.create(
+                user=self.user, name='Зарплата', amount=Decimal('100'), transaction_type='income',
+                category='доход', date=same_moment,
+            )
+
+    def test_cursor_pagination_walks_all_rows(self):
+        seen = []
+        cursor = None
+        while True:
+            params = {'limit': 3}
+            if cursor:
+                params['cursor'] = cursor
+            payload = self.client.get('/forecast/api/transactions/', params).json()
+            seen += [tx['id'] for tx in payload['transactions']]
+            cursor = payload['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(len(seen), 8)
+        self.assertEqual(len(set(seen)), 8)
+
+    def test_filters_and_fields(self):
+        payload = self.client.get('/forecast/api/transactions/', {
+            'type': 'expense', 'since': '2025-05-02', 'until': '2025-05-04', 'fields': 'name,account',
+        }).json()
+        self.assertEqual(payload['transactions'], [
+            {'name': 'Покупка 4', 'account': 'Карта'},
+            {'name': 'Покупка 3', 'account': 'Карта'},
+            {'name': 'Покупка 2', 'account': 'Карта'},
+        ])
+        self.assertIsNone(payload['next_cursor'])
+
+    def test_bad_parameters(self):
+        for params in ({'fields': 'password'}, {'cursor': 'мусор'}, {'since': 'вчера'}):
+            self.assertEqual(self.client.get('/forecast/api/transactions/', params).status_code, 400)
+
+
+class ForecastIndexTests(TestCase):
+    """Тесты страницы прогноза и кэширования API"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='indexuser', password='pass12345')
+        self.client.force_login(self.user)
+        Transaction.objects.create(user=self.user, name='Текущий месяц', amount=Decimal('40'),
+                                   transaction_type='expense', date=timezone.now())
+        Transaction.objects.create(user=self.user, name='Старая покупка', amount=Decimal('60'),
+                                   transaction_type='expense', date=timezone.now() - timedelta(days=400))
+
+    def test_index_embeds_only_current_month(self):
+        response = self.client.get('/forecast/')
+        self.assertEqual(response.status_code, 200)
+        data = response.context['forecast_data']
+        self.assertEqual([tx['name'] for tx in data['transactions']], ['Текущий месяц'])
+        self.assertEqual(data['balance']['total_expense'], 100.0)
+        self.assertContains(response, 'id="forecast-data"')
+
+    def test_api_revalidates_with_etag(self):
+        first = self.client.get('/forecast/api/transactions/')
+        etag = first['ETag']
+        cached = self.client.get('/forecast/api/transactions/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cached.status_code, 304)
 
-# Create your tests here.
+        Transaction.objects.create(user=self.user, name='Новая', amount=Decimal('1'),
+                                   transaction_type='income', date=timezone.now())
+        fresh = self.client.get('/forecast/api/transactions/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(fresh.status_code, 200)
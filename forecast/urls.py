@@ -9,6 +9,8 @@ urlpatterns = [
     path('api/accounts/', views.api_accounts, name='api_accounts'),
     path('api/transactions/', views.api_transactions, name='api_transactions'),
     path('api/goals/', views.api_goals, name='api_goals'),
+    path('api/rollups/', views.api_monthly_rollups, name='api_monthly_rollups'),
+    path('api/summary/', views.api_summary, name='api_summary'),
     path('api/categories/', views.api_budget_categories, name='api_budget_categories'),
     path('api/categories/save/', views.api_save_category, name='api_save_category'),
     path('api/categories/delete/', views.api_delete_category, name='api_delete_category'),
@@ -1,11 +1,19 @@
 from django.shortcuts import render
 from django.views.decorators.csrf import ensure_csrf_cookie, csrf_exempt
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
-from main.models import Account, Transaction, Goal, BudgetCategory
+from main.models import Account, Transaction, Goal, BudgetCategory, MonthlyCategoryRollup, UserBalance
 import json
-from django.contrib.admin.views.decorators import staff_member_required
-from django.db import connection
+import base64
+import hashlib
+import calendar
+from datetime import datetime, time, timedelta
+from django.db.models import Q, Sum
+from django.db.models.functions import TruncDay, TruncMonth
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from django.shortcuts import redirect
 
 
@@ -14,13 +22,24 @@ from django.shortcuts import redirect
 @ensure_csrf_cookie
 @login_required(login_url='main:login')
 def index(request):
-	"""Render forecast index page. Предоставляет данные через context"""
-	
+	"""
+	Render forecast index page. В страницу встраиваются только компактные
+	данные: счета, цели, категории, помесячные итоги, баланс и транзакции
+	текущего месяца. Более старая история догружается через
+	/forecast/api/transactions/ уже после отрисовки.
+	"""
+	month_start = get_period_range('month')[0]
+
 	# Получаем данные пользователя
 	accounts = Account.objects.filter(user=request.user).values('id', 'name', 'amount', 'account_type')
-	transactions = Transaction.objects.filter(user=request.user).values('id', 'name', 'amount', 'transaction_type', 'category', 'date')
+	transactions = (
+		Transaction.objects
+		.filter(user=request.user, date__gte=month_start)
+		.values('id', 'name', 'amount', 'transaction_type', 'category', 'date')
+	)
 	goals = Goal.objects.filter(user=request.user).values('id', 'name', 'target_amount', 'current_amount')
 	budget_categories = BudgetCategory.objects.filter(user=request.user).values('id', 'name', 'budget', 'emoji')
+	balance = UserBalance.objects.filter(user=request.user).values('total_income', 'total_expense').first()
 	
 	# Преобразуем decimal значения для JSON
 	accounts_list = []
@@ -61,18 +80,166 @@ def index(request):
 			'emoji': bc['emoji'],
 		})
 
-	
-	
 	context = {
-		'accounts_json': json.dumps(accounts_list),
-		'transactions_json': json.dumps(transactions_list),
-		'goals_json': json.dumps(goals_list),
-		'categories_json': json.dumps(categories_list),
+		'forecast_data': {
+			'accounts': accounts_list,
+			'transactions': transactions_list,
+			'transactions_since': month_start.isoformat(),
+			'goals': goals_list,
+			'categories': categories_list,
+			'rollups': serialize_rollups(MonthlyCategoryRollup.objects.filter(user=request.user)),
+			'balance': {
+				'total_income': float(balance['total_income']) if balance else 0.0,
+				'total_expense': float(balance['total_expense']) if balance else 0.0,
+			},
+		},
 	}
 	
 	return render(request, 'forecast/index.html', context)
 
 
+def user_data_etag(request, *args, **kwargs):
+	"""
+	ETag для API с данными пользователя. UserBalance.updated_at меняется при
+	любом изменении транзакций и счетов, поэтому повторные запросы без
+	изменений получают 304 без выполнения выборки.
+	"""
+	if not request.user.is_authenticated:
+		return None
+	updated_at = UserBalance.objects.filter(user=request.user).values_list('updated_at', flat=True).first()
+	if updated_at is None:
+		return None
+	raw = f'{request.user.pk}|{updated_at.isoformat()}|{timezone.localdate()}|{request.get_full_path()}'
+	return hashlib.md5(raw.encode()).hexdigest()
+
+
+def serialize_rollups(rollups):
+	"""Помесячные итоги по категориям в компактном виде для фронтенда"""
+	return [
+		{
+			'month': r['month'].strftime('%Y-%m'),
+			'category': r['category'],
+			'transaction_type': r['transaction_type'],
+			'total': float(r['total']),
+			'count': r['transactions_count'],
+		}
+		for r in rollups.values('month', 'category', 'transaction_type', 'total', 'transactions_count')
+	]
+
+
+# API: Помесячные итоги по категориям (?month=YYYY-MM для одного месяца)
+@login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=user_data_etag)
+def api_monthly_rollups(request):
+	rollups = MonthlyCategoryRollup.objects.filter(user=request.user)
+	month = request.GET.get('month')
+	if month:
+		try:
+			year, month_num = (int(part) for part in month.split('-'))
+			rollups = rollups.filter(month__year=year, month__month=month_num)
+		except ValueError:
+			return JsonResponse({'success': False, 'error': 'Неверный формат месяца, ожидается YYYY-MM'}, status=400)
+	return JsonResponse({'success': True, 'rollups': serialize_rollups(rollups)})
+
+
+SUMMARY_PERIODS = ('week', 'month', 'year')
+WEEKDAY_LABELS = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
+MONTH_LABELS = ['Янв', 'Фев', 'Мар', 'Апр', 'Май', 'Июн', 'Июл', 'Авг', 'Сен', 'Окт', 'Ноя', 'Дек']
+
+
+def get_period_range(period, now=None):
+	"""
+	Границы текущей недели/месяца/года в локальной временной зоне
+	(как getDateRange в main/static/js/script.js). Возвращает (start, end, labels),
+	где end — начало следующего периода.
+	"""
+	today = timezone.localdate(now)
+	if period == 'week':
+		first_day = today - timedelta(days=today.weekday())
+		last_day = first_day + timedelta(days=7)
+		labels = list(WEEKDAY_LABELS)
+	elif period == 'year':
+		first_day = today.replace(month=1, day=1)
+		last_day = first_day.replace(year=first_day.year + 1)
+		labels = list(MONTH_LABELS)
+	else:
+		days_in_month = calendar.monthrange(today.year, today.month)[1]
+		first_day = today.replace(day=1)
+		last_day = first_day + timedelta(days=days_in_month)
+		labels = [str(day) for day in range(1, days_in_month + 1)]
+
+	start = timezone.make_aware(datetime.combine(first_day, time.min))
+	end = timezone.make_aware(datetime.combine(last_day, time.min))
+	return start, end, labels
+
+
+def build_period_summary(user, period, now=None):
+	"""Доходы и расходы за период, сгруппированные по дням/месяцам одним запросом"""
+	start, end, labels = get_period_range(period, now)
+	trunc = TruncMonth('date') if period == 'year' else TruncDay('date')
+
+	rows = (
+		Transaction.objects
+		.filter(user=user, date__gte=start, date__lt=end)
+		.order_by()
+		.annotate(bucket=trunc)
+		.values('bucket', 'transaction_type')
+		.annotate(total=Sum('amount'))
+	)
+
+	series = {
+		'income': [0.0] * len(labels),
+		'expense': [0.0] * len(labels),
+	}
+	for row in rows:
+		if row['transaction_type'] not in series:
+			continue
+		bucket = timezone.localtime(row['bucket']) if timezone.is_aware(row['bucket']) else row['bucket']
+		if period == 'week':
+			index = bucket.weekday()
+		elif period == 'year':
+			index = bucket.month - 1
+		else:
+			index = bucket.day - 1
+		series[row['transaction_type']][index] += float(row['total'])
+
+	total_income = sum(series['income'])
+	total_expense = sum(series['expense'])
+	savings = total_income - total_expense
+	divisor = len(labels)
+
+	return {
+		'period': period,
+		'start': start.isoformat(),
+		'end': end.isoformat(),
+		'labels': labels,
+		'income': series['income'],
+		'expense': series['expense'],
+		'totals': {
+			'income': total_income,
+			'expense': total_expense,
+			'savings': savings,
+		},
+		'averages': {
+			'income': total_income / divisor,
+			'expense': total_expense / divisor,
+		},
+		'savings_percent': round(savings / total_income * 100) if total_income > 0 else 0,
+	}
+
+
+# API: Сводка доходов/расходов для графиков (?period=week|month|year)
+@login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=user_data_etag)
+def api_summary(request):
+	period = request.GET.get('period', 'month')
+	if period not in SUMMARY_PERIODS:
+		return JsonResponse({'success': False, 'error': 'Период должен быть week, month или year'}, status=400)
+	return JsonResponse({'success': True, **build_period_summary(request.user, period)})
+
+
 # API: Счета пользователя (для фронтенда при необходимости)
 @login_required
 def api_accounts(request):
@@ -89,23 +256,117 @@ def api_accounts(request):
 	return JsonResponse({'success': True, 'accounts': data})
 
 
+TRANSACTIONS_PAGE_SIZE = 500
+TRANSACTIONS_MAX_PAGE_SIZE = 2000
+
+# Поля, доступные в ?fields=, и соответствующие им колонки values()
+TRANSACTION_FIELDS = {
+	'id': 'id',
+	'name': 'name',
+	'amount': 'amount',
+	'transaction_type': 'transaction_type',
+	'category': 'category',
+	'date': 'date',
+	'account': 'account__name',
+}
+
+
+def encode_cursor(date, pk):
+	"""Курсор keyset-пагинации: позиция последней отданной транзакции"""
+	raw = f'{date.isoformat()}|{pk}'
+	return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+	"""Обратное преобразование курсора в (date, id). ValueError при ошибке"""
+	try:
+		raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+		date_str, pk = raw.rsplit('|', 1)
+		date = parse_datetime(date_str)
+		if date is None:
+			raise ValueError(date_str)
+		return date, int(pk)
+	except ValueError:
+		raise ValueError('Неверный курсор')
+
+
+def parse_date_param(value, end_of_day=False):
+	"""Дата (YYYY-MM-DD) или дата-время (ISO 8601) из GET-параметра"""
+	day = parse_date(value)
+	if day is not None:
+		if end_of_day:
+			day += timedelta(days=1)
+		date_time = datetime.combine(day, time.min)
+	else:
+		date_time = parse_datetime(value)
+		if date_time is None:
+			raise ValueError(f'Неверная дата: {value}')
+	if timezone.is_naive(date_time):
+		date_time = timezone.make_aware(date_time)
+	return date_time
+
+
 # API: Транзакции пользователя
+# Постранично по индексу (user, -date): ?cursor=, ?limit=, фильтры ?since=, ?until=,
+# ?type=, ?category= и выбор полей ?fields=id,amount,date
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=user_data_etag)
 def api_transactions(request):
+	params = request.GET
 	txs = Transaction.objects.filter(user=request.user)
-	data = [
-		{
-			'id': tx.id,
-			'name': tx.name,
-			'amount': float(tx.amount),
-			'transaction_type': tx.transaction_type,
-			'category': tx.category,
-			'date': tx.date.strftime('%Y-%m-%d'),
-			'account': tx.account.name if tx.account else None,
-		}
-		for tx in txs
-	]
-	return JsonResponse({'success': True, 'transactions': data})
+
+	try:
+		if params.get('since'):
+			txs = txs.filter(date__gte=parse_date_param(params['since']))
+		if params.get('until'):
+			# until=YYYY-MM-DD включает весь указанный день
+			until = params['until']
+			if parse_date(until) is not None:
+				txs = txs.filter(date__lt=parse_date_param(until, end_of_day=True))
+			else:
+				txs = txs.filter(date__lte=parse_date_param(until))
+		if params.get('cursor'):
+			cursor_date, cursor_id = decode_cursor(params['cursor'])
+			txs = txs.filter(Q(date__lt=cursor_date) | Q(date=cursor_date, id__lt=cursor_id))
+		limit = int(params.get('limit', TRANSACTIONS_PAGE_SIZE))
+	except ValueError as e:
+		return JsonResponse({'success': False, 'error': str(e)}, status=400)
+	limit = max(1, min(limit, TRANSACTIONS_MAX_PAGE_SIZE))
+
+	if params.get('type'):
+		txs = txs.filter(transaction_type=params['type'])
+	if params.get('category'):
+		txs = txs.filter(category=params['category'])
+
+	if params.get('fields'):
+		fields = [f.strip() for f in params['fields'].split(',') if f.strip()]
+		unknown = [f for f in fields if f not in TRANSACTION_FIELDS]
+		if unknown:
+			return JsonResponse({'success': False, 'error': f'Неизвестные поля: {", ".join(unknown)}'}, status=400)
+	else:
+		fields = list(TRANSACTION_FIELDS)
+
+	# id и date нужны всегда — по ним строится курсор следующей страницы
+	columns = {TRANSACTION_FIELDS[f] for f in fields} | {'id', 'date'}
+	rows = list(txs.order_by('-date', '-id').values(*columns)[:limit + 1])
+	has_more = len(rows) > limit
+	rows = rows[:limit]
+
+	data = []
+	for row in rows:
+		item = {}
+		for field in fields:
+			value = row[TRANSACTION_FIELDS[field]]
+			if field == 'amount':
+				value = float(value)
+			elif field == 'date':
+				value = value.strftime('%Y-%m-%d')
+			item[field] = value
+		data.append(item)
+
+	next_cursor = encode_cursor(rows[-1]['date'], rows[-1]['id']) if has_more else None
+	return JsonResponse({'success': True, 'transactions': data, 'next_cursor': next_cursor})
 
 
 # API: Финансовые цели пользователя
@@ -255,35 +516,3 @@ def api_delete_goal_forecast(request):
             return JsonResponse({'success': False, 'error': str(e)})
     
     return JsonResponse({'success': False})
-
-@staff_member_required(login_url='main:login')
-def sql_panel_view(request):
-    results = None
-    columns = None
-    error = None
-    query = ""
-
-    if request.method == "POST":
-        query = request.POST.get("sql", "").strip()
-
-        # Жёсткая защита
-        lower_query = query.lower()
-        if not lower_query.startswith("select"):
-            error = "Разрешены ТОЛЬКО SELECT-запросы!"
-        elif any(danger in lower_query for danger in ["delete", "update", "insert", "drop", "alter", "create", "truncate", "grant", "exec", "xp_", "--", "/*"]):
-            error = "Опасная команда обнаружена! Запрещено."
-        else:
-            try:
-                with connection.cursor() as cursor:
-                    cursor.execute(query)
-                    columns = [col[0] for col in cursor.description]
-                    results = cursor.fetchall()
-            except Exception as e:
-                error = f"Ошибка в запросе: {e}"
-
-    return render(request, "main/sql_panel.html", {
-        "query": query,
-        "results": results,
-        "columns": columns,
-        "error": error,
-    })
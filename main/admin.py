@@ -5,15 +5,24 @@ from django.shortcuts import render
 from django.contrib.auth.decorators import user_passes_test
 from django.contrib.auth.models import User
 from django.contrib.auth.admin import UserAdmin as DjangoUserAdmin
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
 from django import forms
-from django.db import connection
 from django.utils import timezone
 import json
 import requests
-from .models import Account, Transaction, Goal, BudgetCategory, UserProfile
-from .backup_utils import generate_sql_backup_all, generate_sql_backup_by_user
+from .models import Account, Transaction, Goal, BudgetCategory, UserProfile, BackupRun, SlowQuery
+from .backup_utils import (
+    generate_sql_backup_all, generate_sql_backup_by_user, generate_sql_backup_incremental,
+    BACKUP_FORMATS, BACKUP_BATCH_SIZE,
+)
+from .stream_utils import streaming_attachment, wants_gzip
+from .stats_utils import get_admin_stats
+from .sql_utils import (
+    SQL_PANEL_TIMEOUT_MS, execute_sql_query, explain_sql_query, is_query_timeout, is_read_query, iter_sql_csv,
+    record_query_time,
+)
+from .metrics_utils import METRICS_PERIODS, flush_request_metrics, request_metrics_summary
 
 
 # === SQL PANEL ===
@@ -51,7 +60,9 @@ class CustomAdminSite(admin.AdminSite):
             path('emulator-check/ajax/', self.admin_view(emulator_check_ajax), name='emulator_check_ajax'),
             path('backup/', self.admin_view(backup_view), name='backup'),
             path('backup/full/', self.admin_view(backup_full), name='backup_full'),
+            path('backup/incremental/', self.admin_view(backup_incremental), name='backup_incremental'),
             path('backup/user/<int:user_id>/', self.admin_view(backup_user), name='backup_user'),
+            path('request-metrics/', self.admin_view(request_metrics_view), name='request_metrics'),
         ]
         return custom_urls + urls
     
@@ -59,101 +70,92 @@ class CustomAdminSite(admin.AdminSite):
         """Главная страница админа с SQL консолью"""
         extra_context = extra_context or {}
         
-        # Добавляем статистику
-        from django.contrib.auth.models import User
-        extra_context['stats'] = {
-            'users_count': User.objects.count(),
-            'accounts_count': Account.objects.count(),
-            'transactions_count': Transaction.objects.count(),
-            'goals_count': Goal.objects.count(),
-        }
+        # Статистика заранее собирается командой collect_admin_stats
+        extra_context['stats'] = get_admin_stats()
         
         # Добавляем ссылку на бэкапы
         extra_context['backup_url'] = '/admin/backup/'
         
         # Обработка SQL формы
-        form = SQLCommandForm()
-        results = None
-        error = None
-        
-        if request.method == 'POST':
-            form = SQLCommandForm(request.POST)
-            if form.is_valid():
-                query = form.cleaned_data['query'].strip()
-                
-                if not query:
-                    error = 'Пожалуйста, введите SQL запрос'
-                else:
-                    try:
-                        results = execute_sql_query(query)
-                    except Exception as e:
-                        error = f'Ошибка выполнения запроса: {str(e)}'
+        form, results, error, query, response = handle_sql_panel_form(request)
+        if response is not None:
+            return response
         
         extra_context['form'] = form
         extra_context['results'] = results
         extra_context['error'] = error
+        extra_context['query_executed'] = query
+        extra_context['slow_queries'] = SlowQuery.objects.all()[:20]
         
         return super().index(request, extra_context)
 
 
-def execute_sql_query(query):
-    """Выполняет SQL запрос и возвращает результаты"""
-    with connection.cursor() as cursor:
-        cursor.execute(query)
-        
-        # Если это SELECT запрос
-        if cursor.description:
-            columns = [col[0] for col in cursor.description]
-            rows = cursor.fetchall()
-            
-            results = {
-                'type': 'select',
-                'columns': columns,
-                'rows': rows,
-                'row_count': len(rows)
-            }
-        else:
-            # Для INSERT, UPDATE, DELETE
-            results = {
-                'type': 'modify',
-                'message': f'Запрос выполнен успешно. Затронуто строк: {cursor.rowcount}',
-                'row_count': cursor.rowcount
-            }
-        
-        return results
-
-
-def sql_panel_view(request):
-    """Представление для SQL панели"""
-    # Проверяем что пользователь суперюзер
-    if not request.user.is_superuser:
-        from django.contrib.auth.views import redirect_to_login
-        return redirect_to_login(request.path, '/admin/login/')
-    
+def handle_sql_panel_form(request):
+    """
+    Обрабатывает форму SQL панели.
+    Возвращает (form, results, error, query, response), где response —
+    потоковая выгрузка CSV, если нажата соответствующая кнопка.
+    """
     form = SQLCommandForm()
     results = None
     error = None
-    query_executed = None
+    query = None
     
     if request.method == 'POST':
         form = SQLCommandForm(request.POST)
         if form.is_valid():
             query = form.cleaned_data['query'].strip()
-            query_executed = query
             
             if not query:
                 error = 'Пожалуйста, введите SQL запрос'
+            elif request.POST.get('action') == 'csv':
+                if not is_read_query(query):
+                    error = 'Выгрузка в CSV доступна только для SELECT запросов'
+                else:
+                    response = streaming_attachment(
+                        iter_sql_csv(query),
+                        f'sql_result_{timezone.now().strftime("%Y%m%d_%H%M%S")}.csv',
+                        'text/csv; charset=utf-8',
+                    )
+                    return form, None, None, query, response
             else:
                 try:
-                    results = execute_sql_query(query)
+                    if request.POST.get('action') == 'explain':
+                        results = explain_sql_query(query)
+                        elapsed_ms = results['execution_ms']
+                    else:
+                        offset = max(0, int(request.POST.get('offset') or 0))
+                        results = execute_sql_query(query, offset=offset)
+                        elapsed_ms = results['elapsed_ms']
                 except Exception as e:
                     error = f'Ошибка выполнения запроса: {str(e)}'
+                    if is_query_timeout(e):
+                        # Самые тяжёлые запросы тоже должны попасть в историю
+                        record_query_time(query, SQL_PANEL_TIMEOUT_MS)
+                else:
+                    if elapsed_ms is not None:
+                        record_query_time(query, elapsed_ms)
+    
+    return form, results, error, query, None
+
+
+def sql_panel_view(request):
+    """Представление для SQL панели"""
+    # Проверяем что пользователь суперюзер
+    if not request.user.is_superuser:
+        from django.contrib.auth.views import redirect_to_login
+        return redirect_to_login(request.path, '/admin/login/')
+    
+    form, results, error, query_executed, response = handle_sql_panel_form(request)
+    if response is not None:
+        return response
     
     context = {
         'form': form,
         'results': results,
         'error': error,
         'query_executed': query_executed,
+        'slow_queries': SlowQuery.objects.all()[:20],
         'title': 'SQL Панель Администратора',
         'site_header': 'CtrlMoney Администрирование',
     }
@@ -215,26 +217,77 @@ def backup_view(request):
     context = {
         'title': 'Управление бэкапами',
         'users': users,
+        'backup_runs': BackupRun.objects.select_related('base')[:10],
         'site_header': 'CtrlMoney Администрирование',
     }
     
     return render(request, 'admin/backup.html', context)
 
 
+def backup_options(request):
+    """
+    Параметры формата бэкапа из GET: ?format=insert|batch|copy&batch_size=N.
+    Возвращает (options, error).
+    """
+    backup_format = request.GET.get('format', 'insert')
+    if backup_format not in BACKUP_FORMATS:
+        return None, f'Неизвестный формат: {backup_format}'
+    try:
+        batch_size = int(request.GET.get('batch_size', BACKUP_BATCH_SIZE))
+    except ValueError:
+        return None, 'batch_size должен быть числом'
+    if not 1 <= batch_size <= 10000:
+        return None, 'batch_size должен быть от 1 до 10000'
+    return {'format': backup_format, 'batch_size': batch_size}, None
+
+
 def backup_full(request):
     """Скачивает полный SQL бэкап всей базы данных"""
     if not request.user.is_superuser:
         return JsonResponse({'error': 'Доступ запрещён'}, status=403)
     
-    try:
-        sql_backup = generate_sql_backup_all()
-        
-        response = HttpResponse(sql_backup, content_type='text/plain; charset=utf-8')
-        response['Content-Disposition'] = f'attachment; filename="ctrlmoney_backup_full_{__import__("datetime").datetime.now().strftime("%Y%m%d_%H%M%S")}.sql"'
-        
-        return response
-    except Exception as e:
-        return JsonResponse({'error': f'Ошибка генерации бэкапа: {str(e)}'}, status=500)
+    options, error = backup_options(request)
+    if error:
+        return JsonResponse({'error': error}, status=400)
+    
+    # Бэкап отдаётся потоково: строки генерируются по мере чтения таблиц,
+    # поэтому ответ начинается сразу и не держит всю базу в памяти
+    return streaming_attachment(
+        generate_sql_backup_all(**options),
+        f'ctrlmoney_backup_full_{timezone.now().strftime("%Y%m%d_%H%M%S")}.sql',
+        'text/plain; charset=utf-8',
+        gzip=wants_gzip(request),
+    )
+
+
+def backup_incremental(request):
+    """
+    Скачивает инкрементальный бэкап: изменения после последнего бэкапа
+    (или после бэкапа ?base=<id>) и удаления строк
+    """
+    if not request.user.is_superuser:
+        return JsonResponse({'error': 'Доступ запрещён'}, status=403)
+    
+    options, error = backup_options(request)
+    if error:
+        return JsonResponse({'error': error}, status=400)
+    
+    base_id = request.GET.get('base', '')
+    if base_id:
+        base = BackupRun.objects.filter(pk=base_id).first() if base_id.isdigit() else None
+        if base is None:
+            return JsonResponse({'error': 'Базовый бэкап не найден'}, status=404)
+    else:
+        base = BackupRun.objects.first()
+    if base is None:
+        return JsonResponse({'error': 'Нет предыдущего бэкапа: сначала выполните полный бэкап'}, status=400)
+    
+    return streaming_attachment(
+        generate_sql_backup_incremental(base, **options),
+        f'ctrlmoney_backup_incremental_{timezone.now().strftime("%Y%m%d_%H%M%S")}.sql',
+        'text/plain; charset=utf-8',
+        gzip=wants_gzip(request),
+    )
 
 
 def backup_user(request, user_id):
@@ -242,18 +295,48 @@ def backup_user(request, user_id):
     if not request.user.is_superuser:
         return JsonResponse({'error': 'Доступ запрещён'}, status=403)
     
+    options, error = backup_options(request)
+    if error:
+        return JsonResponse({'error': error}, status=400)
+    
     try:
-        from django.contrib.auth.models import User
         user = User.objects.get(id=user_id)
-        
-        sql_backup = generate_sql_backup_by_user(user)
-        
-        response = HttpResponse(sql_backup, content_type='text/plain; charset=utf-8')
-        response['Content-Disposition'] = f'attachment; filename="ctrlmoney_backup_{user.username}_{__import__("datetime").datetime.now().strftime("%Y%m%d_%H%M%S")}.sql"'
-        
-        return response
-    except Exception as e:
-        return JsonResponse({'error': f'Ошибка генерации бэкапа: {str(e)}'}, status=500)
+    except User.DoesNotExist:
+        return JsonResponse({'error': 'Пользователь не найден'}, status=404)
+    
+    return streaming_attachment(
+        generate_sql_backup_by_user(user, **options),
+        f'ctrlmoney_backup_{user.username}_{timezone.now().strftime("%Y%m%d_%H%M%S")}.sql',
+        'text/plain; charset=utf-8',
+        gzip=wants_gzip(request),
+    )
+
+
+def request_metrics_view(request):
+    """Перцентили времени ответа и SQL запросов по именам URL"""
+    if not request.user.is_superuser:
+        from django.contrib.auth.views import redirect_to_login
+        return redirect_to_login(request.path, '/admin/login/')
+    
+    try:
+        hours = int(request.GET.get('hours', 24))
+    except ValueError:
+        hours = 24
+    if hours not in METRICS_PERIODS:
+        hours = 24
+    
+    # Замеры этого процесса, ещё не записанные в БД
+    flush_request_metrics()
+    
+    context = {
+        'title': 'Время ответа по URL',
+        'metrics': request_metrics_summary(hours),
+        'hours': hours,
+        'periods': METRICS_PERIODS,
+        'site_header': 'CtrlMoney Администрирование',
+    }
+    
+    return render(request, 'admin/request_metrics.html', context)
 
 
 # Используем кастомный админ сайт
@@ -280,6 +363,7 @@ class ReadOnlyAdminMixin:
 @admin.register(Account)
 class AccountAdmin(ReadOnlyAdminMixin, admin.ModelAdmin):
     list_display = ('name', 'get_amount_display', 'get_account_type_display', 'get_user_display', 'created_at')
+    list_select_related = ('user',)
     list_filter = ('account_type', 'created_at', 'user')
     search_fields = ('name', 'description', 'user__username')
     readonly_fields = ('created_at', 'updated_at', 'user')
@@ -309,6 +393,7 @@ class AccountAdmin(ReadOnlyAdminMixin, admin.ModelAdmin):
 @admin.register(Transaction)
 class TransactionAdmin(ReadOnlyAdminMixin, admin.ModelAdmin):
     list_display = ('name', 'amount', 'get_transaction_type_display', 'category', 'date', 'get_user_display', 'account')
+    list_select_related = ('user', 'account')
     list_filter = ('transaction_type', 'category', 'date', 'created_at', 'user')
     search_fields = ('name', 'category', 'user__username')
     readonly_fields = ('created_at', 'updated_at', 'user')
@@ -352,6 +437,10 @@ class GoalAdmin(ReadOnlyAdminMixin, admin.ModelAdmin):
         }),
     )
     
+    def get_queryset(self, request):
+        """Прогресс целей считается в одном запросе вместе со списком"""
+        return super().get_queryset(request).with_progress().select_related('user')
+
     def get_current_display(self, obj):
         return f"{obj.current_amount:,.0f}₽"
     get_current_display.short_description = 'Текущая сумма'
@@ -378,6 +467,7 @@ class GoalAdmin(ReadOnlyAdminMixin, admin.ModelAdmin):
 @admin.register(BudgetCategory)
 class BudgetCategoryAdmin(ReadOnlyAdminMixin, admin.ModelAdmin):
     list_display = ('get_emoji_display', 'name', 'get_budget_display', 'get_user_display', 'created_at')
+    list_select_related = ('user',)
     list_filter = ('created_at', 'user')
     search_fields = ('name', 'user__username')
     readonly_fields = ('created_at', 'updated_at', 'user')
@@ -407,6 +497,7 @@ class BudgetCategoryAdmin(ReadOnlyAdminMixin, admin.ModelAdmin):
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
     list_display = ('get_full_name_display', 'get_user_display', 'is_blocked', 'failed_login_attempts', 'created_at')
+    list_select_related = ('user',)
     list_filter = ('created_at', 'user', 'is_blocked')
     search_fields = ('first_name', 'last_name', 'patronymic', 'user__username')
     readonly_fields = ('created_at', 'updated_at', 'user', 'failed_login_attempts', 'blocked_at')
@@ -567,6 +658,10 @@ class CustomUserAdmin(DjangoUserAdmin):
             return 'Профиль не найден'
     get_is_blocked_status.short_description = 'Детальный статус'
     
+    def get_queryset(self, request):
+        """Профиль подгружаем тем же запросом: статус блокировки выводится в каждой строке списка"""
+        return super().get_queryset(request).select_related('profile')
+    
     def get_readonly_fields(self, request, obj=None):
         """Динамические readonly поля"""
         ro = list(super().get_readonly_fields(request, obj) or [])
@@ -1,130 +1,271 @@
 """
 Утилиты для бэкапирования и экспорта данных в SQL
 """
-from django.db import connection
+from django.db import connection, transaction as db_transaction
+from django.db.models import Max, Min, Q
 from django.contrib.auth.models import User
-from .models import Account, Transaction, Goal, BudgetCategory, UserProfile
-from datetime import datetime
+from django.utils import timezone
+from .models import Account, Transaction, Goal, BudgetCategory, UserProfile, BackupRun, DeletedRecord
+from .prometheus_utils import BACKUP_DURATION
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+import gzip
+import hashlib
+import os
+import time
 
 
-def generate_sql_backup_all():
+BACKUP_CHUNK_SIZE = 2000
+BACKUP_BATCH_SIZE = 500
+
+# Форматы вывода данных:
+#   insert — отдельный INSERT на каждую строку (совместим с любой СУБД);
+#   batch  — INSERT со списком VALUES на batch_size строк;
+#   copy   — COPY ... FROM stdin (PostgreSQL, самый быстрый способ восстановления).
+BACKUP_FORMATS = ('insert', 'batch', 'copy')
+
+# Инкрементальный бэкап захватывает изменения с запасом: строка, сохранённая
+# в транзакции, которая завершилась уже после водяного знака, всё равно
+# попадёт в следующий бэкап. Повторы безопасны — строки заменяются целиком.
+BACKUP_WATERMARK_OVERLAP = timedelta(minutes=5)
+
+# Сколько последних полных бэкапов могут служить основой цепочки;
+# более старые запуски и надгробия удаляются (prune_backup_history)
+BACKUP_KEEP_FULL = 3
+
+# Порядок удаления: сначала зависимые таблицы, затем те, на которые они ссылаются
+TOMBSTONE_TABLES_ORDER = (
+    'main_transaction', 'main_goal', 'main_budgetcategory',
+    'main_account', 'main_userprofile', 'auth_user',
+)
+
+
+class BackupWriter:
     """
-    Генерирует полный SQL бэкап всей базы данных с DROP/CREATE инструкциями
+    Превращает объекты таблицы в строки бэкапа выбранного формата
     """
-    sql_lines = []
-    sql_lines.append("-- CtrlMoney Database Backup")
-    sql_lines.append(f"-- Generated: {datetime.now().isoformat()}")
-    sql_lines.append("-- This backup includes all data from the database")
-    sql_lines.append("")
-    sql_lines.append("BEGIN TRANSACTION;")
-    sql_lines.append("")
-    
-    # Бэкап пользователей
-    sql_lines.append("-- ===== AUTH_USER TABLE =====")
-    users = User.objects.all()
-    for user in users:
-        sql = generate_user_insert_sql(user)
-        sql_lines.append(sql)
-    
-    sql_lines.append("")
-    sql_lines.append("-- ===== MAIN_USERPROFILE TABLE =====")
-    for user in users:
-        try:
-            profile = user.profile
-            sql = generate_userprofile_insert_sql(profile)
-            sql_lines.append(sql)
-        except:
-            pass
-    
-    sql_lines.append("")
-    sql_lines.append("-- ===== MAIN_ACCOUNT TABLE =====")
-    for account in Account.objects.all():
-        sql = generate_account_insert_sql(account)
-        sql_lines.append(sql)
-    
-    sql_lines.append("")
-    sql_lines.append("-- ===== MAIN_TRANSACTION TABLE =====")
-    for transaction in Transaction.objects.all():
-        sql = generate_transaction_insert_sql(transaction)
-        sql_lines.append(sql)
-    
-    sql_lines.append("")
-    sql_lines.append("-- ===== MAIN_GOAL TABLE =====")
-    for goal in Goal.objects.all():
-        sql = generate_goal_insert_sql(goal)
-        sql_lines.append(sql)
-    
-    sql_lines.append("")
-    sql_lines.append("-- ===== MAIN_BUDGETCATEGORY TABLE =====")
-    for budget_cat in BudgetCategory.objects.all():
-        sql = generate_budgetcategory_insert_sql(budget_cat)
-        sql_lines.append(sql)
-    
-    sql_lines.append("")
-    sql_lines.append("COMMIT;")
-    
-    return "\n".join(sql_lines)
 
+    def __init__(self, format='insert', batch_size=BACKUP_BATCH_SIZE):
+        if format not in BACKUP_FORMATS:
+            raise ValueError(f'Неизвестный формат бэкапа: {format}')
+        self.format = format
+        self.batch_size = max(1, int(batch_size))
+
+    def section(self, title, table, objects):
+        """Строки раздела: заголовок и данные таблицы table из итератора objects"""
+        yield ""
+        yield f"-- ===== {title} ====="
+        columns, row_values = BACKUP_TABLES[table]
+        if self.format == 'insert':
+            for obj in objects:
+                yield _insert_sql(table, columns, [sql_literal(v) for v in row_values(obj)])
+        elif self.format == 'batch':
+            yield from self._batched(table, columns, row_values, objects)
+        else:
+            yield from self._copy(table, columns, row_values, objects)
+
+    def delete_ids(self, table, ids):
+        """DELETE строк по id, по batch_size идентификаторов в инструкции"""
+        batch = []
+        for object_id in ids:
+            batch.append(str(int(object_id)))
+            if len(batch) >= self.batch_size:
+                yield f"DELETE FROM {table} WHERE id IN ({', '.join(batch)});"
+                batch = []
+        if batch:
+            yield f"DELETE FROM {table} WHERE id IN ({', '.join(batch)});"
+
+    def _batched(self, table, columns, row_values, objects):
+        """INSERT ... VALUES (...), (...); по batch_size строк в одной инструкции"""
+        header = f"INSERT INTO {table} ({', '.join(columns)}) VALUES"
+        rows = []
+        for obj in objects:
+            rows.append('(' + ', '.join(sql_literal(v) for v in row_values(obj)) + ')')
+            if len(rows) >= self.batch_size:
+                yield header + "\n" + ",\n".join(rows) + ";"
+                rows = []
+        if rows:
+            yield header + "\n" + ",\n".join(rows) + ";"
+
+    def _copy(self, table, columns, row_values, objects):
+        """Блок COPY ... FROM stdin с данными в текстовом формате PostgreSQL"""
+        yield f"COPY {table} ({', '.join(columns)}) FROM stdin;"
+        for obj in objects:
+            yield '\t'.join(copy_literal(v) for v in row_values(obj))
+        yield "\\."
 
-def generate_sql_backup_by_user(user):
+
+def _sql_backup_all_lines(writer, chunk_size=BACKUP_CHUNK_SIZE):
     """
-    Генерирует SQL бэкап для конкретного пользователя
+    Строки полного SQL бэкапа всей базы данных (без перевода строки)
     """
-    sql_lines = []
-    sql_lines.append("-- CtrlMoney Database Backup - User Specific")
-    sql_lines.append(f"-- Generated: {datetime.now().isoformat()}")
-    sql_lines.append(f"-- User: {user.username}")
-    sql_lines.append("")
-    sql_lines.append("BEGIN TRANSACTION;")
-    sql_lines.append("")
-    
-    # Бэкап пользователя
-    sql_lines.append("-- ===== USER DATA =====")
-    sql = generate_user_insert_sql(user)
-    sql_lines.append(sql)
-    
-    # Профиль
-    sql_lines.append("")
-    sql_lines.append("-- ===== USER PROFILE =====")
-    try:
-        profile = user.profile
-        sql = generate_userprofile_insert_sql(profile)
-        sql_lines.append(sql)
-    except:
-        pass
-    
-    # Счета
-    sql_lines.append("")
-    sql_lines.append("-- ===== ACCOUNTS =====")
-    for account in user.accounts.all():
-        sql = generate_account_insert_sql(account)
-        sql_lines.append(sql)
-    
-    # Транзакции
-    sql_lines.append("")
-    sql_lines.append("-- ===== TRANSACTIONS =====")
-    for transaction in user.transactions.all():
-        sql = generate_transaction_insert_sql(transaction)
-        sql_lines.append(sql)
+    yield "-- CtrlMoney Database Backup"
+    yield f"-- Generated: {datetime.now().isoformat()}"
+    yield "-- This backup includes all data from the database"
+    yield ""
+    yield "BEGIN TRANSACTION;"
     
-    # Цели
-    sql_lines.append("")
-    sql_lines.append("-- ===== GOALS =====")
-    for goal in user.goals.all():
-        sql = generate_goal_insert_sql(goal)
-        sql_lines.append(sql)
+    yield from writer.section("AUTH_USER TABLE", 'auth_user',
+                              User.objects.all().iterator(chunk_size=chunk_size))
+    yield from writer.section("MAIN_USERPROFILE TABLE", 'main_userprofile',
+                              UserProfile.objects.order_by('user_id').iterator(chunk_size=chunk_size))
+    yield from writer.section("MAIN_ACCOUNT TABLE", 'main_account',
+                              Account.objects.all().iterator(chunk_size=chunk_size))
+    yield from writer.section("MAIN_TRANSACTION TABLE", 'main_transaction',
+                              Transaction.objects.all().iterator(chunk_size=chunk_size))
+    yield from writer.section("MAIN_GOAL TABLE", 'main_goal',
+                              Goal.objects.all().iterator(chunk_size=chunk_size))
+    yield from writer.section("MAIN_BUDGETCATEGORY TABLE", 'main_budgetcategory',
+                              BudgetCategory.objects.all().iterator(chunk_size=chunk_size))
     
-    # Категории бюджета
-    sql_lines.append("")
-    sql_lines.append("-- ===== BUDGET CATEGORIES =====")
-    for budget_cat in user.budget_categories.all():
-        sql = generate_budgetcategory_insert_sql(budget_cat)
-        sql_lines.append(sql)
+    yield ""
+    yield "COMMIT;"
+
+
+def _incremental_tables(since):
+    """(заголовок, таблица, queryset изменённых строк) для инкрементального бэкапа"""
+    # У auth_user нет updated_at, но любое сохранение пользователя
+    # пересохраняет профиль (сигнал save_user_profile)
+    users = User.objects.filter(Q(date_joined__gte=since) | Q(profile__updated_at__gte=since))
+    return [
+        ("AUTH_USER TABLE", 'auth_user', users),
+        ("MAIN_USERPROFILE TABLE", 'main_userprofile', UserProfile.objects.filter(updated_at__gte=since)),
+        ("MAIN_ACCOUNT TABLE", 'main_account', Account.objects.filter(updated_at__gte=since)),
+        ("MAIN_TRANSACTION TABLE", 'main_transaction', Transaction.objects.filter(updated_at__gte=since)),
+        ("MAIN_GOAL TABLE", 'main_goal', Goal.objects.filter(updated_at__gte=since)),
+        ("MAIN_BUDGETCATEGORY TABLE", 'main_budgetcategory', BudgetCategory.objects.filter(updated_at__gte=since)),
+    ]
+
+
+def _sql_backup_incremental_lines(run, writer, chunk_size=BACKUP_CHUNK_SIZE):
+    """
+    Строки инкрементального бэкапа: удаления по надгробиям, затем
+    изменённые строки (DELETE по id + данные в формате writer).
+    Счётчики выгруженных строк накапливаются в run.
+    """
+    since = run.since - BACKUP_WATERMARK_OVERLAP
+    yield "-- CtrlMoney Database Backup - Incremental"
+    yield f"-- Generated: {datetime.now().isoformat()}"
+    yield f"-- Base backup: #{run.base_id}"
+    yield f"-- Changes since: {run.since.isoformat()}"
+    yield f"-- Watermark: {run.watermark.isoformat()}"
+    yield ""
+    yield "BEGIN TRANSACTION;"
+
+    tombstones = DeletedRecord.objects.filter(deleted_at__gte=since).order_by()
+    yield ""
+    yield "-- ===== DELETED ROWS ====="
+    for table in TOMBSTONE_TABLES_ORDER:
+        ids = tombstones.filter(table=table).values_list('object_id', flat=True).distinct()
+        yield from writer.delete_ids(table, ids.iterator(chunk_size=chunk_size))
+        run.tombstones_count += ids.count()
+
+    for title, table, queryset in _incremental_tables(since):
+        queryset = queryset.order_by('pk')
+        ids = queryset.values_list('pk', flat=True)
+        yield from writer.delete_ids(table, ids.iterator(chunk_size=chunk_size))
+        yield from writer.section(title, table, queryset.iterator(chunk_size=chunk_size))
+        run.rows_count += ids.count()
+
+    yield ""
+    yield "COMMIT;"
+
+
+def generate_sql_backup_incremental(base=None, chunk_size=BACKUP_CHUNK_SIZE, format='insert', batch_size=BACKUP_BATCH_SIZE):
+    """
+    Генерирует инкрементальный SQL бэкап: строки, изменённые после водяного
+    знака бэкапа base (по умолчанию последнего), и удаления по надгробиям.
+
+    Применяется поверх полного бэкапа и предыдущих инкрементальных по
+    цепочке base. Запуск записывается в BackupRun только после того, как
+    файл выгружен целиком.
+    """
+    if base is None:
+        base = BackupRun.objects.first()
+    if base is None:
+        raise ValueError('Нет предыдущего бэкапа: сначала выполните полный бэкап')
+
+    started = time.monotonic()
+    writer = BackupWriter(format, batch_size)
+    run = BackupRun(kind='incremental', base=base, since=base.watermark, watermark=timezone.now())
+    for line in _sql_backup_incremental_lines(run, writer, chunk_size):
+        yield line + "\n"
+    run.save()
+    BACKUP_DURATION.observe(time.monotonic() - started, kind='incremental')
+
+
+def _sql_backup_by_user_lines(user, writer, chunk_size=BACKUP_CHUNK_SIZE):
+    """
+    Строки SQL бэкапа для конкретного пользователя (без перевода строки)
+    """
+    yield "-- CtrlMoney Database Backup - User Specific"
+    yield f"-- Generated: {datetime.now().isoformat()}"
+    yield f"-- User: {user.username}"
+    yield ""
+    yield "BEGIN TRANSACTION;"
     
-    sql_lines.append("")
-    sql_lines.append("COMMIT;")
+    yield from writer.section("USER DATA", 'auth_user', [user])
+    yield from writer.section("USER PROFILE", 'main_userprofile',
+                              UserProfile.objects.filter(user=user).iterator(chunk_size=chunk_size))
+    yield from writer.section("ACCOUNTS", 'main_account',
+                              user.accounts.all().iterator(chunk_size=chunk_size))
+    yield from writer.section("TRANSACTIONS", 'main_transaction',
+                              user.transactions.all().iterator(chunk_size=chunk_size))
+    yield from writer.section("GOALS", 'main_goal',
+                              user.goals.all().iterator(chunk_size=chunk_size))
+    yield from writer.section("BUDGET CATEGORIES", 'main_budgetcategory',
+                              user.budget_categories.all().iterator(chunk_size=chunk_size))
     
-    return "\n".join(sql_lines)
+    yield ""
+    yield "COMMIT;"
+
+
+def generate_sql_backup_all(chunk_size=BACKUP_CHUNK_SIZE, format='insert', batch_size=BACKUP_BATCH_SIZE):
+    """
+    Генерирует полный SQL бэкап всей базы данных.
+    Возвращает генератор строк файла (с переводом строки на конце),
+    который можно сразу отдавать в StreamingHttpResponse.
+    Формат данных задаётся параметром format (см. BACKUP_FORMATS).
+    Выгруженный целиком бэкап становится основой для инкрементальных.
+    """
+    started = time.monotonic()
+    writer = BackupWriter(format, batch_size)
+    run = BackupRun(kind='full', watermark=timezone.now())
+    for line in _sql_backup_all_lines(writer, chunk_size):
+        yield line + "\n"
+    # Водяной знак записывается только для выгруженного до конца бэкапа
+    run.save()
+    prune_backup_history()
+    BACKUP_DURATION.observe(time.monotonic() - started, kind='full')
+
+
+def prune_backup_history(keep_full=BACKUP_KEEP_FULL):
+    """
+    Оставляет keep_full последних полных бэкапов: более ранние запуски
+    больше не могут быть основой инкрементального бэкапа, а надгробия
+    старше самого раннего из оставшихся (с запасом BACKUP_WATERMARK_OVERLAP)
+    ни в один инкрементальный бэкап уже не попадут.
+    Возвращает (удалено запусков, удалено надгробий).
+    """
+    watermarks = list(BackupRun.objects.filter(kind='full').values_list('watermark', flat=True)[:keep_full])
+    if len(watermarks) < keep_full:
+        return 0, 0
+    oldest = watermarks[-1]
+    runs, _ = BackupRun.objects.filter(watermark__lt=oldest).delete()
+    tombstones, _ = DeletedRecord.objects.filter(deleted_at__lt=oldest - BACKUP_WATERMARK_OVERLAP).delete()
+    return runs, tombstones
+
+
+def generate_sql_backup_by_user(user, chunk_size=BACKUP_CHUNK_SIZE, format='insert', batch_size=BACKUP_BATCH_SIZE):
+    """
+    Генерирует SQL бэкап для конкретного пользователя.
+    Возвращает генератор строк файла, как и generate_sql_backup_all.
+    """
+    started = time.monotonic()
+    writer = BackupWriter(format, batch_size)
+    for line in _sql_backup_by_user_lines(user, writer, chunk_size):
+        yield line + "\n"
+    BACKUP_DURATION.observe(time.monotonic() - started, kind='user')
 
 
 def escape_sql_string(value):
@@ -135,139 +276,254 @@ def escape_sql_string(value):
     return f"'{escaped}'"
 
 
+def sql_literal(value):
+    """Значение поля в виде литерала SQL для INSERT"""
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        # PostgreSQL не приводит целые к boolean; SQLite понимает TRUE/FALSE с версии 3.23
+        return 'TRUE' if value else 'FALSE'
+    if isinstance(value, (int, Decimal)):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return escape_sql_string(value.isoformat())
+    return escape_sql_string(value)
+
+
+def copy_literal(value):
+    """Значение поля в текстовом формате COPY (PostgreSQL)"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (datetime, date)):
+        value = value.isoformat()
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def _insert_sql(table, columns, values):
+    """INSERT одной строки"""
+    cols_str = ', '.join(columns)
+    vals_str = ', '.join(values)
+    return f"INSERT INTO {table} ({cols_str}) VALUES ({vals_str});"
+
+
+USER_COLUMNS = [
+    'id', 'password', 'last_login', 'is_superuser', 'username', 
+    'first_name', 'last_name', 'email', 'is_staff', 'is_active', 
+    'date_joined'
+]
+
+
+def user_row_values(user):
+    """Значения полей пользователя в порядке USER_COLUMNS"""
+    return [
+        user.id, user.password, user.last_login, user.is_superuser, user.username,
+        user.first_name, user.last_name, user.email, user.is_staff, user.is_active,
+        user.date_joined,
+    ]
+
+
 def generate_user_insert_sql(user):
     """Генерирует INSERT запрос для пользователя"""
-    columns = [
-        'id', 'password', 'last_login', 'is_superuser', 'username', 
-        'first_name', 'last_name', 'email', 'is_staff', 'is_active', 
-        'date_joined'
-    ]
-    values = [
-        str(user.id),
-        escape_sql_string(user.password),
-        'NULL' if user.last_login is None else escape_sql_string(user.last_login.isoformat()),
-        '1' if user.is_superuser else '0',
-        escape_sql_string(user.username),
-        escape_sql_string(user.first_name),
-        escape_sql_string(user.last_name),
-        escape_sql_string(user.email),
-        '1' if user.is_staff else '0',
-        '1' if user.is_active else '0',
-        escape_sql_string(user.date_joined.isoformat())
+    return _insert_sql('auth_user', USER_COLUMNS, [sql_literal(v) for v in user_row_values(user)])
+
+
+USERPROFILE_COLUMNS = ['id', 'user_id', 'first_name', 'last_name', 'patronymic', 'created_at', 'updated_at']
+
+
+def userprofile_row_values(profile):
+    """Значения полей профиля в порядке USERPROFILE_COLUMNS"""
+    return [
+        profile.id, profile.user_id, profile.first_name, profile.last_name,
+        profile.patronymic, profile.created_at, profile.updated_at,
     ]
-    
-    cols_str = ', '.join(columns)
-    vals_str = ', '.join(values)
-    
-    return f"INSERT INTO auth_user ({cols_str}) VALUES ({vals_str});"
 
 
 def generate_userprofile_insert_sql(profile):
     """Генерирует INSERT запрос для профиля пользователя"""
-    columns = ['id', 'user_id', 'first_name', 'last_name', 'patronymic', 'created_at', 'updated_at']
-    values = [
-        str(profile.id),
-        str(profile.user_id),
-        escape_sql_string(profile.first_name),
-        escape_sql_string(profile.last_name),
-        escape_sql_string(profile.patronymic),
-        escape_sql_string(profile.created_at.isoformat()),
-        escape_sql_string(profile.updated_at.isoformat())
+    return _insert_sql('main_userprofile', USERPROFILE_COLUMNS,
+                       [sql_literal(v) for v in userprofile_row_values(profile)])
+
+
+ACCOUNT_COLUMNS = [
+    'id', 'user_id', 'name', 'amount', 'account_type', 'description',
+    'created_at', 'updated_at'
+]
+
+
+def account_row_values(account):
+    """Значения полей счета в порядке ACCOUNT_COLUMNS"""
+    return [
+        account.id, account.user_id, account.name, account.amount, account.account_type,
+        account.description, account.created_at, account.updated_at,
     ]
-    
-    cols_str = ', '.join(columns)
-    vals_str = ', '.join(values)
-    
-    return f"INSERT INTO main_userprofile ({cols_str}) VALUES ({vals_str});"
 
 
 def generate_account_insert_sql(account):
     """Генерирует INSERT запрос для счета"""
-    columns = [
-        'id', 'user_id', 'name', 'amount', 'account_type', 'description',
-        'created_at', 'updated_at'
-    ]
-    values = [
-        str(account.id),
-        str(account.user_id),
-        escape_sql_string(account.name),
-        str(account.amount),
-        escape_sql_string(account.account_type),
-        escape_sql_string(account.description),
-        escape_sql_string(account.created_at.isoformat()),
-        escape_sql_string(account.updated_at.isoformat())
+    return _insert_sql('main_account', ACCOUNT_COLUMNS,
+                       [sql_literal(v) for v in account_row_values(account)])
+
+
+TRANSACTION_COLUMNS = [
+    'id', 'user_id', 'name', 'amount', 'transaction_type', 'category',
+    'date', 'account_id', 'created_at', 'updated_at'
+]
+
+
+def transaction_row_values(transaction):
+    """Значения полей транзакции в порядке TRANSACTION_COLUMNS"""
+    return [
+        transaction.id, transaction.user_id, transaction.name, transaction.amount,
+        transaction.transaction_type, transaction.category, transaction.date,
+        transaction.account_id or None, transaction.created_at, transaction.updated_at,
     ]
-    
-    cols_str = ', '.join(columns)
-    vals_str = ', '.join(values)
-    
-    return f"INSERT INTO main_account ({cols_str}) VALUES ({vals_str});"
 
 
 def generate_transaction_insert_sql(transaction):
     """Генерирует INSERT запрос для транзакции"""
-    columns = [
-        'id', 'user_id', 'name', 'amount', 'transaction_type', 'category',
-        'date', 'account_id', 'created_at', 'updated_at'
-    ]
-    values = [
-        str(transaction.id),
-        str(transaction.user_id),
-        escape_sql_string(transaction.name),
-        str(transaction.amount),
-        escape_sql_string(transaction.transaction_type),
-        escape_sql_string(transaction.category),
-        escape_sql_string(transaction.date.isoformat()),
-        str(transaction.account_id) if transaction.account_id else 'NULL',
-        escape_sql_string(transaction.created_at.isoformat()),
-        escape_sql_string(transaction.updated_at.isoformat())
+    return _insert_sql('main_transaction', TRANSACTION_COLUMNS,
+                       [sql_literal(v) for v in transaction_row_values(transaction)])
+
+
+GOAL_COLUMNS = [
+    'id', 'user_id', 'name', 'target_amount', 'current_amount',
+    'use_only_linked_accounts', 'created_at', 'updated_at'
+]
+
+
+def goal_row_values(goal):
+    """Значения полей цели в порядке GOAL_COLUMNS"""
+    return [
+        goal.id, goal.user_id, goal.name, goal.target_amount, goal.current_amount,
+        goal.use_only_linked_accounts, goal.created_at, goal.updated_at,
     ]
-    
-    cols_str = ', '.join(columns)
-    vals_str = ', '.join(values)
-    
-    return f"INSERT INTO main_transaction ({cols_str}) VALUES ({vals_str});"
 
 
 def generate_goal_insert_sql(goal):
     """Генерирует INSERT запрос для цели"""
-    columns = [
-        'id', 'user_id', 'name', 'target_amount', 'current_amount',
-        'use_only_linked_accounts', 'created_at', 'updated_at'
-    ]
-    values = [
-        str(goal.id),
-        str(goal.user_id),
-        escape_sql_string(goal.name),
-        str(goal.target_amount),
-        str(goal.current_amount),
-        '1' if goal.use_only_linked_accounts else '0',
-        escape_sql_string(goal.created_at.isoformat()),
-        escape_sql_string(goal.updated_at.isoformat())
+    return _insert_sql('main_goal', GOAL_COLUMNS, [sql_literal(v) for v in goal_row_values(goal)])
+
+
+BUDGETCATEGORY_COLUMNS = [
+    'id', 'user_id', 'name', 'budget', 'emoji', 'created_at', 'updated_at'
+]
+
+
+def budgetcategory_row_values(budget_cat):
+    """Значения полей категории бюджета в порядке BUDGETCATEGORY_COLUMNS"""
+    return [
+        budget_cat.id, budget_cat.user_id, budget_cat.name, budget_cat.budget,
+        budget_cat.emoji, budget_cat.created_at, budget_cat.updated_at,
     ]
-    
-    cols_str = ', '.join(columns)
-    vals_str = ', '.join(values)
-    
-    return f"INSERT INTO main_goal ({cols_str}) VALUES ({vals_str});"
 
 
 def generate_budgetcategory_insert_sql(budget_cat):
     """Генерирует INSERT запрос для категории бюджета"""
-    columns = [
-        'id', 'user_id', 'name', 'budget', 'emoji', 'created_at', 'updated_at'
-    ]
-    values = [
-        str(budget_cat.id),
-        str(budget_cat.user_id),
-        escape_sql_string(budget_cat.name),
-        str(budget_cat.budget),
-        escape_sql_string(budget_cat.emoji),
-        escape_sql_string(budget_cat.created_at.isoformat()),
-        escape_sql_string(budget_cat.updated_at.isoformat())
-    ]
-    
-    cols_str = ', '.join(columns)
-    vals_str = ', '.join(values)
-    
-    return f"INSERT INTO main_budgetcategory ({cols_str}) VALUES ({vals_str});"
+    return _insert_sql('main_budgetcategory', BUDGETCATEGORY_COLUMNS,
+                       [sql_literal(v) for v in budgetcategory_row_values(budget_cat)])
+
+
+# Таблица -> (колонки, функция получения значений строки)
+BACKUP_TABLES = {
+    'auth_user': (USER_COLUMNS, user_row_values),
+    'main_userprofile': (USERPROFILE_COLUMNS, userprofile_row_values),
+    'main_account': (ACCOUNT_COLUMNS, account_row_values),
+    'main_transaction': (TRANSACTION_COLUMNS, transaction_row_values),
+    'main_goal': (GOAL_COLUMNS, goal_row_values),
+    'main_budgetcategory': (BUDGETCATEGORY_COLUMNS, budgetcategory_row_values),
+}
+
+# Модели таблиц в порядке восстановления (сначала те, на которые ссылаются)
+BACKUP_MODELS = {
+    'auth_user': User,
+    'main_userprofile': UserProfile,
+    'main_account': Account,
+    'main_transaction': Transaction,
+    'main_goal': Goal,
+    'main_budgetcategory': BudgetCategory,
+}
+
+
+def plan_backup_parts(partition_size, partitioned=('main_transaction',)):
+    """
+    Разбивает бэкап на независимые части: по таблице на часть, а большие
+    таблицы из partitioned — на диапазоны id по partition_size строк.
+    Возвращает список (таблица, (id_от, id_до) или None).
+    """
+    parts = []
+    for table, model in BACKUP_MODELS.items():
+        if table not in partitioned:
+            parts.append((table, None))
+            continue
+        bounds = model.objects.order_by().aggregate(low=Min('pk'), high=Max('pk'))
+        if bounds['low'] is None:
+            parts.append((table, None))
+            continue
+        for low in range(bounds['low'], bounds['high'] + 1, partition_size):
+            parts.append((table, (low, low + partition_size)))
+    return parts
+
+
+def backup_part_filename(table, id_range):
+    """Имя файла части бэкапа"""
+    if id_range is None:
+        return f'{table}.sql.gz'
+    return f'{table}.{id_range[0]:012d}-{id_range[1]:012d}.sql.gz'
+
+
+def _file_sha256(path):
+    """SHA-256 файла, читаемого блоками"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def dump_backup_part(table, id_range, directory, format='copy', batch_size=BACKUP_BATCH_SIZE,
+                     chunk_size=BACKUP_CHUNK_SIZE, snapshot=None):
+    """
+    Выгружает одну часть бэкапа в сжатый файл directory/<имя части>.
+
+    snapshot — идентификатор снимка PostgreSQL (pg_export_snapshot), чтобы все
+    части читали одно и то же состояние базы, как pg_dump --jobs.
+    Возвращает запись для манифеста.
+    """
+    started = time.monotonic()
+    queryset = BACKUP_MODELS[table].objects.order_by('pk')
+    if id_range is not None:
+        queryset = queryset.filter(pk__gte=id_range[0], pk__lt=id_range[1])
+
+    rows = 0
+
+    def counted(objects):
+        nonlocal rows
+        for obj in objects:
+            rows += 1
+            yield obj
+
+    filename = backup_part_filename(table, id_range)
+    path = os.path.join(directory, filename)
+    writer = BackupWriter(format, batch_size)
+    with db_transaction.atomic():
+        if snapshot:
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+                cursor.execute('SET TRANSACTION SNAPSHOT %s', [snapshot])
+        with gzip.open(path, 'wt', encoding='utf-8', newline='\n') as f:
+            title = table.upper() if id_range is None else f'{table.upper()} id {id_range[0]}..{id_range[1] - 1}'
+            for line in writer.section(title, table, counted(queryset.iterator(chunk_size=chunk_size))):
+                f.write(line + '\n')
+
+    return {
+        'file': filename,
+        'table': table,
+        'id_range': list(id_range) if id_range else None,
+        'rows': rows,
+        'bytes': os.path.getsize(path),
+        'sha256': _file_sha256(path),
+        'seconds': round(time.monotonic() - started, 3),
+    }
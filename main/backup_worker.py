@@ -0,0 +1,24 @@
+"""
+Точки входа процессов пула для параллельного бэкапа (команда backup_parallel).
+
+Процессы запускаются через spawn и импортируют этот модуль до настройки
+Django, поэтому модели и backup_utils импортируются только внутри функций.
+"""
+
+
+def init_worker():
+    """Настройка Django в новом процессе пула"""
+    import django
+    django.setup()
+
+
+def dump_part(args):
+    """Выгружает одну часть бэкапа: args = (таблица, диапазон id, параметры)"""
+    from django.db import connections
+    from main.backup_utils import dump_backup_part
+
+    table, id_range, kwargs = args
+    try:
+        return dump_backup_part(table, id_range, **kwargs)
+    finally:
+        connections.close_all()
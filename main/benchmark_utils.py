@@ -0,0 +1,230 @@
+"""
+Бенчмарки горячих путей приложения: страницы и API прогноза, импорт и
+экспорт JSON, SQL бэкапы (команда run_benchmarks).
+
+Каждый запуск выполняется в транзакции, которая откатывается, поэтому
+бенчмарки изменяющих данные API и импорта не портят базу. Для каждого
+бенчмарка замеряются время (медиана, минимум, максимум по повторам),
+число SQL запросов и пиковая память Python (tracemalloc, отдельным
+запуском, чтобы трассировка не искажала время).
+"""
+import io
+import json
+import statistics
+import time
+import tracemalloc
+
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.db import connection, transaction as db_transaction
+from django.test import RequestFactory
+from django.urls import resolve, reverse
+
+from .backup_utils import generate_sql_backup_all, generate_sql_backup_by_user
+from .json_utils import (
+    export_user_data_to_json, import_user_data_from_json, import_user_data_from_stream, iter_user_data_json,
+)
+from .metrics_utils import QueryCounter
+from .models import BudgetCategory, Goal
+
+
+BENCHMARK_REPEAT = 5
+# Допустимое ухудшение времени и памяти относительно базовой линии
+BENCHMARK_TOLERANCE = 0.25
+# Разница меньше этих порогов считается шумом
+BENCHMARK_MIN_DELTA_MS = 5
+BENCHMARK_MIN_DELTA_KB = 256
+
+
+class BenchmarkError(Exception):
+    """Бенчмарк завершился ошибкой (например, view вернул код 4xx/5xx)"""
+
+
+def _call_view(user, view_name, method='get', data=None):
+    """Вызывает view напрямую через RequestFactory, минуя middleware"""
+    path = reverse(view_name)
+    factory = RequestFactory()
+    if method == 'post':
+        request = factory.post(path, data=json.dumps(data or {}), content_type='application/json')
+    else:
+        request = factory.get(path, data or {})
+    request.user = user
+    request.session = SessionStore()
+    request._dont_enforce_csrf_checks = True
+
+    response = resolve(path).func(request)
+    if response.status_code >= 400:
+        raise BenchmarkError(f'{view_name}: код ответа {response.status_code}')
+    if response.streaming:
+        return sum(len(chunk) for chunk in response.streaming_content)
+    body = response.content
+    if response.get('Content-Type', '').startswith('application/json'):
+        payload = json.loads(body)
+        if payload.get('success') is False:
+            raise BenchmarkError(f'{view_name}: {payload.get("error")}')
+    return len(body)
+
+
+def _view(view_name, method='get', data=None):
+    def prepare(user):
+        return lambda: _call_view(user, view_name, method, data)
+    return prepare
+
+
+def _delete_category(user):
+    category = BudgetCategory.objects.create(user=user, name='benchmark-delete')
+    return lambda: _call_view(user, 'forecast:api_delete_category', 'post', {'id': category.pk})
+
+
+def _save_goal(user):
+    account_ids = list(user.accounts.values_list('pk', flat=True)[:2])
+    data = {'name': 'Бенчмарк', 'target_amount': '100000', 'accounts': account_ids}
+    return lambda: _call_view(user, 'forecast:api_save_goal_forecast', 'post', data)
+
+
+def _delete_goal(user):
+    goal = Goal.objects.create(user=user, name='benchmark-delete', target_amount=1)
+    return lambda: _call_view(user, 'forecast:api_delete_goal_forecast', 'post', {'id': goal.pk})
+
+
+def _json_export(user):
+    return lambda: len(export_user_data_to_json(user))
+
+
+def _json_import(bulk):
+    def prepare(user):
+        payload = export_user_data_to_json(user)
+        target = User.objects.create_user(username='benchmark-import')
+
+        def run():
+            result = import_user_data_from_json(payload, target, bulk=bulk)
+            if not result['success']:
+                raise BenchmarkError(result['error'])
+            return sum(section['created'] for section in result['results'].values())
+        return run
+    return prepare
+
+
+def _json_export_stream(user):
+    # Генератор, который отдаёт /api/export-json/
+    return lambda: _consume(iter_user_data_json(user))
+
+
+def _json_import_stream(user):
+    # Потоковый импорт загруженного файла, как в /api/import-json/
+    payload = export_user_data_to_json(user).encode('utf-8')
+    target = User.objects.create_user(username='benchmark-import')
+
+    def run():
+        result = import_user_data_from_stream(io.BytesIO(payload), target)
+        if not result['success']:
+            raise BenchmarkError(result['error'])
+        return sum(section['created'] for section in result['results'].values())
+    return run
+
+
+def _consume(lines):
+    return sum(len(line) for line in lines)
+
+
+def _backup_full(user):
+    return lambda: _consume(generate_sql_backup_all())
+
+
+def _backup_user(user):
+    return lambda: _consume(generate_sql_backup_by_user(user))
+
+
+# Имя бенчмарка -> prepare(user), возвращающая замеряемую функцию.
+# prepare выполняется в той же откатываемой транзакции, но не замеряется.
+BENCHMARKS = {
+    'forecast:index': _view('forecast:index'),
+    'forecast:api_accounts': _view('forecast:api_accounts'),
+    'forecast:api_transactions': _view('forecast:api_transactions'),
+    'forecast:api_goals': _view('forecast:api_goals'),
+    'forecast:api_monthly_rollups': _view('forecast:api_monthly_rollups'),
+    'forecast:api_summary': _view('forecast:api_summary'),
+    'forecast:api_budget_categories': _view('forecast:api_budget_categories'),
+    'forecast:api_save_category': _view('forecast:api_save_category', 'post', {'name': 'benchmark', 'budget': 1000}),
+    'forecast:api_delete_category': _delete_category,
+    'forecast:api_save_goal_forecast': _save_goal,
+    'forecast:api_delete_goal_forecast': _delete_goal,
+    'json:export': _json_export,
+    'json:import': _json_import(bulk=False),
+    'json:import_bulk': _json_import(bulk=True),
+    'json:export_stream': _json_export_stream,
+    'json:import_stream': _json_import_stream,
+    'backup:full': _backup_full,
+    'backup:user': _backup_user,
+}
+
+
+def _run_once(prepare, user, trace_memory=False):
+    """Один запуск в откатываемой транзакции: (секунды, SQL запросов, пик памяти в байтах)"""
+    with db_transaction.atomic():
+        run = prepare(user)
+        counter = QueryCounter()
+        if trace_memory:
+            tracemalloc.start()
+        try:
+            with connection.execute_wrapper(counter):
+                started = time.perf_counter()
+                run()
+                seconds = time.perf_counter() - started
+            peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+        finally:
+            if trace_memory:
+                tracemalloc.stop()
+        db_transaction.set_rollback(True)
+    return seconds, counter.count, peak
+
+
+def run_benchmark(name, user, repeat=BENCHMARK_REPEAT):
+    """Замеры одного бенчмарка: время по repeat запускам, SQL запросы и пиковая память"""
+    prepare = BENCHMARKS[name]
+    timings = []
+    queries = 0
+    for _ in range(repeat):
+        seconds, queries, _ = _run_once(prepare, user)
+        timings.append(seconds * 1000)
+    _, _, peak = _run_once(prepare, user, trace_memory=True)
+    return {
+        'median_ms': round(statistics.median(timings), 3),
+        'min_ms': round(min(timings), 3),
+        'max_ms': round(max(timings), 3),
+        'queries': queries,
+        'peak_kb': round(peak / 1024, 1),
+        'repeat': repeat,
+    }
+
+
+def run_benchmarks(user, names=None, repeat=BENCHMARK_REPEAT, progress=None):
+    """Запускает бенчмарки names (по умолчанию все). progress(name, result) — после каждого"""
+    results = {}
+    for name in names or BENCHMARKS:
+        results[name] = run_benchmark(name, user, repeat)
+        if progress:
+            progress(name, results[name])
+    return results
+
+
+def compare_with_baseline(results, baseline, tolerance=BENCHMARK_TOLERANCE):
+    """
+    Сравнивает результаты с базовой линией. Возвращает список ухудшений:
+    медиана времени или пиковая память выросли больше чем на tolerance
+    (и больше порогов шума), либо выросло число SQL запросов.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        delta_ms = result['median_ms'] - base['median_ms']
+        if delta_ms > BENCHMARK_MIN_DELTA_MS and result['median_ms'] > base['median_ms'] * (1 + tolerance):
+            regressions.append(f'{name}: время {base["median_ms"]} → {result["median_ms"]} мс')
+        if result['queries'] > base['queries']:
+            regressions.append(f'{name}: SQL запросов {base["queries"]} → {result["queries"]}')
+        delta_kb = result['peak_kb'] - base['peak_kb']
+        if delta_kb > BENCHMARK_MIN_DELTA_KB and result['peak_kb'] > base['peak_kb'] * (1 + tolerance):
+            regressions.append(f'{name}: память {base["peak_kb"]} → {result["peak_kb"]} КБ')
+    return regressions
@@ -1,8 +1,198 @@
 """
 Утилиты для работы с капчой и валидацией
 """
+import hashlib
+import io
+import json
+import os
 import random
 import re
+import secrets
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signing import BadSignature, TimestampSigner
+from django.urls import reverse
+from django.utils.crypto import salted_hmac
+
+
+# Исходные картинки для пазлов; команда build_captcha_tiles режет их на
+# фрагменты размера отображения и пишет в settings.CAPTCHA_TILES_DIR
+CAPTCHA_SOURCES_DIR = Path(__file__).resolve().parent / 'captcha_sources'
+CAPTCHA_TILE_SIZE = 256
+CAPTCHA_VARIANTS = 20
+CAPTCHA_MANIFEST = 'manifest.json'
+
+# Форматы фрагментов в порядке предпочтения: (расширение, MIME, параметры сохранения Pillow).
+# Последний формат — запасной для <img src>
+CAPTCHA_TILE_FORMATS = (
+    ('avif', 'image/avif', {'quality': 50}),
+    ('webp', 'image/webp', {'quality': 75, 'method': 6}),
+    ('png', 'image/png', {'optimize': True}),
+)
+CAPTCHA_TILE_NAME = re.compile(r'^[0-9a-f]{20}\.(avif|webp|png)$')
+# Имя фрагмента в адресе капчи: идентификатор фрагмента и формат
+CAPTCHA_PIECE_NAME = re.compile(r'^([0-9a-f]{16})\.(avif|webp|png)$')
+CAPTCHA_TILE_MIME = {extension: mime for extension, mime, _ in CAPTCHA_TILE_FORMATS}
+# Ключ пазла в токене, когда пазлы не собраны и отдаются static/img/1–4.png
+CAPTCHA_FALLBACK_PUZZLE = 'static'
+
+# Токен проверки капчи: подписанные случайный nonce, ключ пазла и время
+# выдачи. Идентификаторы фрагментов — HMAC от nonce и номера места, и
+# картинки отдаются по адресам из токена и идентификатора, а не по именам
+# файлов: ни по странице, ни по адресам картинок нельзя узнать правильный
+# порядок, и таблицу «адрес → место» не собрать — адреса у каждой капчи свои.
+# Для проверки ничего не хранится ни в БД, ни в сессии; в кеше отмечаются
+# использованные nonce (каждый токен — одна попытка).
+#
+# Ограничение: содержимое картинок берётся из конечного набора пазлов
+# (CAPTCHA_VARIANTS на картинку), а запасные картинки static/img/1–4.png
+# вообще постоянны. Бот, который запомнит хеши содержимого фрагментов,
+# сможет решать капчу сопоставлением, поэтому набор стоит регулярно
+# пересобирать (build_captcha_tiles по расписанию), а запасной режим
+# годится только до первой сборки.
+CAPTCHA_TOKEN_MAX_AGE = 600
+CAPTCHA_TOKEN_SALT = 'main.captcha.token'
+CAPTCHA_PIECE_SALT = 'main.captcha.piece'
+CAPTCHA_USED_KEY = 'main:captcha:used:'
+
+_manifest_cache = {}
+
+
+def captcha_tiles_dir():
+    return Path(getattr(settings, 'CAPTCHA_TILES_DIR', Path(settings.BASE_DIR) / 'captcha_tiles'))
+
+
+def _tile_formats():
+    """Форматы из CAPTCHA_TILE_FORMATS, которые умеет сохранять установленный Pillow"""
+    from PIL import features
+    return [fmt for fmt in CAPTCHA_TILE_FORMATS if fmt[0] == 'png' or features.check(fmt[0])]
+
+
+def render_puzzle(image, rnd, tile_size=CAPTCHA_TILE_SIZE):
+    """
+    Вырезает из картинки случайный квадрат (масштаб и сдвиг, иногда отражение)
+    и делит его на 4 фрагмента tile_size×tile_size в порядке 1→2→3→4
+    (слева направо, сверху вниз)
+    """
+    from PIL import Image, ImageOps
+
+    image = image.convert('RGB')
+    side = min(image.size)
+    crop = int(side * rnd.uniform(0.7, 1.0))
+    left = rnd.randint(0, image.width - crop)
+    top = rnd.randint(0, image.height - crop)
+    square = image.crop((left, top, left + crop, top + crop))
+    if rnd.random() < 0.5:
+        square = ImageOps.mirror(square)
+    square = square.resize((tile_size * 2, tile_size * 2), Image.LANCZOS)
+    return [
+        square.crop((col * tile_size, row * tile_size, (col + 1) * tile_size, (row + 1) * tile_size))
+        for row in (0, 1)
+        for col in (0, 1)
+    ]
+
+
+def save_tile(tile, directory, formats):
+    """Сохраняет фрагмент во всех форматах под именем из хеша содержимого. Возвращает {формат: имя}"""
+    files = {}
+    for extension, _, options in formats:
+        buffer = io.BytesIO()
+        tile.save(buffer, format=extension.upper(), **options)
+        data = buffer.getvalue()
+        name = f'{hashlib.sha256(data).hexdigest()[:20]}.{extension}'
+        path = directory / name
+        if not path.exists():
+            path.write_bytes(data)
+        files[extension] = name
+    return files
+
+
+def build_captcha_tiles(sources_dir=CAPTCHA_SOURCES_DIR, tiles_dir=None, variants=CAPTCHA_VARIANTS,
+                        tile_size=CAPTCHA_TILE_SIZE, seed=None):
+    """
+    Пересобирает набор пазлов: variants вариантов на каждую исходную картинку.
+    Пишет фрагменты и manifest.json в tiles_dir. Пазлы предыдущего набора
+    остаются (открытые страницы входа ещё ссылаются на них), более старые удаляются.
+    Требует Pillow. Возвращает манифест.
+    """
+    from PIL import Image
+
+    tiles_dir = Path(tiles_dir or captcha_tiles_dir())
+    tiles_dir.mkdir(parents=True, exist_ok=True)
+    formats = _tile_formats()
+    rnd = random.Random(seed)
+
+    sources = sorted(
+        path for path in Path(sources_dir).iterdir()
+        if path.suffix.lower() in ('.jpg', '.jpeg', '.png', '.webp')
+    )
+    if not sources:
+        raise ValueError(f'В {sources_dir} нет исходных картинок')
+
+    puzzles = []
+    for source in sources:
+        with Image.open(source) as image:
+            for _ in range(variants):
+                tiles = [save_tile(tile, tiles_dir, formats) for tile in render_puzzle(image, rnd, tile_size)]
+                puzzles.append({'source': source.name, 'tiles': tiles})
+
+    manifest_path = tiles_dir / CAPTCHA_MANIFEST
+    previous = json.loads(manifest_path.read_text(encoding='utf-8')) if manifest_path.exists() else {}
+    manifest = {
+        'tile_size': tile_size,
+        'formats': [(extension, mime) for extension, mime, _ in formats],
+        'puzzles': puzzles,
+        'previous_puzzles': previous.get('puzzles', []),
+    }
+    keep = _manifest_files(puzzles) | _manifest_files(manifest['previous_puzzles'])
+    for path in tiles_dir.iterdir():
+        if CAPTCHA_TILE_NAME.match(path.name) and path.name not in keep:
+            path.unlink()
+
+    # Манифест заменяется атомарно, чтобы процессы сервера не прочитали его наполовину
+    tmp_path = manifest_path.with_suffix('.tmp')
+    tmp_path.write_text(json.dumps(manifest, ensure_ascii=False), encoding='utf-8')
+    os.replace(tmp_path, manifest_path)
+    return manifest
+
+
+def _manifest_files(puzzles):
+    return {name for puzzle in puzzles for tile in puzzle['tiles'] for name in tile.values()}
+
+
+def _puzzle_key(puzzle):
+    """Ключ пазла для токена: хеш имён всех фрагментов, по нему не узнать отдельный фрагмент"""
+    names = ''.join(name for tile in puzzle['tiles'] for name in sorted(tile.values()))
+    return hashlib.sha256(names.encode()).hexdigest()[:16]
+
+
+def load_captcha_manifest():
+    """
+    Манифест пазлов (кешируется до изменения файла) или None, если пазлы
+    не собраны. В ключе 'by_key' — пазлы текущего и предыдущего набора по ключу.
+    """
+    path = captcha_tiles_dir() / CAPTCHA_MANIFEST
+    try:
+        mtime = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+    cached = _manifest_cache.get(path)
+    if cached is None or cached[0] != mtime:
+        manifest = json.loads(path.read_text(encoding='utf-8'))
+        if not manifest.get('puzzles'):
+            return None
+        manifest['by_key'] = {
+            _puzzle_key(puzzle): puzzle
+            for puzzle in manifest.get('previous_puzzles', []) + manifest['puzzles']
+        }
+        cached = _manifest_cache[path] = (mtime, manifest)
+    return cached[1]
+
+
+def _tile_url(token, piece_id, extension):
+    return reverse('main:captcha_tile', args=[token, f'{piece_id}.{extension}'])
 
 
 def generate_captcha_sequence():
@@ -15,12 +205,120 @@ def generate_captcha_sequence():
     return pieces
 
  
+def _piece_id(nonce, number):
+    """Непрозрачный идентификатор фрагмента number в капче с этим nonce"""
+    return salted_hmac(CAPTCHA_PIECE_SALT, f'{nonce}:{number}').hexdigest()[:16]
+
+
+class CaptchaChallenge(list):
+    """Перемешанные фрагменты пазла и подписанный токен для их проверки"""
+
+    def __init__(self, pieces, token):
+        super().__init__(pieces)
+        self.token = token
+
+
 def get_captcha_pieces():
     """
-    Получить перемешанные номера пазлов для отображения в шаблоне.
-    Возвращает список [1, 2, 3, 4] в случайном порядке.
+    Выдать новую капчу: перемешанные фрагменты пазла для шаблона и токен.
+
+    Пазл выбирается случайно из собранных командой build_captcha_tiles.
+    Каждый фрагмент — словарь: id (непрозрачный, уходит в форму),
+    number (место 1–4, только на сервере), sources (варианты для <picture>),
+    src (запасной формат), width и height. Адреса картинок свои у каждой
+    капчи (captcha_tile_path). Если пазлы ещё не собраны, по этим адресам
+    отдаются исходные картинки static/img/1–4.png.
+    Токен (challenge.token) проверяется verify_captcha_token.
+    """
+    nonce = secrets.token_urlsafe(12)
+    manifest = load_captcha_manifest()
+    puzzle = random.choice(manifest['puzzles']) if manifest else None
+    puzzle_key = _puzzle_key(puzzle) if puzzle else CAPTCHA_FALLBACK_PUZZLE
+    token = TimestampSigner(salt=CAPTCHA_TOKEN_SALT).sign(f'{nonce}:{puzzle_key}')
+
+    formats = manifest['formats'] if manifest else [('png', 'image/png')]
+    pieces = []
+    for number in generate_captcha_sequence():
+        piece_id = _piece_id(nonce, number)
+        pieces.append({
+            'id': piece_id,
+            'number': number,
+            'sources': [
+                {'type': mime, 'url': _tile_url(token, piece_id, extension)} for extension, mime in formats[:-1]
+            ],
+            'src': _tile_url(token, piece_id, formats[-1][0]),
+            'width': manifest['tile_size'] if manifest else None,
+            'height': manifest['tile_size'] if manifest else None,
+        })
+    return CaptchaChallenge(pieces, token)
+
+
+def _unsign_token(token, max_age):
+    """(nonce, ключ пазла) из токена или None, если подпись неверна или срок истёк"""
+    try:
+        value = TimestampSigner(salt=CAPTCHA_TOKEN_SALT).unsign(token, max_age=max_age)
+    except BadSignature:
+        return None
+    nonce, _, puzzle_key = value.partition(':')
+    return nonce, puzzle_key
+
+
+def _piece_number(nonce, piece_id):
+    for number in range(1, 5):
+        if _piece_id(nonce, number) == piece_id:
+            return number
+    return None
+
+
+def captcha_tile_path(token, name):
+    """
+    Файл фрагмента по адресу капчи: token из get_captcha_pieces и имя
+    '<id фрагмента>.<формат>'. None, если токен неверен или истёк, или
+    такого фрагмента нет.
     """
-    return generate_captcha_sequence()
+    match = CAPTCHA_PIECE_NAME.match(name)
+    unsigned = _unsign_token(token, CAPTCHA_TOKEN_MAX_AGE) if match else None
+    if unsigned is None:
+        return None
+    nonce, puzzle_key = unsigned
+    piece_id, extension = match.groups()
+    number = _piece_number(nonce, piece_id)
+    if number is None:
+        return None
+
+    if puzzle_key == CAPTCHA_FALLBACK_PUZZLE:
+        if extension != 'png':
+            return None
+        from django.contrib.staticfiles import finders
+        found = finders.find(f'img/{number}.png')
+        return Path(found) if found else None
+
+    manifest = load_captcha_manifest()
+    puzzle = manifest['by_key'].get(puzzle_key) if manifest else None
+    if puzzle is None or extension not in puzzle['tiles'][number - 1]:
+        return None
+    return captcha_tiles_dir() / puzzle['tiles'][number - 1][extension]
+
+
+def verify_captcha_token(token, answer, max_age=CAPTCHA_TOKEN_MAX_AGE):
+    """
+    Проверяет собранный пазл.
+
+    token — токен из get_captcha_pieces, answer — идентификаторы фрагментов
+    через запятую в порядке мест 1→4. Подпись и срок действия проверяются
+    без обращения к БД и сессии, порядок — verify_captcha_answer.
+    Каждый токен даёт одну попытку: nonce помечается в кеше до проверки
+    порядка, поэтому перебрать 24 перестановки с одним токеном нельзя.
+    """
+    unsigned = _unsign_token(token, max_age)
+    if unsigned is None:
+        return False
+    nonce = unsigned[0]
+    if not cache.add(CAPTCHA_USED_KEY + nonce, True, max_age):
+        return False
+
+    placed = [_piece_number(nonce, piece_id) for piece_id in answer.split(',')] if answer else []
+    return verify_captcha_answer(placed)
 
 
 def verify_captcha_answer(placed_pieces):
@@ -1,17 +1,46 @@
 """
 Утилиты для импорта/экспорта данных из JSON
 """
+import codecs
+import functools
 import json
+import time
 from decimal import Decimal, InvalidOperation
+from django.core.exceptions import ValidationError
+from django.db import transaction as db_transaction
 from django.utils import timezone
 from django.contrib.auth.models import User
 from datetime import datetime
-from .models import Account, Transaction, Goal, BudgetCategory
+from .models import Account, Transaction, Goal, BudgetCategory, UserBalance, MonthlyCategoryRollup
+from .prometheus_utils import JSON_DURATION, JSON_ROWS
 
 
-def import_user_data_from_json(json_content, user):
+# Размер пачки для bulk_create в режиме массового импорта
+IMPORT_BATCH_SIZE = 1000
+
+
+def _measured_import(func):
+    """Учитывает длительность импорта и число созданных строк в метриках /metrics"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.monotonic()
+        result = func(*args, **kwargs)
+        JSON_DURATION.observe(time.monotonic() - started, direction='import')
+        if result['success']:
+            for section, section_results in result['results'].items():
+                JSON_ROWS.inc(section_results['created'], direction='import', section=section)
+        return result
+    return wrapper
+
+
+@_measured_import
+def import_user_data_from_json(json_content, user, bulk=False, batch_size=IMPORT_BATCH_SIZE):
     """
     Импортирует данные пользователя из JSON
+
+    При bulk=True строки проверяются в памяти и вставляются через
+    bulk_create пачками по batch_size в одной транзакции БД
+    (см. import_user_data_bulk). Формат results в обоих режимах одинаковый.
     
     Ожидаемая структура JSON:
     {
@@ -48,6 +77,9 @@ def import_user_data_from_json(json_content, user):
             'error': f'Ошибка парсинга JSON: {str(e)}',
             'results': results
         }
+
+    if bulk:
+        return import_user_data_bulk(data, user, results, batch_size=batch_size)
     
     # Импорт счетов
     if 'accounts' in data and isinstance(data['accounts'], list):
@@ -79,16 +111,7 @@ def import_user_data_from_json(json_content, user):
                     raise ValueError("Сумма должна быть больше нуля")
                 
                 # Парсинг даты
-                date_str = tx_data.get('date')
-                if date_str:
-                    try:
-                        tx_date = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-                        if timezone.is_naive(tx_date):
-                            tx_date = timezone.make_aware(tx_date, timezone.get_default_timezone())
-                    except:
-                        tx_date = timezone.now()
-                else:
-                    tx_date = timezone.now()
+                tx_date = _parse_transaction_date(tx_data.get('date'))
                 
                 # Привязка счета
                 account = None
@@ -163,6 +186,370 @@ def import_user_data_from_json(json_content, user):
     }
 
 
+def _parse_transaction_date(date_str):
+    """Дата транзакции из ISO строки; при ошибке или отсутствии — текущий момент"""
+    if date_str:
+        try:
+            tx_date = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
+            if timezone.is_naive(tx_date):
+                tx_date = timezone.make_aware(tx_date, timezone.get_default_timezone())
+            return tx_date
+        except (TypeError, ValueError, AttributeError):
+            pass
+    return timezone.now()
+
+
+def _validated(instance):
+    """
+    Проверка строки в памяти перед bulk_create: при массовой вставке ошибку
+    БД нельзя отнести к конкретной строке, поэтому проверяем всё заранее.
+    """
+    try:
+        instance.full_clean(exclude=['user', 'account'], validate_unique=False, validate_constraints=False)
+    except ValidationError as e:
+        raise ValueError('; '.join(e.messages))
+    return instance
+
+
+def _build_account(user, idx, account_data, importer):
+    """Счёт из строки импорта"""
+    return Account(
+        user=user,
+        name=account_data.get('name', f'Счет {idx+1}'),
+        amount=Decimal(str(account_data.get('amount', 0))),
+        account_type=account_data.get('account_type', 'other'),
+        description=account_data.get('description', '')
+    )
+
+
+def _build_transaction(user, idx, tx_data, importer):
+    """Транзакция из строки импорта"""
+    amount = Decimal(str(tx_data.get('amount', 0)))
+    if amount <= 0:
+        raise ValueError("Сумма должна быть больше нуля")
+
+    account_id = tx_data.get('account_id')
+    return Transaction(
+        user=user,
+        name=tx_data.get('name', f'Транзакция {idx+1}'),
+        amount=amount,
+        transaction_type=tx_data.get('transaction_type', 'expense'),
+        category=tx_data.get('category', 'другое'),
+        date=_parse_transaction_date(tx_data.get('date')),
+        account_id=account_id if account_id in importer.account_ids() else None
+    )
+
+
+def _build_goal(user, idx, goal_data, importer):
+    """Цель из строки импорта"""
+    target_amount = Decimal(str(goal_data.get('target_amount', 0)))
+    if target_amount <= 0:
+        raise ValueError("Целевая сумма должна быть больше нуля")
+
+    current_amount = Decimal(str(goal_data.get('current_amount', 0)))
+    if current_amount < 0:
+        raise ValueError("Текущая сумма не может быть отрицательной")
+
+    return Goal(
+        user=user,
+        name=goal_data.get('name', f'Цель {idx+1}'),
+        target_amount=target_amount,
+        current_amount=current_amount
+    )
+
+
+def _build_budget_category(user, idx, bc_data, importer):
+    """Категория бюджета из строки импорта"""
+    budget = Decimal(str(bc_data.get('budget', 0)))
+    name = bc_data.get('name', f'Категория {idx+1}')
+    # Уникальность проверяем по одному запросу, а не exists() на строку
+    if name in importer.category_names():
+        raise ValueError("Категория с таким названием уже существует")
+
+    return BudgetCategory(
+        user=user,
+        name=name,
+        budget=budget,
+        emoji=bc_data.get('emoji', '')
+    )
+
+
+IMPORT_SECTIONS = {
+    'accounts': (Account, _build_account),
+    'transactions': (Transaction, _build_transaction),
+    'goals': (Goal, _build_goal),
+    'budget_categories': (BudgetCategory, _build_budget_category),
+}
+
+# Служебные поля файла экспорта: при импорте пропускаются
+EXPORT_META_KEYS = ('user', 'exported_at')
+
+
+class BulkImporter:
+    """
+    Накопитель строк для массового импорта: строки проверяются в памяти,
+    ошибки пишутся в results построчно, а корректные строки вставляются
+    bulk_create пачками по batch_size. Вызывать внутри transaction.atomic.
+
+    bulk_create не вызывает сигналы, поэтому finish() пересчитывает
+    UserBalance и MonthlyCategoryRollup пользователя.
+    """
+
+    def __init__(self, user, results, batch_size=IMPORT_BATCH_SIZE):
+        self.user = user
+        self.results = results
+        self.batch_size = batch_size
+        self.pending = {section: [] for section in IMPORT_SECTIONS}
+        self._account_ids = None
+        self._category_names = None
+
+    def account_ids(self):
+        """ID счетов пользователя, включая уже импортированные"""
+        if self._account_ids is None:
+            self.flush('accounts')
+            self._account_ids = set(self.user.accounts.values_list('id', flat=True))
+        return self._account_ids
+
+    def category_names(self):
+        """Названия категорий бюджета: существующие и уже принятые в импорт"""
+        if self._category_names is None:
+            self._category_names = set(self.user.budget_categories.values_list('name', flat=True))
+        return self._category_names
+
+    def add(self, section, idx, item):
+        """Проверяет одну строку раздела и ставит её в очередь на вставку"""
+        build = IMPORT_SECTIONS[section][1]
+        try:
+            row = _validated(build(self.user, idx, item, self))
+        except Exception as e:
+            self.results[section]['errors'].append(f"Строка {idx+1}: {str(e)}")
+            return
+
+        if section == 'budget_categories':
+            self.category_names().add(row.name)
+        self.pending[section].append(row)
+        if len(self.pending[section]) >= self.batch_size:
+            self.flush(section)
+
+    def flush(self, section=None):
+        """Вставляет накопленные строки одного или всех разделов"""
+        for name in ([section] if section else list(IMPORT_SECTIONS)):
+            rows = self.pending[name]
+            if not rows:
+                continue
+            IMPORT_SECTIONS[name][0].objects.bulk_create(rows, batch_size=self.batch_size)
+            self.results[name]['created'] += len(rows)
+            self.pending[name] = []
+            if name == 'accounts':
+                self._account_ids = None
+
+    def finish(self):
+        """Дописывает остаток и пересчитывает сводные таблицы пользователя"""
+        self.flush()
+        if self.results['accounts']['created'] or self.results['transactions']['created']:
+            UserBalance.rebuild(user_ids=[self.user.id])
+        if self.results['transactions']['created']:
+            MonthlyCategoryRollup.rebuild(user_ids=[self.user.id])
+
+
+def _failed_import(results, error):
+    """Результат импорта, откатанного целиком"""
+    for section in results.values():
+        section['created'] = 0
+    return {
+        'success': False,
+        'error': error,
+        'results': results
+    }
+
+
+def import_user_data_bulk(data, user, results, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Массовый импорт уже разобранного JSON через BulkImporter в одной
+    транзакции БД. Число запросов зависит от количества пачек, а не строк.
+    """
+    try:
+        with db_transaction.atomic():
+            importer = BulkImporter(user, results, batch_size)
+            for section in IMPORT_SECTIONS:
+                if section in data and isinstance(data[section], list):
+                    for idx, item in enumerate(data[section]):
+                        importer.add(section, idx, item)
+                    importer.flush(section)
+            importer.finish()
+    except Exception as e:
+        # Транзакция БД откатана целиком — ничего не создано
+        return _failed_import(results, f'Ошибка массового импорта: {str(e)}')
+
+    return {
+        'success': True,
+        'results': results
+    }
+
+
+# === ПОТОКОВЫЙ ИМПОРТ ===
+
+# Сколько символов читать из файла за раз
+STREAM_CHUNK_SIZE = 64 * 1024
+# Максимальный размер одного элемента массива; защищает от неограниченного
+# роста буфера на повреждённом файле
+STREAM_MAX_ITEM_SIZE = 16 * 1024 * 1024
+
+
+class JsonStructureError(ValueError):
+    """Файл импорта не соответствует ожидаемой структуре"""
+
+
+class _JsonStreamReader:
+    """
+    Инкрементальный разбор JSON из файлового объекта (str или bytes):
+    в памяти держится только текущий кусок файла и один элемент массива.
+    """
+
+    def __init__(self, fileobj, chunk_size=STREAM_CHUNK_SIZE):
+        self.fileobj = fileobj
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.text_decoder = codecs.getincrementaldecoder('utf-8-sig')()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        """Дочитывает следующий кусок файла. False — файл закончился"""
+        if self.eof:
+            return False
+        raw = self.fileobj.read(self.chunk_size)
+        if not raw:
+            self.eof = True
+        # Многобайтовый символ может разрезаться на границе куска
+        chunk = self.text_decoder.decode(raw, final=self.eof) if isinstance(raw, bytes) else raw
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        if len(self.buffer) > STREAM_MAX_ITEM_SIZE:
+            raise JsonStructureError('Слишком большой элемент JSON')
+        return not self.eof
+
+    def peek(self):
+        """Следующий значащий символ (без пробелов) или '' в конце файла"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\n\r':
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise json.JSONDecodeError(f'Ожидался символ {char!r}', self.buffer, self.pos)
+        self.pos += 1
+
+    def value(self):
+        """Разбирает одно JSON значение, дочитывая файл по мере необходимости"""
+        self.peek()
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # Число в самом конце буфера могло быть обрезано («1.» из «1.5») — дочитываем
+            if not self.buffer[end:].strip('0123456789.eE+-') and self._fill():
+                continue
+            self.pos = end
+            return obj
+
+
+def _next_separator(reader, closing):
+    """Пропускает ',' или закрывающую скобку и возвращает её"""
+    separator = reader.peek()
+    if separator not in (',', closing):
+        raise json.JSONDecodeError(f"Ожидался ',' или '{closing}'", reader.buffer, reader.pos)
+    reader.pos += 1
+    return separator
+
+
+def iter_json_import_items(fileobj, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Потоково перебирает элементы массивов верхнего уровня файла импорта.
+    Возвращает тройки (раздел, индекс, элемент). Структура проверяется по
+    ходу разбора (те же правила, что в validate_json_structure):
+    при нарушении выбрасывается JsonStructureError.
+    """
+    reader = _JsonStreamReader(fileobj, chunk_size)
+    if reader.peek() != '{':
+        raise JsonStructureError('JSON должен быть объектом')
+    reader.expect('{')
+
+    if reader.peek() == '}':
+        reader.pos += 1
+        return
+
+    while True:
+        key = reader.value()
+        if key in EXPORT_META_KEYS:
+            reader.expect(':')
+            reader.value()
+            if _next_separator(reader, '}') == '}':
+                break
+            continue
+        if key not in IMPORT_SECTIONS:
+            raise JsonStructureError(f'Неизвестные ключи: {key}')
+        reader.expect(':')
+
+        if reader.peek() != '[':
+            raise JsonStructureError(f'"{key}" должен быть массивом')
+        reader.expect('[')
+        if reader.peek() == ']':
+            reader.pos += 1
+        else:
+            idx = 0
+            while True:
+                yield key, idx, reader.value()
+                idx += 1
+                if _next_separator(reader, ']') == ']':
+                    break
+
+        if _next_separator(reader, '}') == '}':
+            break
+
+    if reader.peek() != '':
+        raise json.JSONDecodeError('Лишние данные после JSON', reader.buffer, reader.pos)
+
+
+@_measured_import
+def import_user_data_from_stream(fileobj, user, batch_size=IMPORT_BATCH_SIZE, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Потоковый импорт из файлового объекта (например, request.FILES['file']).
+    Файл разбирается один раз, структура проверяется по ходу, строки
+    вставляются пачками — пиковая память не зависит от размера файла.
+    Весь импорт выполняется в одной транзакции БД: при ошибке структуры
+    или синтаксиса ничего не сохраняется.
+    """
+    results = {section: {'created': 0, 'errors': []} for section in IMPORT_SECTIONS}
+
+    try:
+        with db_transaction.atomic():
+            importer = BulkImporter(user, results, batch_size)
+            for section, idx, item in iter_json_import_items(fileobj, chunk_size):
+                importer.add(section, idx, item)
+            importer.finish()
+    except json.JSONDecodeError as e:
+        return _failed_import(results, f'Ошибка парсинга JSON: {str(e)}')
+    except JsonStructureError as e:
+        return _failed_import(results, str(e))
+    except Exception as e:
+        return _failed_import(results, f'Ошибка массового импорта: {str(e)}')
+
+    return {
+        'success': True,
+        'results': results
+    }
+
+
 def validate_json_structure(json_content):
     """
     Валидирует структуру JSON файла перед импортом
@@ -175,7 +562,7 @@ def validate_json_structure(json_content):
     if not isinstance(data, dict):
         return False, 'JSON должен быть объектом'
     
-    allowed_keys = {'accounts', 'transactions', 'goals', 'budget_categories'}
+    allowed_keys = {'accounts', 'transactions', 'goals', 'budget_categories', *EXPORT_META_KEYS}
     provided_keys = set(data.keys())
     
     unknown_keys = provided_keys - allowed_keys
@@ -203,61 +590,66 @@ def validate_json_structure(json_content):
     return True, 'Структура JSON корректна'
 
 
+EXPORT_CHUNK_SIZE = 2000
+
+# Секции экспорта: ключ в JSON, related_name у пользователя и выгружаемые поля
+EXPORT_SECTIONS = (
+    ('accounts', 'accounts',
+     ('id', 'name', 'amount', 'account_type', 'description', 'created_at')),
+    ('transactions', 'transactions',
+     ('id', 'name', 'amount', 'transaction_type', 'category', 'date', 'account_id', 'created_at')),
+    ('goals', 'goals',
+     ('id', 'name', 'target_amount', 'current_amount', 'created_at')),
+    ('budget_categories', 'budget_categories',
+     ('id', 'name', 'budget', 'emoji', 'created_at')),
+)
+
+
+def _export_value(value):
+    """Приводит значение из .values() к виду, который пишется в JSON"""
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _indent_json(value, level):
+    """json.dumps(indent=2) с дополнительным отступом для вложенного элемента"""
+    text = json.dumps(value, ensure_ascii=False, indent=2)
+    return text.replace('\n', '\n' + ' ' * level)
+
+
+def iter_user_data_json(user, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Генератор экспорта данных пользователя в JSON.
+
+    Отдаёт документ кусками по мере чтения .values().iterator(),
+    поэтому в памяти одновременно находится не больше chunk_size строк.
+    Результат совпадает с json.dumps(..., indent=2) для того же словаря.
+    """
+    started = time.monotonic()
+    yield '{\n'
+    yield '  "user": %s,\n' % json.dumps(user.username, ensure_ascii=False)
+    yield '  "exported_at": %s' % json.dumps(timezone.now().isoformat())
+
+    for key, related_name, fields in EXPORT_SECTIONS:
+        queryset = getattr(user, related_name).values(*fields)
+        yield ',\n  "%s": [' % key
+        rows = 0
+        for row in queryset.iterator(chunk_size=chunk_size):
+            item = {field: _export_value(row[field]) for field in fields}
+            yield (',\n    ' if rows else '\n    ') + _indent_json(item, 4)
+            rows += 1
+        yield '\n  ]' if rows else ']'
+        JSON_ROWS.inc(rows, direction='export', section=key)
+
+    yield '\n}'
+    JSON_DURATION.observe(time.monotonic() - started, direction='export')
+
+
 def export_user_data_to_json(user):
     """
     Экспортирует данные пользователя в JSON формат
     """
-    data = {
-        'user': user.username,
-        'exported_at': timezone.now().isoformat(),
-        'accounts': [],
-        'transactions': [],
-        'goals': [],
-        'budget_categories': []
-    }
-    
-    # Экспорт счетов
-    for account in user.accounts.all():
-        data['accounts'].append({
-            'id': account.id,
-            'name': account.name,
-            'amount': str(account.amount),
-            'account_type': account.account_type,
-            'description': account.description,
-            'created_at': account.created_at.isoformat(),
-        })
-    
-    # Экспорт транзакций
-    for transaction in user.transactions.all():
-        data['transactions'].append({
-            'id': transaction.id,
-            'name': transaction.name,
-            'amount': str(transaction.amount),
-            'transaction_type': transaction.transaction_type,
-            'category': transaction.category,
-            'date': transaction.date.isoformat(),
-            'account_id': transaction.account_id,
-            'created_at': transaction.created_at.isoformat(),
-        })
-    
-    # Экспорт целей
-    for goal in user.goals.all():
-        data['goals'].append({
-            'id': goal.id,
-            'name': goal.name,
-            'target_amount': str(goal.target_amount),
-            'current_amount': str(goal.current_amount),
-            'created_at': goal.created_at.isoformat(),
-        })
-    
-    # Экспорт категорий бюджета
-    for budget_cat in user.budget_categories.all():
-        data['budget_categories'].append({
-            'id': budget_cat.id,
-            'name': budget_cat.name,
-            'budget': str(budget_cat.budget),
-            'emoji': budget_cat.emoji,
-            'created_at': budget_cat.created_at.isoformat(),
-        })
-    
-    return json.dumps(data, ensure_ascii=False, indent=2)
+    return ''.join(iter_user_data_json(user))
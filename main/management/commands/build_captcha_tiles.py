@@ -0,0 +1,50 @@
+"""
+Сборка фрагментов пазлов капчи из исходных картинок
+"""
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.captcha_utils import (
+    CAPTCHA_SOURCES_DIR, CAPTCHA_TILE_SIZE, CAPTCHA_VARIANTS, build_captcha_tiles, captcha_tiles_dir,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Режет исходные картинки на фрагменты пазла размера отображения в AVIF/WebP/PNG '
+        'с именами из хеша содержимого. Повторный запуск даёт новый набор пазлов'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sources', default=str(CAPTCHA_SOURCES_DIR), help='Каталог исходных картинок')
+        parser.add_argument('--output', default=None, help='Каталог фрагментов (по умолчанию CAPTCHA_TILES_DIR)')
+        parser.add_argument('--variants', type=int, default=CAPTCHA_VARIANTS, help='Пазлов на одну картинку')
+        parser.add_argument('--size', type=int, default=CAPTCHA_TILE_SIZE, help='Сторона фрагмента в пикселях')
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        try:
+            import PIL  # noqa: F401
+        except ImportError:
+            raise CommandError('Для сборки фрагментов нужен Pillow: pip install Pillow')
+        if options['variants'] < 1 or options['size'] < 16:
+            raise CommandError('--variants должен быть положительным, --size — не меньше 16')
+
+        output = Path(options['output'] or captcha_tiles_dir())
+        try:
+            manifest = build_captcha_tiles(
+                options['sources'], output, options['variants'], options['size'], options['seed'],
+            )
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        sizes = {}
+        for puzzle in manifest['puzzles']:
+            for tile in puzzle['tiles']:
+                for extension, name in tile.items():
+                    sizes.setdefault(extension, []).append((output / name).stat().st_size)
+        self.stdout.write(self.style.SUCCESS(
+            f'Собрано пазлов: {len(manifest["puzzles"])} в {output}. Средний размер фрагмента: '
+            + ', '.join(f'{ext} {sum(s) / len(s) / 1024:.1f} КБ' for ext, s in sizes.items())
+        ))
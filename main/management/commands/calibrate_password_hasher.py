@@ -0,0 +1,45 @@
+"""
+Подбор параметров хеширования паролей под целевое время на этом сервере
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from main.password_utils import CALIBRATION_REPEAT, CALIBRATORS, calibrate_password_hasher, current_hash_ms
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет время хеширования пароля текущими настройками и подбирает параметры '
+        'алгоритма (итерации PBKDF2, N для scrypt, проходы Argon2) под целевое время'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target-ms', type=float, default=250, help='Целевое время одного хеша, мс')
+        parser.add_argument(
+            '--algorithm',
+            choices=list(CALIBRATORS),
+            default=None,
+            help='Алгоритм (по умолчанию PASSWORD_HASH_ALGORITHM)',
+        )
+        parser.add_argument('--repeat', type=int, default=CALIBRATION_REPEAT, help='Замеров на каждое значение')
+
+    def handle(self, *args, **options):
+        algorithm = options['algorithm'] or getattr(settings, 'PASSWORD_HASH_ALGORITHM', 'pbkdf2_sha256')
+        if options['target_ms'] <= 0 or options['repeat'] < 1:
+            raise CommandError('--target-ms и --repeat должны быть положительными')
+
+        current_algorithm, current_ms = current_hash_ms(options['repeat'])
+        self.stdout.write(f'Сейчас: {current_algorithm}, {current_ms:.1f} мс на хеш')
+
+        try:
+            params, elapsed = calibrate_password_hasher(algorithm, options['target_ms'], options['repeat'])
+        except ValueError as e:
+            # Например, argon2-cffi не установлен
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{algorithm}: {elapsed:.1f} мс на хеш при цели {options["target_ms"]:.0f} мс. Настройки:'
+        ))
+        self.stdout.write(f"PASSWORD_HASH_ALGORITHM = '{algorithm}'")
+        for name, value in params.items():
+            self.stdout.write(f'{name} = {value}')
@@ -0,0 +1,26 @@
+"""
+Сбор статистики для главной страницы админки (запускается по расписанию, например cron раз в 5 минут)
+"""
+from django.core.management.base import BaseCommand
+
+from main.stats_utils import STATS_DAYS, refresh_admin_stats
+
+
+class Command(BaseCommand):
+    help = 'Собирает статистику админки и сохраняет снимок в AdminStatsSnapshot'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keep',
+            type=int,
+            default=STATS_DAYS,
+            help='Сколько последних снимков хранить',
+        )
+
+    def handle(self, *args, **options):
+        snapshot = refresh_admin_stats(keep=max(1, options['keep']))
+        data = snapshot.data
+        self.stdout.write(self.style.SUCCESS(
+            f'Статистика собрана: пользователей {data["users_count"]}, '
+            f'транзакций {data["transactions_count"]}'
+        ))
@@ -0,0 +1,73 @@
+"""
+Генерация синтетических пользователей с данными для бенчмарков
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.synthetic_utils import (
+    SYNTHETIC_BATCH_SIZE, SYNTHETIC_PASSWORD, SYNTHETIC_PREFIX, SyntheticDataGenerator, delete_synthetic_data,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Создаёт синтетических пользователей со счетами, транзакциями, целями и категориями. '
+        'Например, 1000 пользователей по 1000 транзакций — 1 млн транзакций'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10, help='Число пользователей')
+        parser.add_argument('--accounts', type=int, default=3, help='Счетов на пользователя (до 6)')
+        parser.add_argument('--transactions', type=int, default=1000, help='Транзакций на пользователя')
+        parser.add_argument('--goals', type=int, default=2, help='Целей на пользователя')
+        parser.add_argument('--categories', type=int, default=6, help='Категорий бюджета на пользователя (до 7)')
+        parser.add_argument('--days', type=int, default=365, help='За сколько последних дней распределять транзакции')
+        parser.add_argument('--seed', type=int, default=None, help='Зерно генератора для воспроизводимых данных')
+        parser.add_argument('--prefix', default=SYNTHETIC_PREFIX, help='Префикс имён пользователей')
+        parser.add_argument('--batch-size', type=int, default=SYNTHETIC_BATCH_SIZE)
+        parser.add_argument(
+            '--delete',
+            action='store_true',
+            help='Удалить ранее созданных пользователей с этим префиксом и выйти',
+        )
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if not prefix:
+            raise CommandError('Префикс не может быть пустым')
+
+        if options['delete']:
+            deleted = delete_synthetic_data(prefix)
+            self.stdout.write(self.style.SUCCESS(f'Удалено пользователей: {deleted}'))
+            return
+
+        for name in ('users', 'accounts', 'transactions', 'goals', 'categories', 'batch_size'):
+            if options[name] < 0:
+                raise CommandError(f'--{name.replace("_", "-")} не может быть отрицательным')
+        if options['days'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--days и --batch-size должны быть положительными')
+
+        generator = SyntheticDataGenerator(
+            accounts=options['accounts'],
+            transactions=options['transactions'],
+            goals=options['goals'],
+            categories=options['categories'],
+            days=options['days'],
+            seed=options['seed'],
+            prefix=prefix,
+            batch_size=options['batch_size'],
+        )
+        started = time.monotonic()
+
+        def progress(counts):
+            self.stdout.write(
+                f'Пользователей: {counts["users"]}/{options["users"]}, '
+                f'транзакций: {counts["transactions"]} ({time.monotonic() - started:.1f} с)'
+            )
+
+        counts = generator.generate(options['users'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(
+            'Создано: ' + ', '.join(f'{name} {count}' for name, count in counts.items())
+            + f' за {time.monotonic() - started:.1f} с. Пароль пользователей: {SYNTHETIC_PASSWORD}'
+        ))
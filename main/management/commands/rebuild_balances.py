@@ -0,0 +1,62 @@
+"""
+Пересчёт и проверка сводных балансов пользователей (UserBalance)
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from main.models import UserBalance
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает таблицу UserBalance с нуля или проверяет её актуальность'
+
+    FIELDS = ('total_income', 'total_expense', 'accounts_total', 'transactions_count')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только сравнить сохранённые балансы с исходными таблицами, ничего не меняя',
+        )
+        parser.add_argument(
+            '--user',
+            type=int,
+            action='append',
+            dest='user_ids',
+            help='ID пользователя (можно указать несколько раз)',
+        )
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids']
+
+        if options['verify']:
+            mismatches = self.verify(user_ids)
+            for user_id, field, stored, expected in mismatches:
+                self.stdout.write(
+                    f'user_id={user_id}: {field} = {stored}, ожидалось {expected}'
+                )
+            if mismatches:
+                raise CommandError(f'Найдено расхождений: {len(mismatches)}')
+            self.stdout.write(self.style.SUCCESS('Балансы актуальны'))
+            return
+
+        count = UserBalance.rebuild(user_ids)
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано балансов: {count}'))
+
+    def verify(self, user_ids=None):
+        """Возвращает список расхождений (user_id, поле, сохранено, ожидалось)"""
+        expected = UserBalance.calculate(user_ids)
+        stored_qs = UserBalance.objects.all()
+        if user_ids is not None:
+            stored_qs = stored_qs.filter(user_id__in=user_ids)
+        stored = {row['user_id']: row for row in stored_qs.values('user_id', *self.FIELDS)}
+
+        mismatches = []
+        for user_id in sorted(set(expected) | set(stored)):
+            actual = stored.get(user_id, {})
+            reference = expected.get(user_id, {})
+            for field in self.FIELDS:
+                stored_value = actual.get(field, 0)
+                expected_value = reference.get(field, 0)
+                if stored_value != expected_value:
+                    mismatches.append((user_id, field, stored_value, expected_value))
+        return mismatches
@@ -0,0 +1,63 @@
+"""
+Пересчёт и проверка помесячных итогов по категориям (MonthlyCategoryRollup)
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from main.models import MonthlyCategoryRollup
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает таблицу MonthlyCategoryRollup с нуля или проверяет её актуальность'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только сравнить сохранённые итоги с транзакциями, ничего не меняя',
+        )
+        parser.add_argument(
+            '--user',
+            type=int,
+            action='append',
+            dest='user_ids',
+            help='ID пользователя (можно указать несколько раз)',
+        )
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids']
+
+        if options['verify']:
+            mismatches = self.verify(user_ids)
+            for key, stored, expected in mismatches:
+                user_id, month, category, transaction_type = key
+                self.stdout.write(
+                    f'user_id={user_id} {month:%Y-%m} {category}/{transaction_type}: '
+                    f'{stored}, ожидалось {expected}'
+                )
+            if mismatches:
+                raise CommandError(f'Найдено расхождений: {len(mismatches)}')
+            self.stdout.write(self.style.SUCCESS('Итоги по категориям актуальны'))
+            return
+
+        count = MonthlyCategoryRollup.rebuild(user_ids)
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано строк итогов: {count}'))
+
+    def verify(self, user_ids=None):
+        """Возвращает список расхождений (ключ, сохранено, ожидалось)"""
+        expected = MonthlyCategoryRollup.calculate(user_ids)
+        stored_qs = MonthlyCategoryRollup.objects.all()
+        if user_ids is not None:
+            stored_qs = stored_qs.filter(user_id__in=user_ids)
+        stored = {
+            (row['user_id'], row['month'], row['category'], row['transaction_type']):
+                (row['total'], row['transactions_count'])
+            for row in stored_qs.values(
+                'user_id', 'month', 'category', 'transaction_type', 'total', 'transactions_count'
+            )
+        }
+
+        mismatches = []
+        for key in sorted(set(expected) | set(stored)):
+            if stored.get(key) != expected.get(key):
+                mismatches.append((key, stored.get(key), expected.get(key)))
+        return mismatches
@@ -0,0 +1,108 @@
+"""
+Бенчмарки горячих путей с сравнением с сохранённой базовой линией
+"""
+import json
+import os
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from main.benchmark_utils import (
+    BENCHMARK_REPEAT, BENCHMARK_TOLERANCE, BENCHMARKS, compare_with_baseline, run_benchmarks,
+)
+from main.models import UserBalance
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет время, число SQL запросов и пиковую память страниц и API прогноза, '
+        'импорта/экспорта JSON и SQL бэкапов и сравнивает с базовой линией'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            help='Пользователь, на данных которого выполняются бенчмарки '
+                 '(по умолчанию — с наибольшим числом транзакций)',
+        )
+        parser.add_argument('--repeat', type=int, default=BENCHMARK_REPEAT, help='Число повторов для замера времени')
+        parser.add_argument(
+            '--only',
+            action='append',
+            choices=list(BENCHMARKS),
+            help='Запустить только этот бенчмарк (можно указать несколько раз)',
+        )
+        parser.add_argument(
+            '--baseline',
+            default=os.path.join(settings.BASE_DIR, 'benchmark_baseline.json'),
+            help='Файл базовой линии',
+        )
+        parser.add_argument(
+            '--save-baseline',
+            action='store_true',
+            help='Сохранить результаты как новую базовую линию вместо сравнения',
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=BENCHMARK_TOLERANCE,
+            help='Допустимое относительное ухудшение времени и памяти (0.25 — на 25%%)',
+        )
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat должен быть положительным')
+        user = self.get_user(options['user'])
+        transactions_count = user.transactions.count()
+        self.stdout.write(f'Пользователь {user.username}: транзакций {transactions_count}')
+
+        def progress(name, result):
+            self.stdout.write(
+                f'{name:<36} {result["median_ms"]:>10.1f} мс (мин {result["min_ms"]:.1f}, '
+                f'макс {result["max_ms"]:.1f})  SQL {result["queries"]:>4}  память {result["peak_kb"]:>9.1f} КБ'
+            )
+
+        results = run_benchmarks(user, options['only'], options['repeat'], progress)
+
+        path = options['baseline']
+        if options['save_baseline']:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'created_at': timezone.now().isoformat(),
+                    'user': user.username,
+                    'transactions': transactions_count,
+                    'results': results,
+                }, f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Базовая линия сохранена в {path}'))
+            return
+
+        if not os.path.exists(path):
+            self.stdout.write(f'Базовой линии {path} нет, сохраните её ключом --save-baseline')
+            return
+
+        with open(path, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('transactions') != transactions_count:
+            self.stdout.write(self.style.WARNING(
+                f'Базовая линия снята на {baseline.get("transactions")} транзакциях, '
+                f'сейчас {transactions_count} — сравнение может быть неточным'
+            ))
+        regressions = compare_with_baseline(results, baseline['results'], options['tolerance'])
+        for regression in regressions:
+            self.stdout.write(self.style.ERROR(regression))
+        if regressions:
+            raise CommandError(f'Ухудшений относительно базовой линии: {len(regressions)}')
+        self.stdout.write(self.style.SUCCESS('Ухудшений относительно базовой линии нет'))
+
+    def get_user(self, username):
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f'Пользователь {username} не найден')
+        balance = UserBalance.objects.select_related('user').order_by('-transactions_count').first()
+        if balance is None or not balance.transactions_count:
+            raise CommandError('Нет пользователей с транзакциями: сначала выполните generate_synthetic_data')
+        return balance.user
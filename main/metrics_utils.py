@@ -0,0 +1,204 @@
+"""
+Замеры HTTP запросов: число и время SQL запросов, время ответа и размер.
+
+RequestMetricsMiddleware складывает замеры в буфер процесса. Фоновый
+поток процесса записывает буфер в RequestMetric одной вставкой раз в
+METRICS_FLUSH_INTERVAL секунд или как только набралось METRICS_FLUSH_SIZE
+замеров, поэтому запрос пользователя в БД замеры не пишет. Фоновая запись
+выключается настройкой REQUEST_METRICS_WRITER (в тестах), тогда буфер
+сбрасывается только flush_request_metrics. Страница админки строит по
+замерам перцентили для каждого имени URL.
+"""
+import math
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction as db_transaction
+from django.db.models import Avg, Count, Max, Q
+from django.db.models.functions import Mod
+from django.utils import timezone
+
+from .models import RequestMetric
+
+
+METRICS_FLUSH_SIZE = 50
+METRICS_FLUSH_INTERVAL = 10
+# Если запись не успевает (или выключена), лишние замеры отбрасываются
+METRICS_BUFFER_LIMIT = 10000
+# Перцентили сводки считаются по равномерной выборке не больше этого числа строк
+METRICS_SUMMARY_SAMPLE = 20000
+METRICS_RETENTION = timedelta(days=7)
+METRICS_PRUNE_INTERVAL = 3600
+METRICS_PERIODS = (1, 24, 24 * 7)
+METRICS_PERCENTILES = (50, 95, 99)
+
+_buffer = []
+_lock = threading.Lock()
+_flush_needed = threading.Event()
+_writer = None
+_last_prune = 0.0
+
+
+class QueryCounter:
+    """
+    Обёртка для connection.execute_wrapper: считает SQL запросы
+    и суммарное время их выполнения
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+    @property
+    def duration_ms(self):
+        return self.duration * 1000
+
+
+def server_timing_header(db_queries, db_ms, duration_ms):
+    """Значение заголовка Server-Timing (видно во вкладке Network браузера)"""
+    return (
+        f'db;dur={db_ms:.1f};desc="{db_queries} SQL", '
+        f'total;dur={duration_ms:.1f}'
+    )
+
+
+def record_request_metric(**fields):
+    """Добавляет замер в буфер; в БД его запишет фоновый поток"""
+    with _lock:
+        if len(_buffer) >= METRICS_BUFFER_LIMIT:
+            return
+        _buffer.append(RequestMetric(**fields))
+        full = len(_buffer) >= METRICS_FLUSH_SIZE
+    if getattr(settings, 'REQUEST_METRICS_WRITER', True):
+        _ensure_writer()
+        if full:
+            _flush_needed.set()
+
+
+def _ensure_writer():
+    """Запускает фоновый поток записи (заново — после fork процесса сервера)"""
+    global _writer
+    if _writer is not None and _writer.is_alive():
+        return
+    with _lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = threading.Thread(target=_write_loop, name='request-metrics-writer', daemon=True)
+            _writer.start()
+
+
+def _write_loop():
+    while True:
+        _flush_needed.wait(METRICS_FLUSH_INTERVAL)
+        _flush_needed.clear()
+        try:
+            flush_request_metrics()
+        finally:
+            # У потока своё соединение с БД, между записями оно не держится
+            connection.close()
+
+
+def flush_request_metrics():
+    """Записывает все накопленные замеры в БД. Возвращает их количество"""
+    with _lock:
+        samples = _buffer[:]
+        _buffer.clear()
+    _save_metrics(samples)
+    return len(samples)
+
+
+def _save_metrics(samples):
+    """Вставляет замеры и раз в METRICS_PRUNE_INTERVAL удаляет устаревшие"""
+    global _last_prune
+    if not samples:
+        return
+    try:
+        with db_transaction.atomic():
+            RequestMetric.objects.bulk_create(samples)
+            if time.monotonic() - _last_prune >= METRICS_PRUNE_INTERVAL:
+                _last_prune = time.monotonic()
+                RequestMetric.objects.filter(created_at__lt=timezone.now() - METRICS_RETENTION).delete()
+    except DatabaseError:
+        # Замеры не должны ломать работу сервера — при ошибке БД они теряются
+        pass
+
+
+def percentile(values, percent):
+    """Перцентиль по методу ближайшего ранга; values должны быть отсортированы"""
+    if not values:
+        return None
+    rank = math.ceil(len(values) * percent / 100)
+    return values[min(max(rank, 1), len(values)) - 1]
+
+
+def request_metrics_summary(hours=24, now=None):
+    """
+    Сводка по именам URL за последние hours часов: число запросов,
+    перцентили времени ответа, времени в БД, числа SQL запросов и размера ответа.
+    Отсортирована по p95 времени ответа, самые медленные сверху.
+
+    Число запросов, ошибки, максимумы и среднее считаются в БД. Для
+    перцентилей строки не загружаются целиком: берётся каждая k-я по id,
+    чтобы выборка была не больше METRICS_SUMMARY_SAMPLE строк.
+    """
+    now = now or timezone.now()
+    metrics = RequestMetric.objects.filter(created_at__gte=now - timedelta(hours=hours)).order_by()
+    totals = {
+        row['view_name']: row
+        for row in metrics.values('view_name').annotate(
+            count=Count('id'),
+            errors=Count('id', filter=Q(status_code__gte=500)),
+            max_ms=Max('duration_ms'),
+            avg_queries=Avg('db_queries'),
+            max_queries=Max('db_queries'),
+        )
+    }
+    total = sum(row['count'] for row in totals.values())
+    step = max(1, math.ceil(total / METRICS_SUMMARY_SAMPLE))
+    sample = metrics
+    if step > 1:
+        sample = metrics.annotate(sample_bucket=Mod('id', step)).filter(sample_bucket=0)
+
+    grouped = {}
+    rows = sample.values_list('view_name', 'duration_ms', 'db_ms', 'db_queries', 'response_bytes')
+    for view_name, duration_ms, db_ms, db_queries, response_bytes in rows.iterator():
+        group = grouped.setdefault(view_name, {'duration': [], 'db': [], 'queries': [], 'bytes': []})
+        group['duration'].append(duration_ms)
+        group['db'].append(db_ms)
+        group['queries'].append(db_queries)
+        if response_bytes is not None:
+            group['bytes'].append(response_bytes)
+
+    summary = []
+    for view_name, totals_row in totals.items():
+        group = grouped.get(view_name, {'duration': [], 'db': [], 'queries': [], 'bytes': []})
+        for values in group.values():
+            values.sort()
+        row = {
+            'view_name': view_name,
+            'count': totals_row['count'],
+            'errors': totals_row['errors'],
+            'max_ms': totals_row['max_ms'],
+            'avg_queries': round(totals_row['avg_queries'], 1),
+            'max_queries': totals_row['max_queries'],
+        }
+        for percent in METRICS_PERCENTILES:
+            row[f'p{percent}_ms'] = percentile(group['duration'], percent)
+            row[f'db_p{percent}_ms'] = percentile(group['db'], percent)
+        row['p95_queries'] = percentile(group['queries'], 95)
+        row['p50_bytes'] = percentile(group['bytes'], 50)
+        row['p95_bytes'] = percentile(group['bytes'], 95)
+        summary.append(row)
+
+    # Редкие URL могут не попасть в выборку: у них нет перцентилей
+    summary.sort(key=lambda row: row['p95_ms'] if row['p95_ms'] is not None else row['max_ms'], reverse=True)
+    return summary
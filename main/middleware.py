@@ -0,0 +1,70 @@
+"""
+Middleware приложения main
+"""
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .metrics_utils import QueryCounter, record_request_metric, server_timing_header
+from .prometheus_utils import DB_DURATION, DB_QUERIES, HTTP_REQUEST_DURATION, HTTP_REQUESTS
+
+
+# Остальные методы считаются вместе, чтобы не плодить значения меток
+HTTP_METHODS = ('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS')
+
+
+def _shows_server_timing(request):
+    """Server-Timing раскрывает число и время SQL запросов, поэтому по умолчанию — только сотрудникам"""
+    if getattr(settings, 'SERVER_TIMING_PUBLIC', False):
+        return True
+    user = getattr(request, 'user', None)
+    return user is not None and user.is_authenticated and user.is_staff
+
+
+class RequestMetricsMiddleware:
+    """
+    Замеряет каждый запрос: число SQL запросов и время в БД, общее время
+    ответа и размер тела. Добавляет заголовок Server-Timing (сотрудникам
+    или всем при SERVER_TIMING_PUBLIC), сохраняет
+    замер под именем URL (например forecast:api_transactions) для страницы
+    /admin/request-metrics/ и обновляет метрики Prometheus для /metrics.
+
+    Стоит первым в MIDDLEWARE, чтобы учитывать запросы сессий и аутентификации.
+    Для потоковых ответов время измеряется до начала отдачи тела, размер неизвестен.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        created_at = timezone.now()
+        started = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            response = self.get_response(request)
+        duration_ms = (time.perf_counter() - started) * 1000
+
+        if _shows_server_timing(request):
+            response['Server-Timing'] = server_timing_header(counter.count, counter.duration_ms, duration_ms)
+
+        match = getattr(request, 'resolver_match', None)
+        view_name = (match.view_name if match else None) or 'unresolved'
+        method = request.method if request.method in HTTP_METHODS else 'OTHER'
+        HTTP_REQUESTS.inc(view=view_name, method=method, status=response.status_code)
+        HTTP_REQUEST_DURATION.observe(duration_ms / 1000, view=view_name)
+        DB_QUERIES.observe(counter.count, view=view_name)
+        DB_DURATION.observe(counter.duration, view=view_name)
+
+        record_request_metric(
+            view_name=view_name,
+            method=method,
+            status_code=response.status_code,
+            duration_ms=round(duration_ms, 3),
+            db_ms=round(counter.duration_ms, 3),
+            db_queries=counter.count,
+            response_bytes=None if response.streaming else len(response.content),
+            created_at=created_at,
+        )
+        return response
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.8 on 2025-12-12 14:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def populate_balances(apps, schema_editor):
+    """Заполняем балансы для уже существующих пользователей"""
+    Transaction = apps.get_model('main', 'Transaction')
+    Account = apps.get_model('main', 'Account')
+    UserBalance = apps.get_model('main', 'UserBalance')
+
+    balances = {}
+    for row in Transaction.objects.order_by().values('user_id').annotate(
+        income=Sum('amount', filter=Q(transaction_type='income')),
+        expense=Sum('amount', filter=Q(transaction_type='expense')),
+        count=Count('id'),
+    ):
+        balances[row['user_id']] = UserBalance(
+            user_id=row['user_id'],
+            total_income=row['income'] or 0,
+            total_expense=row['expense'] or 0,
+            transactions_count=row['count'],
+        )
+    for row in Account.objects.order_by().values('user_id').annotate(total=Sum('amount')):
+        balance = balances.setdefault(row['user_id'], UserBalance(user_id=row['user_id']))
+        balance.accounts_total = row['total'] or 0
+
+    UserBalance.objects.bulk_create(balances.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0008_userprofile_blocked_at_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_income', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Всего доходов')),
+                ('total_expense', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Всего расходов')),
+                ('accounts_total', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Сумма по счетам')),
+                ('transactions_count', models.IntegerField(default=0, verbose_name='Количество транзакций')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='balance', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Баланс пользователя',
+                'verbose_name_plural': 'Балансы пользователей',
+            },
+        ),
+        migrations.RunPython(populate_balances, migrations.RunPython.noop),
+    ]
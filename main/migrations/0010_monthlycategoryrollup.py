@@ -0,0 +1,63 @@
+# Generated by Django 5.2.8 on 2025-12-12 15:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+
+
+def populate_rollups(apps, schema_editor):
+    """Заполняем помесячные итоги по уже существующим транзакциям"""
+    Transaction = apps.get_model('main', 'Transaction')
+    MonthlyCategoryRollup = apps.get_model('main', 'MonthlyCategoryRollup')
+
+    rows = (
+        Transaction.objects.order_by()
+        .annotate(month=TruncMonth('date', output_field=models.DateField()))
+        .values('user_id', 'month', 'category', 'transaction_type')
+        .annotate(total=Sum('amount'), count=Count('id'))
+    )
+    MonthlyCategoryRollup.objects.bulk_create([
+        MonthlyCategoryRollup(
+            user_id=row['user_id'],
+            month=row['month'],
+            category=row['category'],
+            transaction_type=row['transaction_type'],
+            total=row['total'],
+            transactions_count=row['count'],
+        )
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_userbalance'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyCategoryRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(verbose_name='Месяц (первое число)')),
+                ('category', models.CharField(max_length=50, verbose_name='Категория')),
+                ('transaction_type', models.CharField(choices=[('income', 'Доход'), ('expense', 'Расход')], max_length=20, verbose_name='Тип')),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Сумма')),
+                ('transactions_count', models.IntegerField(default=0, verbose_name='Количество транзакций')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_rollups', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Итог месяца по категории',
+                'verbose_name_plural': 'Итоги месяцев по категориям',
+                'ordering': ['-month', 'category'],
+                'indexes': [models.Index(fields=['user', '-month'], name='main_monthl_user_id_8f606a_idx')],
+                'unique_together': {('user', 'month', 'category', 'transaction_type')},
+            },
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
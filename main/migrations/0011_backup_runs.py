@@ -0,0 +1,60 @@
+# Generated by Django 5.2.8 on 2026-10-17 03:36
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_monthlycategoryrollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BackupRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('full', 'Полный'), ('incremental', 'Инкрементальный')], max_length=20, verbose_name='Тип')),
+                ('since', models.DateTimeField(blank=True, null=True, verbose_name='Изменения начиная с')),
+                ('watermark', models.DateTimeField(verbose_name='Водяной знак (начало выгрузки)')),
+                ('rows_count', models.IntegerField(default=0, verbose_name='Строк выгружено')),
+                ('tombstones_count', models.IntegerField(default=0, verbose_name='Удалений выгружено')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+            ],
+            options={
+                'verbose_name': 'Запуск бэкапа',
+                'verbose_name_plural': 'Запуски бэкапов',
+                'ordering': ['-watermark'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DeletedRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table', models.CharField(max_length=64, verbose_name='Таблица')),
+                ('object_id', models.BigIntegerField(verbose_name='ID строки')),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата удаления')),
+            ],
+            options={
+                'verbose_name': 'Удалённая запись',
+                'verbose_name_plural': 'Удалённые записи',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['updated_at'], name='main_transa_updated_61541e_idx'),
+        ),
+        migrations.AddField(
+            model_name='backuprun',
+            name='base',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='increments', to='main.backuprun', verbose_name='Предыдущий бэкап в цепочке'),
+        ),
+        migrations.AddIndex(
+            model_name='deletedrecord',
+            index=models.Index(fields=['deleted_at'], name='main_delete_deleted_e9cbb5_idx'),
+        ),
+    ]
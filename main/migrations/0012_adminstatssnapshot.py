@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-17 03:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0011_backup_runs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdminStatsSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.JSONField(verbose_name='Данные')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата сбора')),
+            ],
+            options={
+                'verbose_name': 'Снимок статистики',
+                'verbose_name_plural': 'Снимки статистики',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
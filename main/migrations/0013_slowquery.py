@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-17 03:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0012_adminstatssnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('query_hash', models.CharField(max_length=32, unique=True, verbose_name='Хеш запроса')),
+                ('query', models.TextField(verbose_name='Запрос')),
+                ('calls', models.IntegerField(default=0, verbose_name='Выполнений')),
+                ('total_ms', models.FloatField(default=0, verbose_name='Суммарное время, мс')),
+                ('max_ms', models.FloatField(default=0, verbose_name='Максимальное время, мс')),
+                ('last_ms', models.FloatField(default=0, verbose_name='Последнее время, мс')),
+                ('last_run_at', models.DateTimeField(auto_now=True, verbose_name='Последний запуск')),
+            ],
+            options={
+                'verbose_name': 'Медленный запрос',
+                'verbose_name_plural': 'Медленные запросы',
+                'ordering': ['-max_ms'],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-17 03:45
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0013_slowquery'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestMetric',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('view_name', models.CharField(max_length=200, verbose_name='Имя URL')),
+                ('method', models.CharField(max_length=10, verbose_name='Метод')),
+                ('status_code', models.PositiveSmallIntegerField(verbose_name='Код ответа')),
+                ('duration_ms', models.FloatField(verbose_name='Время ответа, мс')),
+                ('db_ms', models.FloatField(verbose_name='Время в БД, мс')),
+                ('db_queries', models.IntegerField(verbose_name='SQL запросов')),
+                ('response_bytes', models.IntegerField(blank=True, null=True, verbose_name='Размер ответа, байт')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Время запроса')),
+            ],
+            options={
+                'verbose_name': 'Замер запроса',
+                'verbose_name_plural': 'Замеры запросов',
+                'indexes': [models.Index(fields=['created_at'], name='main_reques_created_2191c7_idx')],
+            },
+        ),
+    ]
@@ -1,13 +1,44 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator
-from django.db.models.signals import post_save
+from django.db.models import Case, Count, DecimalField, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncMonth
+from django.db import IntegrityError, connections, transaction as db_transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver
 from decimal import Decimal
 from django.utils import timezone
 
 
-class Account(models.Model):
+class LoadedValuesMixin:
+    """
+    Запоминает значения полей LOADED_FIELDS, прочитанные из БД или
+    сохранённые последними, — сигналы вычитают их из баланса и итогов
+    без дополнительного SELECT перед сохранением
+    """
+    LOADED_FIELDS = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_loaded_values()
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self.remember_loaded_values()
+
+    def remember_loaded_values(self, saved=False):
+        # Отложенные поля (only/defer) не загружены и не запоминаются
+        values = {name: getattr(self, name) for name in self.LOADED_FIELDS if name in self.__dict__}
+        if saved:
+            # После save() в полях могут остаться исходные значения (float, строка),
+            # из БД они прочитались бы уже приведёнными к типу поля
+            values = {name: self._meta.get_field(name).to_python(value) for name, value in values.items()}
+        self._loaded_values = values
+
+
+class Account(LoadedValuesMixin, models.Model):
     """Модель счёта"""
     ACCOUNT_TYPES = [
         ('deposit', 'Вклад'),
@@ -44,6 +75,9 @@ class Account(models.Model):
     description = models.TextField(blank=True, default='', verbose_name='Описание')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания', db_index=True)
     updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
+
+    # Поля, от которых зависит UserBalance
+    LOADED_FIELDS = ('user_id', 'amount')
     
     class Meta:
         verbose_name = 'Счет'
@@ -60,7 +94,7 @@ class Account(models.Model):
         return f"{self.amount:,.0f}".replace(',', ' ')
 
 
-class Transaction(models.Model):
+class Transaction(LoadedValuesMixin, models.Model):
     """Модель транзакции"""
     TRANSACTION_TYPES = [
         ('income', 'Доход'),
@@ -116,6 +150,9 @@ class Transaction(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
+
+    # Поля, от которых зависят UserBalance и MonthlyCategoryRollup
+    LOADED_FIELDS = ('user_id', 'amount', 'transaction_type', 'category', 'date')
     
     class Meta:
         verbose_name = 'Транзакция'
@@ -124,12 +161,63 @@ class Transaction(models.Model):
         indexes = [
             models.Index(fields=['user', '-date']),
             models.Index(fields=['user', 'transaction_type', '-date']),
+            models.Index(fields=['updated_at']),
         ]
     
     def __str__(self):
         return f'{self.name} - {self.amount}₽ ({self.date.strftime("%d.%m.%Y")})'
 
 
+MONEY_FIELD = DecimalField(max_digits=15, decimal_places=2)
+
+
+def free_money_expression():
+    """Выражение «доходы − расходы» для агрегации по транзакциям"""
+    return Case(
+        When(transaction_type='income', then=F('amount')),
+        When(transaction_type='expense', then=-F('amount')),
+        default=Value(Decimal('0')),
+        output_field=MONEY_FIELD,
+    )
+
+
+class GoalQuerySet(models.QuerySet):
+    """QuerySet целей с расчётом прогресса на стороне БД"""
+
+    def with_progress(self):
+        """
+        Аннотирует цели свободными средствами владельца (из UserBalance) и
+        суммой по подключённым счетам. Обе суммы считаются коррелированными
+        подзапросами в одном SQL запросе, без загрузки транзакций в Python.
+        """
+        free_money = (
+            UserBalance.objects
+            .filter(user=OuterRef('user'))
+            .annotate(total=F('total_income') - F('total_expense'))
+            .values('total')
+        )
+        linked_sum = (
+            Account.objects
+            .filter(linked_goals=OuterRef('pk'))
+            .order_by()
+            .values('linked_goals')
+            .annotate(total=Sum('amount'))
+            .values('total')
+        )
+        return self.annotate(
+            free_money_total=Coalesce(
+                Subquery(free_money, output_field=MONEY_FIELD),
+                Value(Decimal('0')),
+                output_field=MONEY_FIELD,
+            ),
+            linked_accounts_total=Coalesce(
+                Subquery(linked_sum, output_field=MONEY_FIELD),
+                Value(Decimal('0')),
+                output_field=MONEY_FIELD,
+            ),
+        )
+
+
 class Goal(models.Model):
     """Модель финансовой цели — РАСШИРЕННАЯ ВЕРСИЯ"""
     user = models.ForeignKey(
@@ -166,6 +254,8 @@ class Goal(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+    objects = GoalQuerySet.as_manager()
     
     class Meta:
         verbose_name = 'Финансовая цель'
@@ -184,23 +274,29 @@ class Goal(models.Model):
 
     @property
     def calculated_amount(self):
-        """Автоматический расчёт накопленного — ТОЧНО как в твоём forecast!"""
-        from decimal import Decimal
-        
-        # Общие свободные средства (доходы − расходы)
-        free_money = Decimal('0')
-        user_transactions = self.user.transactions.all()
-        income = sum(t.amount for t in user_transactions if t.transaction_type == 'income')
-        expense = sum(t.amount for t in user_transactions if t.transaction_type == 'expense')
-        free_money = income - expense
+        """Автоматический расчёт накопленного — ТОЧНО как в твоём forecast!
 
-        # Сумма по подключённым счетам
-        linked_sum = sum(acc.amount for acc in self.linked_accounts.all())
+        Если цель получена через Goal.objects.with_progress(), используются
+        готовые аннотации, иначе суммы читаются из UserBalance и агрегатом
+        по подключённым счетам.
+        """
+        linked_sum = getattr(self, 'linked_accounts_total', None)
+        if linked_sum is None:
+            # Сумма по подключённым счетам
+            linked_sum = self.linked_accounts.aggregate(
+                total=Sum('amount')
+            )['total'] or Decimal('0')
 
         if self.use_only_linked_accounts:
             return linked_sum
-        else:
-            return free_money + linked_sum
+
+        # Общие свободные средства (доходы − расходы)
+        free_money = getattr(self, 'free_money_total', None)
+        if free_money is None:
+            balance = UserBalance.objects.filter(user_id=self.user_id).first()
+            free_money = balance.free_money if balance else Decimal('0')
+
+        return free_money + linked_sum
 
 
 class BudgetCategory(models.Model):
@@ -292,6 +388,463 @@ class UserProfile(models.Model):
         return super().save(*args, **kwargs)
 
 
+class UserBalance(models.Model):
+    """Сводный баланс пользователя, обновляемый инкрементально сигналами"""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        related_name='balance',
+        verbose_name='Пользователь'
+    )
+    total_income = models.DecimalField(max_digits=15, decimal_places=2, default=0, verbose_name='Всего доходов')
+    total_expense = models.DecimalField(max_digits=15, decimal_places=2, default=0, verbose_name='Всего расходов')
+    accounts_total = models.DecimalField(max_digits=15, decimal_places=2, default=0, verbose_name='Сумма по счетам')
+    transactions_count = models.IntegerField(default=0, verbose_name='Количество транзакций')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
+
+    class Meta:
+        verbose_name = 'Баланс пользователя'
+        verbose_name_plural = 'Балансы пользователей'
+
+    def __str__(self):
+        return f'{self.user.username}: {self.free_money}₽'
+
+    @property
+    def free_money(self):
+        """Свободные средства: доходы − расходы"""
+        return self.total_income - self.total_expense
+
+    @classmethod
+    def apply_delta(cls, user_id, income=0, expense=0, accounts=0, count=0, create_missing=True):
+        """
+        Атомарно изменяет баланс пользователя через F-выражения.
+
+        Если строки баланса ещё нет, она пересчитывается с нуля
+        (create_missing=False используется при удалении, чтобы не создавать
+        баланс для пользователя, который удаляется каскадом).
+        """
+        updated = cls.objects.filter(user_id=user_id).update(
+            total_income=F('total_income') + income,
+            total_expense=F('total_expense') + expense,
+            accounts_total=F('accounts_total') + accounts,
+            transactions_count=F('transactions_count') + count,
+            updated_at=timezone.now(),
+        )
+        if not updated and create_missing:
+            cls.rebuild(user_ids=[user_id])
+
+    @classmethod
+    def calculate(cls, user_ids=None):
+        """
+        Считает эталонные балансы по исходным таблицам двумя
+        сгруппированными запросами. Возвращает {user_id: {поле: значение}}.
+        """
+        transactions = Transaction.objects.order_by()
+        accounts = Account.objects.order_by()
+        if user_ids is not None:
+            transactions = transactions.filter(user_id__in=user_ids)
+            accounts = accounts.filter(user_id__in=user_ids)
+
+        balances = {}
+
+        def empty():
+            return {
+                'total_income': Decimal('0'),
+                'total_expense': Decimal('0'),
+                'accounts_total': Decimal('0'),
+                'transactions_count': 0,
+            }
+
+        for row in transactions.values('user_id').annotate(
+            income=Sum('amount', filter=Q(transaction_type='income')),
+            expense=Sum('amount', filter=Q(transaction_type='expense')),
+            count=Count('id'),
+        ):
+            balance = balances.setdefault(row['user_id'], empty())
+            balance['total_income'] = row['income'] or Decimal('0')
+            balance['total_expense'] = row['expense'] or Decimal('0')
+            balance['transactions_count'] = row['count']
+
+        for row in accounts.values('user_id').annotate(total=Sum('amount')):
+            balance = balances.setdefault(row['user_id'], empty())
+            balance['accounts_total'] = row['total'] or Decimal('0')
+
+        return balances
+
+    @classmethod
+    def rebuild(cls, user_ids=None):
+        """Пересчитывает балансы с нуля. Возвращает количество строк"""
+        balances = cls.calculate(user_ids)
+        stale = cls.objects.all()
+        if user_ids is not None:
+            stale = stale.filter(user_id__in=user_ids)
+        stale.exclude(user_id__in=balances.keys()).delete()
+
+        for user_id, values in balances.items():
+            cls.objects.update_or_create(user_id=user_id, defaults=values)
+        return len(balances)
+
+
+class MonthlyCategoryRollup(models.Model):
+    """Помесячные суммы транзакций по категориям, обновляемые сигналами"""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='monthly_rollups',
+        verbose_name='Пользователь'
+    )
+    month = models.DateField(verbose_name='Месяц (первое число)')
+    category = models.CharField(max_length=50, verbose_name='Категория')
+    transaction_type = models.CharField(
+        max_length=20,
+        choices=Transaction.TRANSACTION_TYPES,
+        verbose_name='Тип'
+    )
+    total = models.DecimalField(max_digits=15, decimal_places=2, default=0, verbose_name='Сумма')
+    transactions_count = models.IntegerField(default=0, verbose_name='Количество транзакций')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
+
+    class Meta:
+        verbose_name = 'Итог месяца по категории'
+        verbose_name_plural = 'Итоги месяцев по категориям'
+        ordering = ['-month', 'category']
+        indexes = [
+            models.Index(fields=['user', '-month']),
+        ]
+        unique_together = [['user', 'month', 'category', 'transaction_type']]
+
+    def __str__(self):
+        return f'{self.month:%Y-%m} {self.category} ({self.transaction_type}): {self.total}₽'
+
+    @staticmethod
+    def month_of(date):
+        """Первое число месяца транзакции в локальной временной зоне"""
+        if timezone.is_aware(date):
+            date = timezone.localtime(date)
+        return date.date().replace(day=1)
+
+    @classmethod
+    def apply_delta(cls, user_id, month, category, transaction_type, amount, count):
+        """Атомарно изменяет итог месяца через F-выражения, создавая строку при необходимости"""
+        lookup = {
+            'user_id': user_id,
+            'month': month,
+            'category': category,
+            'transaction_type': transaction_type,
+        }
+        updated = cls.objects.filter(**lookup).update(
+            total=F('total') + amount,
+            transactions_count=F('transactions_count') + count,
+            updated_at=timezone.now(),
+        )
+        if not updated and count > 0:
+            try:
+                with db_transaction.atomic():
+                    cls.objects.create(total=amount, transactions_count=count, **lookup)
+            except IntegrityError:
+                # Строку успел создать параллельный запрос
+                cls.objects.filter(**lookup).update(
+                    total=F('total') + amount,
+                    transactions_count=F('transactions_count') + count,
+                )
+        elif count < 0:
+            # Пустые месяцы не храним
+            cls.objects.filter(transactions_count__lte=0, **lookup).delete()
+
+    @classmethod
+    def calculate(cls, user_ids=None):
+        """
+        Считает итоги по исходным транзакциям одним сгруппированным
+        запросом. Возвращает {(user_id, month, category, type): (total, count)}.
+        """
+        transactions = Transaction.objects.order_by()
+        if user_ids is not None:
+            transactions = transactions.filter(user_id__in=user_ids)
+
+        rows = (
+            transactions
+            .annotate(month=TruncMonth('date', output_field=models.DateField()))
+            .values('user_id', 'month', 'category', 'transaction_type')
+            .annotate(total=Sum('amount'), count=Count('id'))
+        )
+        return {
+            (row['user_id'], row['month'], row['category'], row['transaction_type']):
+                (row['total'], row['count'])
+            for row in rows
+        }
+
+    @classmethod
+    def rebuild(cls, user_ids=None):
+        """Пересчитывает итоги с нуля. Возвращает количество строк"""
+        rollups = cls.calculate(user_ids)
+        with db_transaction.atomic():
+            stale = cls.objects.all()
+            if user_ids is not None:
+                stale = stale.filter(user_id__in=user_ids)
+            stale.delete()
+            cls.objects.bulk_create([
+                cls(
+                    user_id=user_id,
+                    month=month,
+                    category=category,
+                    transaction_type=transaction_type,
+                    total=total,
+                    transactions_count=count,
+                )
+                for (user_id, month, category, transaction_type), (total, count) in rollups.items()
+            ], batch_size=1000)
+        return len(rollups)
+
+
+class BackupRun(models.Model):
+    """Выполненный бэкап и его водяной знак для следующего инкрементального"""
+    KIND_CHOICES = [
+        ('full', 'Полный'),
+        ('incremental', 'Инкрементальный'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, verbose_name='Тип')
+    base = models.ForeignKey(
+        'self',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='increments',
+        verbose_name='Предыдущий бэкап в цепочке'
+    )
+    since = models.DateTimeField(null=True, blank=True, verbose_name='Изменения начиная с')
+    watermark = models.DateTimeField(verbose_name='Водяной знак (начало выгрузки)')
+    rows_count = models.IntegerField(default=0, verbose_name='Строк выгружено')
+    tombstones_count = models.IntegerField(default=0, verbose_name='Удалений выгружено')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+
+    class Meta:
+        verbose_name = 'Запуск бэкапа'
+        verbose_name_plural = 'Запуски бэкапов'
+        ordering = ['-watermark']
+
+    def __str__(self):
+        return f'{self.get_kind_display()} бэкап от {self.watermark:%d.%m.%Y %H:%M}'
+
+
+class DeletedRecord(models.Model):
+    """Надгробие удалённой строки для инкрементальных бэкапов"""
+    table = models.CharField(max_length=64, verbose_name='Таблица')
+    object_id = models.BigIntegerField(verbose_name='ID строки')
+    deleted_at = models.DateTimeField(default=timezone.now, verbose_name='Дата удаления')
+
+    class Meta:
+        verbose_name = 'Удалённая запись'
+        verbose_name_plural = 'Удалённые записи'
+        indexes = [
+            models.Index(fields=['deleted_at']),
+        ]
+
+    def __str__(self):
+        return f'{self.table}#{self.object_id}'
+
+
+class AdminStatsSnapshot(models.Model):
+    """Статистика для главной страницы админки, собранная командой collect_admin_stats"""
+    data = models.JSONField(verbose_name='Данные')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата сбора')
+
+    class Meta:
+        verbose_name = 'Снимок статистики'
+        verbose_name_plural = 'Снимки статистики'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f'Статистика от {self.created_at:%d.%m.%Y %H:%M}'
+
+
+class SlowQuery(models.Model):
+    """Запрос из SQL панели и статистика его времени выполнения"""
+    query_hash = models.CharField(max_length=32, unique=True, verbose_name='Хеш запроса')
+    query = models.TextField(verbose_name='Запрос')
+    calls = models.IntegerField(default=0, verbose_name='Выполнений')
+    total_ms = models.FloatField(default=0, verbose_name='Суммарное время, мс')
+    max_ms = models.FloatField(default=0, verbose_name='Максимальное время, мс')
+    last_ms = models.FloatField(default=0, verbose_name='Последнее время, мс')
+    last_run_at = models.DateTimeField(auto_now=True, verbose_name='Последний запуск')
+
+    class Meta:
+        verbose_name = 'Медленный запрос'
+        verbose_name_plural = 'Медленные запросы'
+        ordering = ['-max_ms']
+
+    def __str__(self):
+        return f'{self.max_ms:.0f} мс: {self.query[:60]}'
+
+    @property
+    def avg_ms(self):
+        """Среднее время выполнения"""
+        return self.total_ms / self.calls if self.calls else 0
+
+
+def _merge_balance_deltas(*deltas):
+    """Складывает изменения по ключу (пользователь или строка итогов): [(key, {...}), ...]"""
+    merged = {}
+    for user_id, delta in deltas:
+        target = merged.setdefault(user_id, {})
+        for key, value in delta.items():
+            target[key] = target.get(key, 0) + value
+    return merged
+
+
+def _transaction_balance_delta(transaction_type, amount, sign=1):
+    """Вклад одной транзакции в UserBalance"""
+    amount = Decimal(str(amount))
+    return {
+        'income': sign * amount if transaction_type == 'income' else 0,
+        'expense': sign * amount if transaction_type == 'expense' else 0,
+        'count': sign,
+    }
+
+
+@receiver(pre_save, sender=Transaction)
+@receiver(pre_save, sender=Account)
+def remember_previous_values(sender, instance, **kwargs):
+    """Запоминаем сохранённое состояние строки, чтобы вычесть его из баланса"""
+    instance._previous_values = None
+    if instance.pk and not instance._state.adding:
+        previous = dict(getattr(instance, '_loaded_values', {}))
+        missing = [name for name in sender.LOADED_FIELDS if name not in previous]
+        if missing:
+            # Поля, отложенные через only/defer, дочитываем из БД
+            stored = sender.objects.filter(pk=instance.pk).values(*missing).first()
+            previous = None if stored is None else dict(previous, **stored)
+        instance._previous_values = previous
+
+
+@receiver(post_save, sender=Transaction)
+def update_balance_on_transaction_save(sender, instance, created, **kwargs):
+    """Инкрементально обновляем баланс при создании/изменении транзакции"""
+    deltas = [(instance.user_id, _transaction_balance_delta(instance.transaction_type, instance.amount))]
+    previous = getattr(instance, '_previous_values', None)
+    if previous:
+        deltas.append((previous['user_id'], _transaction_balance_delta(
+            previous['transaction_type'], previous['amount'], sign=-1
+        )))
+    for user_id, delta in _merge_balance_deltas(*deltas).items():
+        UserBalance.apply_delta(user_id, **delta)
+
+
+def _deleted_with_user(kwargs):
+    """Строка удаляется каскадом вместе с пользователем (user.delete() или queryset пользователей)"""
+    origin = kwargs.get('origin')
+    return isinstance(origin, User) or getattr(origin, 'model', None) is User
+
+
+@receiver(post_delete, sender=Transaction)
+def update_balance_on_transaction_delete(sender, instance, **kwargs):
+    """Вычитаем удалённую транзакцию из баланса"""
+    # Баланс удаляется в том же каскаде, пересчитывать его незачем
+    if _deleted_with_user(kwargs):
+        return
+    UserBalance.apply_delta(
+        instance.user_id,
+        create_missing=False,
+        **_transaction_balance_delta(instance.transaction_type, instance.amount, sign=-1)
+    )
+
+
+def _rollup_delta(user_id, date, category, transaction_type, amount, sign=1):
+    """Ключ строки MonthlyCategoryRollup и вклад в неё одной транзакции"""
+    key = (user_id, MonthlyCategoryRollup.month_of(date), category, transaction_type)
+    return key, {'amount': sign * Decimal(str(amount)), 'count': sign}
+
+
+@receiver(post_save, sender=Transaction)
+def update_rollup_on_transaction_save(sender, instance, created, **kwargs):
+    """Переносим транзакцию между помесячными итогами при создании/изменении"""
+    deltas = [_rollup_delta(
+        instance.user_id, instance.date, instance.category, instance.transaction_type, instance.amount
+    )]
+    previous = getattr(instance, '_previous_values', None)
+    if previous:
+        deltas.append(_rollup_delta(
+            previous['user_id'], previous['date'], previous['category'],
+            previous['transaction_type'], previous['amount'], sign=-1
+        ))
+    for key, delta in _merge_balance_deltas(*deltas).items():
+        if delta['count'] or delta['amount']:
+            MonthlyCategoryRollup.apply_delta(*key, **delta)
+
+
+@receiver(post_delete, sender=Transaction)
+def update_rollup_on_transaction_delete(sender, instance, **kwargs):
+    """Вычитаем удалённую транзакцию из итогов месяца"""
+    # Итоги пользователя удаляются в том же каскаде
+    if _deleted_with_user(kwargs):
+        return
+    key, delta = _rollup_delta(
+        instance.user_id, instance.date, instance.category, instance.transaction_type,
+        instance.amount, sign=-1
+    )
+    MonthlyCategoryRollup.apply_delta(*key, **delta)
+
+
+@receiver(post_save, sender=Account)
+def update_balance_on_account_save(sender, instance, created, **kwargs):
+    """Инкрементально обновляем сумму по счетам"""
+    deltas = [(instance.user_id, {'accounts': Decimal(str(instance.amount))})]
+    previous = getattr(instance, '_previous_values', None)
+    if previous:
+        deltas.append((previous['user_id'], {'accounts': -previous['amount']}))
+    for user_id, delta in _merge_balance_deltas(*deltas).items():
+        UserBalance.apply_delta(user_id, **delta)
+
+
+@receiver(post_save, sender=Transaction)
+@receiver(post_save, sender=Account)
+def remember_saved_values(sender, instance, **kwargs):
+    """Сохранённые значения — предыдущие для следующего сохранения объекта"""
+    # Подключён после сигналов баланса и итогов, которые читают _previous_values
+    instance.remember_loaded_values(saved=True)
+
+
+@receiver(post_delete, sender=Account)
+def update_balance_on_account_delete(sender, instance, **kwargs):
+    """Вычитаем удалённый счёт из суммы по счетам"""
+    if _deleted_with_user(kwargs):
+        return
+    UserBalance.apply_delta(instance.user_id, accounts=-Decimal(str(instance.amount)), create_missing=False)
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=UserProfile)
+@receiver(post_delete, sender=Account)
+@receiver(post_delete, sender=Transaction)
+@receiver(post_delete, sender=Goal)
+@receiver(post_delete, sender=BudgetCategory)
+def record_deleted_row(sender, instance, **kwargs):
+    """Запоминаем удаление строки, чтобы перенести его в инкрементальный бэкап"""
+    # Строки, удаляемые каскадом вместе с пользователем, записывает record_deleted_user_rows
+    if sender is not User and _deleted_with_user(kwargs):
+        return
+    DeletedRecord.objects.create(table=sender._meta.db_table, object_id=instance.pk)
+
+
+@receiver(pre_delete, sender=User)
+def record_deleted_user_rows(sender, instance, using, **kwargs):
+    """Надгробия строк пользователя: один INSERT ... SELECT на таблицу вместо INSERT на каждую строку"""
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    tombstones = DeletedRecord._meta
+    columns = ', '.join(qn(tombstones.get_field(name).column) for name in ('table', 'object_id', 'deleted_at'))
+    deleted_at = connection.ops.adapt_datetimefield_value(timezone.now())
+    with connection.cursor() as cursor:
+        for model in (UserProfile, Account, Transaction, Goal, BudgetCategory):
+            opts = model._meta
+            cursor.execute(
+                f'INSERT INTO {qn(tombstones.db_table)} ({columns}) '
+                f'SELECT %s, {qn(opts.pk.column)}, %s FROM {qn(opts.db_table)} '
+                f'WHERE {qn(opts.get_field("user").column)} = %s',
+                [opts.db_table, deleted_at, instance.pk],
+            )
+
+
 # Сигнал для автоматического создания профиля пользователя
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
@@ -303,10 +856,36 @@ def create_user_profile(sender, instance, created, **kwargs):
 @receiver(post_save, sender=User)
 def save_user_profile(sender, instance, **kwargs):
     """Сохранять профиль автоматически"""
+    # Частичное сохранение (например last_login при входе) профиль не меняет,
+    # а полное сохранение закешированного профиля затерло бы счетчики попыток
+    if kwargs.get('update_fields') is not None:
+        return
     # Проверяем что профиль существует перед сохранением
     if hasattr(instance, 'profile'):
         instance.profile.save()
     else:
         # Если профиля нет (старый пользователь), создаем его
         if not UserProfile.objects.filter(user=instance).exists():
-            UserProfile.objects.create(user=instance)
\ No newline at end of file
+            UserProfile.objects.create(user=instance)
+
+
+class RequestMetric(models.Model):
+    """Замер одного HTTP запроса, записанный RequestMetricsMiddleware"""
+    view_name = models.CharField(max_length=200, verbose_name='Имя URL')
+    method = models.CharField(max_length=10, verbose_name='Метод')
+    status_code = models.PositiveSmallIntegerField(verbose_name='Код ответа')
+    duration_ms = models.FloatField(verbose_name='Время ответа, мс')
+    db_ms = models.FloatField(verbose_name='Время в БД, мс')
+    db_queries = models.IntegerField(verbose_name='SQL запросов')
+    response_bytes = models.IntegerField(null=True, blank=True, verbose_name='Размер ответа, байт')
+    created_at = models.DateTimeField(default=timezone.now, verbose_name='Время запроса')
+
+    class Meta:
+        verbose_name = 'Замер запроса'
+        verbose_name_plural = 'Замеры запросов'
+        indexes = [
+            models.Index(fields=['created_at']),
+        ]
+
+    def __str__(self):
+        return f'{self.method} {self.view_name}: {self.duration_ms:.0f} мс'
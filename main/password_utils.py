@@ -0,0 +1,152 @@
+"""
+Хеширование паролей с настраиваемой стоимостью.
+
+Алгоритм выбирается настройкой PASSWORD_HASH_ALGORITHM (первый в
+PASSWORD_HASHERS), параметры — настройками PASSWORD_PBKDF2_ITERATIONS,
+PASSWORD_SCRYPT_* и PASSWORD_ARGON2_*; без них действуют значения Django.
+Параметры читаются при каждом хешировании, поэтому после изменения
+настроек пароли пересчитываются при следующем успешном входе: Django
+сравнивает параметры сохранённого хеша с текущими (must_update) и
+сохраняет новый хеш в User.check_password.
+
+Команда calibrate_password_hasher подбирает параметры под целевое время
+хеширования на конкретном сервере.
+"""
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import (
+    Argon2PasswordHasher, PBKDF2PasswordHasher, ScryptPasswordHasher, get_hasher,
+)
+
+
+CALIBRATION_PASSWORD = 'calibration-password'
+CALIBRATION_REPEAT = 5
+SCRYPT_MAXMEM = 2 ** 30
+
+
+def _setting(name, default):
+    value = getattr(settings, name, None)
+    return default if value is None else value
+
+
+class TunedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """PBKDF2-SHA256 с числом итераций из PASSWORD_PBKDF2_ITERATIONS"""
+
+    @property
+    def iterations(self):
+        return _setting('PASSWORD_PBKDF2_ITERATIONS', PBKDF2PasswordHasher.iterations)
+
+
+class TunedScryptPasswordHasher(ScryptPasswordHasher):
+    """scrypt с параметрами PASSWORD_SCRYPT_WORK_FACTOR, _BLOCK_SIZE, _PARALLELISM"""
+
+    @property
+    def work_factor(self):
+        return _setting('PASSWORD_SCRYPT_WORK_FACTOR', ScryptPasswordHasher.work_factor)
+
+    @property
+    def block_size(self):
+        return _setting('PASSWORD_SCRYPT_BLOCK_SIZE', ScryptPasswordHasher.block_size)
+
+    @property
+    def parallelism(self):
+        return _setting('PASSWORD_SCRYPT_PARALLELISM', ScryptPasswordHasher.parallelism)
+
+    # Только верхняя граница памяти (scrypt берёт ~128 * N * r байт): с ней
+    # проверяются и хеши с большим N, сохранённые до снижения стоимости
+    maxmem = SCRYPT_MAXMEM
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    """Argon2id (нужен argon2-cffi) с параметрами PASSWORD_ARGON2_TIME_COST, _MEMORY_COST, _PARALLELISM"""
+
+    @property
+    def time_cost(self):
+        return _setting('PASSWORD_ARGON2_TIME_COST', Argon2PasswordHasher.time_cost)
+
+    @property
+    def memory_cost(self):
+        return _setting('PASSWORD_ARGON2_MEMORY_COST', Argon2PasswordHasher.memory_cost)
+
+    @property
+    def parallelism(self):
+        return _setting('PASSWORD_ARGON2_PARALLELISM', Argon2PasswordHasher.parallelism)
+
+
+def _hasher(hasher_class, **params):
+    """Экземпляр хешера с явно заданными параметрами, без изменения настроек"""
+    return type(hasher_class.__name__, (hasher_class,), params)()
+
+
+def measure_hash_ms(hasher, repeat=CALIBRATION_REPEAT):
+    """Медиана времени хеширования одного пароля в миллисекундах"""
+    timings = []
+    for _ in range(repeat):
+        salt = hasher.salt()
+        started = time.perf_counter()
+        hasher.encode(CALIBRATION_PASSWORD, salt)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def _calibrate_pbkdf2(target_ms, repeat):
+    # Время PBKDF2 линейно по числу итераций: замер и пересчёт, затем уточнение
+    iterations = 100_000
+    for _ in range(2):
+        elapsed = measure_hash_ms(_hasher(PBKDF2PasswordHasher, iterations=iterations), repeat)
+        iterations = max(10_000, int(round(iterations * target_ms / elapsed, -3)))
+    elapsed = measure_hash_ms(_hasher(PBKDF2PasswordHasher, iterations=iterations), repeat)
+    return {'PASSWORD_PBKDF2_ITERATIONS': iterations}, elapsed
+
+
+def _calibrate_doubling(hasher_class, param, start, limit, fixed, target_ms, repeat):
+    # Параметр удваивается, пока время меньше цели; берётся ближайшее к цели значение
+    best = None
+    value = start
+    while value <= limit:
+        elapsed = measure_hash_ms(_hasher(hasher_class, **{param: value}, **fixed), repeat)
+        if best is None or abs(elapsed - target_ms) < abs(best[1] - target_ms):
+            best = (value, elapsed)
+        if elapsed >= target_ms:
+            break
+        value *= 2
+    return best
+
+
+def _calibrate_scrypt(target_ms, repeat):
+    # Размер блока и параллелизм — значения Django, подбирается N
+    work_factor, elapsed = _calibrate_doubling(
+        ScryptPasswordHasher, 'work_factor', 2 ** 12, 2 ** 20, {'maxmem': SCRYPT_MAXMEM}, target_ms, repeat,
+    )
+    return {'PASSWORD_SCRYPT_WORK_FACTOR': work_factor}, elapsed
+
+
+def _calibrate_argon2(target_ms, repeat):
+    # Память фиксирована (значение Django), подбирается число проходов
+    time_cost, elapsed = _calibrate_doubling(
+        Argon2PasswordHasher, 'time_cost', 1, 64, {}, target_ms, repeat,
+    )
+    return {'PASSWORD_ARGON2_TIME_COST': time_cost}, elapsed
+
+
+CALIBRATORS = {
+    'pbkdf2_sha256': _calibrate_pbkdf2,
+    'scrypt': _calibrate_scrypt,
+    'argon2': _calibrate_argon2,
+}
+
+
+def calibrate_password_hasher(algorithm, target_ms, repeat=CALIBRATION_REPEAT):
+    """
+    Подбирает параметры алгоритма под target_ms миллисекунд на один хеш.
+    Возвращает (настройки для settings.py, замеренное время в мс).
+    """
+    return CALIBRATORS[algorithm](target_ms, repeat)
+
+
+def current_hash_ms(repeat=CALIBRATION_REPEAT):
+    """Алгоритм и время хеширования основным хешером из PASSWORD_HASHERS"""
+    hasher = get_hasher()
+    return hasher.algorithm, measure_hash_ms(hasher, repeat)
@@ -0,0 +1,170 @@
+"""
+Счётчики и гистограммы приложения в формате Prometheus.
+
+Значения хранятся в памяти процесса (без внешних сервисов), обновление —
+одна блокировка и сложение. Страница /metrics отдаёт их в текстовом
+формате экспозиции Prometheus. Каждый процесс сервера считает свои
+значения, поэтому Prometheus должен опрашивать каждый процесс отдельно.
+"""
+import bisect
+import math
+import threading
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+REGISTRY = []
+
+
+class Metric:
+    """Метрика с набором меток; значения хранятся по кортежу значений меток"""
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name}: ожидаются метки {", ".join(self.labelnames)}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """Пары (суффикс имени, метки, значение) для вывода"""
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """Монотонно растущий счётчик"""
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield '', dict(zip(self.labelnames, key)), value
+
+
+class Histogram(Metric):
+    """Гистограмма с фиксированными границами корзин (le)"""
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0]
+            state[0][index] += 1
+            state[1] += value
+
+    def count(self, **labels):
+        state = self._values.get(self._key(labels))
+        return sum(state[0]) if state else 0
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, (counts[:], total)) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in values:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield '_bucket', {**labels, 'le': bound}, cumulative
+            yield '_sum', labels, total
+            yield '_count', labels, cumulative
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_metrics(registry=None):
+    """Все метрики в текстовом формате экспозиции Prometheus"""
+    lines = []
+    for metric in REGISTRY if registry is None else registry:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        for suffix, labels, value in metric.samples():
+            if labels:
+                rendered = ','.join(
+                    f'{name}="{_escape_label(_format_value(label))}"' for name, label in labels.items()
+                )
+                lines.append(f'{metric.name}{suffix}{{{rendered}}} {_format_value(value)}')
+            else:
+                lines.append(f'{metric.name}{suffix} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+# === МЕТРИКИ ПРИЛОЖЕНИЯ ===
+
+HTTP_REQUESTS = Counter(
+    'ctrlmoney_http_requests_total',
+    'Число HTTP запросов по имени URL, методу и коду ответа',
+    ('view', 'method', 'status'),
+)
+HTTP_REQUEST_DURATION = Histogram(
+    'ctrlmoney_http_request_duration_seconds',
+    'Время ответа по имени URL',
+    ('view',),
+)
+DB_QUERIES = Histogram(
+    'ctrlmoney_db_queries_per_request',
+    'Число SQL запросов на один HTTP запрос',
+    ('view',),
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 250),
+)
+DB_DURATION = Histogram(
+    'ctrlmoney_db_duration_seconds',
+    'Суммарное время SQL запросов на один HTTP запрос',
+    ('view',),
+)
+LOGIN_ATTEMPTS = Counter(
+    'ctrlmoney_login_attempts_total',
+    'Попытки входа: success, failed, blocked, captcha, ratelimited',
+    ('outcome',),
+)
+JSON_ROWS = Counter(
+    'ctrlmoney_json_rows_total',
+    'Строки, импортированные из JSON и экспортированные в JSON',
+    ('direction', 'section'),
+)
+JSON_DURATION = Histogram(
+    'ctrlmoney_json_duration_seconds',
+    'Длительность импорта и экспорта JSON',
+    ('direction',),
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300),
+)
+BACKUP_DURATION = Histogram(
+    'ctrlmoney_backup_duration_seconds',
+    'Длительность выгрузки SQL бэкапа',
+    ('kind',),
+    buckets=(0.5, 1, 5, 10, 30, 60, 300, 600, 1800, 3600),
+)
@@ -0,0 +1,172 @@
+"""
+Ограничение частоты попыток входа и регистрации (скользящее окно).
+
+Счётчики хранятся в кеше Django (settings.RATELIMIT_CACHE, по умолчанию
+'default'), поэтому проверка не пишет в БД и при переборе пароля нагрузка
+на базу не растёт. Для нескольких процессов сервера нужен общий кеш
+(Redis, Memcached, база данных), с LocMemCache каждый процесс считает сам.
+
+Окно приближённое: счётчики текущего и предыдущего окна, вклад
+предыдущего уменьшается пропорционально прошедшей части текущего окна.
+Лимиты задаются по областям: ip (адрес клиента), subnet (/24 для IPv4,
+/64 для IPv6) и username (имя пользователя из формы, в том числе
+несуществующее).
+
+Адрес клиента — REMOTE_ADDR, а если запрос пришёл от доверенного прокси
+(settings.RATELIMIT_TRUSTED_PROXIES) — крайний правый адрес в
+X-Forwarded-For, не принадлежащий доверенным прокси. Иначе за прокси на
+том же сервере все клиенты делили бы один лимит адреса 127.0.0.1.
+"""
+import hashlib
+import ipaddress
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+RATELIMIT_KEY = 'main:ratelimit:'
+
+# Действие -> {область: (число попыток, окно в секундах)};
+# переопределяются в settings.RATE_LIMITS
+DEFAULT_RATE_LIMITS = {
+    'login': {
+        'ip': (30, 300),
+        'subnet': (100, 300),
+        'username': (10, 900),
+    },
+    'register': {
+        'ip': (10, 3600),
+        'subnet': (30, 3600),
+    },
+}
+
+SUBNET_PREFIX = {4: 24, 6: 64}
+
+# Прокси на том же сервере; переопределяется в settings.RATELIMIT_TRUSTED_PROXIES
+DEFAULT_TRUSTED_PROXIES = ['127.0.0.1', '::1']
+
+
+def _cache():
+    return caches[getattr(settings, 'RATELIMIT_CACHE', 'default')]
+
+
+def rate_limits(action):
+    """Лимиты действия с учётом settings.RATE_LIMITS"""
+    return getattr(settings, 'RATE_LIMITS', {}).get(action, DEFAULT_RATE_LIMITS.get(action, {}))
+
+
+def _trusted_proxies():
+    proxies = getattr(settings, 'RATELIMIT_TRUSTED_PROXIES', DEFAULT_TRUSTED_PROXIES)
+    return [ipaddress.ip_network(proxy, strict=False) for proxy in proxies]
+
+
+def _is_trusted(ip, proxies):
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return False
+    return any(address in network for network in proxies)
+
+
+def client_ip(request):
+    """
+    Адрес клиента. Если REMOTE_ADDR — доверенный прокси, адрес берётся из
+    X-Forwarded-For: крайний правый, который добавил не доверенный прокси
+    (левые части заголовка клиент может подставить сам).
+    """
+    ip = request.META.get('REMOTE_ADDR') or 'unknown'
+    proxies = _trusted_proxies()
+    if not _is_trusted(ip, proxies):
+        return ip
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR', '')
+    for hop in reversed([hop.strip() for hop in forwarded.split(',') if hop.strip()]):
+        ip = hop
+        if not _is_trusted(hop, proxies):
+            break
+    return ip
+
+
+def _subnet(ip):
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return ip
+    return str(ipaddress.ip_network(f'{address}/{SUBNET_PREFIX[address.version]}', strict=False))
+
+
+def rate_limit_subjects(request, username=None):
+    """Значения областей для запроса: {'ip': ..., 'subnet': ..., 'username': ...}"""
+    ip = client_ip(request)
+    subjects = {'ip': ip, 'subnet': _subnet(ip)}
+    if username:
+        subjects['username'] = username
+    return subjects
+
+
+def _key(action, scope, value, window, index):
+    # Значение хешируется: имена пользователей могут содержать символы,
+    # недопустимые в ключах Memcached
+    digest = hashlib.sha256(value.encode()).hexdigest()[:32]
+    return f'{RATELIMIT_KEY}{action}:{scope}:{digest}:{window}:{index}'
+
+
+def _retry_after(previous, current, limit, window, elapsed):
+    """Через сколько целых секунд оценка окна станет меньше limit"""
+    if current < limit:
+        # Хватит того, что устареет часть предыдущего окна
+        wait = window * (1 - (limit - current) / previous) - elapsed
+    else:
+        # Ждём следующего окна, пока не устареет часть текущего
+        wait = window - elapsed + window * (1 - limit / current)
+    return max(1, math.floor(wait) + 1)
+
+
+def _increment(cache, key, window):
+    if cache.add(key, 1, window * 2):
+        return
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Ключ истёк между add и incr
+        cache.set(key, 1, window * 2)
+
+
+def check_rate_limit(action, subjects, now=None):
+    """
+    Учитывает попытку действия action и проверяет лимиты.
+
+    subjects — значения областей (rate_limit_subjects). Возвращает 0, если
+    попытка разрешена (она засчитывается во все окна), иначе число секунд
+    для заголовка Retry-After (отклонённая попытка не засчитывается).
+    """
+    limits = rate_limits(action)
+    cache = _cache()
+    now = time.time() if now is None else now
+
+    windows = []
+    for scope, (limit, window) in limits.items():
+        value = subjects.get(scope)
+        if value is None:
+            continue
+        index = int(now // window)
+        windows.append((
+            limit, window, now - index * window,
+            _key(action, scope, value, window, index),
+            _key(action, scope, value, window, index - 1),
+        ))
+
+    counts = cache.get_many([key for entry in windows for key in entry[3:]])
+    retry_after = 0
+    for limit, window, elapsed, current_key, previous_key in windows:
+        current = counts.get(current_key, 0)
+        previous = counts.get(previous_key, 0)
+        if previous * (1 - elapsed / window) + current >= limit:
+            retry_after = max(retry_after, _retry_after(previous, current, limit, window, elapsed))
+    if retry_after:
+        return retry_after
+
+    for limit, window, elapsed, current_key, previous_key in windows:
+        _increment(cache, current_key, window)
+    return 0
@@ -0,0 +1,288 @@
+"""
+Выполнение произвольных SQL запросов из админских SQL панелей
+с ограничением времени и количества строк
+"""
+import csv
+import hashlib
+import io
+import json
+import re
+import time
+from contextlib import contextmanager
+
+from django.db import IntegrityError, connection, transaction as db_transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import SlowQuery
+
+
+SQL_PANEL_PAGE_SIZE = 500
+SQL_PANEL_TIMEOUT_MS = 5000
+SQL_CSV_TIMEOUT_MS = 120000
+SQL_CSV_FETCH_SIZE = 2000
+
+SLOW_QUERY_HISTORY_SIZE = 100
+
+# Таблицы, последовательное сканирование которых подсвечивается в плане
+SEQ_SCAN_WARN_TABLES = ('main_transaction',)
+
+# Запросы, результат которых можно читать курсором на сервере и листать
+READ_QUERY_PREFIXES = ('select', 'with', 'values', 'table')
+
+
+def is_read_query(query):
+    """Запрос только читает данные и возвращает строки"""
+    words = query.lstrip(' \t\r\n(').split(None, 1)
+    return bool(words) and words[0].lower() in READ_QUERY_PREFIXES
+
+
+@contextmanager
+def statement_timeout(timeout_ms):
+    """
+    Ограничивает время выполнения запросов внутри блока.
+
+    PostgreSQL: statement_timeout на время текущей транзакции (set_config с is_local).
+    SQLite: progress handler прерывает запрос по истечении времени.
+    Блок должен выполняться внутри transaction.atomic().
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT set_config('statement_timeout', %s, true)", [str(int(timeout_ms))])
+        yield
+        return
+
+    if connection.vendor == 'sqlite':
+        connection.ensure_connection()
+        deadline = time.monotonic() + timeout_ms / 1000
+        connection.connection.set_progress_handler(lambda: time.monotonic() > deadline, 10000)
+        try:
+            yield
+        finally:
+            connection.connection.set_progress_handler(None, 0)
+        return
+
+    yield
+
+
+def is_query_timeout(exc):
+    """Запрос прерван по statement_timeout (PostgreSQL) или progress handler (SQLite)"""
+    cause = exc.__cause__ or exc
+    # psycopg2 хранит SQLSTATE в pgcode, psycopg 3 — в sqlstate; 57014 — query_canceled
+    if '57014' in (getattr(cause, 'pgcode', None), getattr(cause, 'sqlstate', None)):
+        return True
+    return connection.vendor == 'sqlite' and str(exc) == 'interrupted'
+
+
+def _skip_rows(cursor, count):
+    """Пропускает count строк результата, не держа их в памяти"""
+    while count > 0:
+        skipped = len(cursor.fetchmany(min(count, SQL_CSV_FETCH_SIZE)))
+        if not skipped:
+            break
+        count -= skipped
+
+
+def execute_sql_query(query, offset=0, limit=SQL_PANEL_PAGE_SIZE, timeout_ms=SQL_PANEL_TIMEOUT_MS):
+    """
+    Выполняет SQL запрос и возвращает не больше limit строк начиная с offset.
+
+    SELECT читается серверным курсором (в PostgreSQL) через fetchmany, поэтому
+    в память попадает только одна страница результата. has_more показывает,
+    есть ли строки дальше — их можно получить повторным вызовом с next_offset.
+    """
+    read_query = is_read_query(query)
+    if offset and not read_query:
+        raise ValueError('Постраничный просмотр доступен только для SELECT запросов')
+
+    started = time.monotonic()
+    with db_transaction.atomic(), statement_timeout(timeout_ms):
+        cursor = connection.chunked_cursor() if read_query else connection.cursor()
+        with cursor:
+            cursor.execute(query)
+
+            # Если это SELECT запрос
+            if cursor.description:
+                columns = [col[0] for col in cursor.description]
+                _skip_rows(cursor, offset)
+                rows = cursor.fetchmany(limit + 1)
+                has_more = len(rows) > limit
+                rows = rows[:limit]
+
+                results = {
+                    'type': 'select',
+                    'columns': columns,
+                    'rows': rows,
+                    'row_count': len(rows),
+                    'offset': offset,
+                    'first_row': offset + 1,
+                    'last_row': offset + len(rows),
+                    'has_more': has_more,
+                    'next_offset': offset + len(rows),
+                }
+            else:
+                # Для INSERT, UPDATE, DELETE
+                results = {
+                    'type': 'modify',
+                    'message': f'Запрос выполнен успешно. Затронуто строк: {cursor.rowcount}',
+                    'row_count': cursor.rowcount
+                }
+
+    results['elapsed_ms'] = round((time.monotonic() - started) * 1000, 1)
+    return results
+
+
+def iter_sql_csv(query, fetch_size=SQL_CSV_FETCH_SIZE, timeout_ms=SQL_CSV_TIMEOUT_MS):
+    """
+    Генератор CSV с результатом SELECT запроса для StreamingHttpResponse.
+    Строки читаются с сервера пачками по fetch_size.
+    """
+    if not is_read_query(query):
+        raise ValueError('Выгрузка в CSV доступна только для SELECT запросов')
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        data = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    with db_transaction.atomic(), statement_timeout(timeout_ms):
+        with connection.chunked_cursor() as cursor:
+            cursor.execute(query)
+            writer.writerow([col[0] for col in cursor.description])
+            # BOM, чтобы Excel открыл файл в UTF-8
+            yield '\ufeff' + flush()
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                writer.writerows(rows)
+                yield flush()
+
+
+def _postgres_plan(explain):
+    """Дерево плана EXPLAIN (FORMAT JSON) в виде списка узлов с глубиной"""
+    nodes = []
+
+    def node_total(plan):
+        return plan.get('Actual Total Time', 0) * (plan.get('Actual Loops') or 1)
+
+    def walk(plan, depth):
+        children = plan.get('Plans', [])
+        total = node_total(plan)
+        relation = plan.get('Relation Name')
+        nodes.append({
+            'depth': depth,
+            'node_type': plan['Node Type'],
+            'relation': relation,
+            'index': plan.get('Index Name'),
+            'condition': plan.get('Filter') or plan.get('Index Cond') or plan.get('Hash Cond'),
+            'total_ms': round(total, 3),
+            'self_ms': round(max(total - sum(node_total(child) for child in children), 0), 3),
+            'rows': plan.get('Actual Rows'),
+            'plan_rows': plan.get('Plan Rows'),
+            'loops': plan.get('Actual Loops'),
+            'shared_hit': plan.get('Shared Hit Blocks'),
+            'shared_read': plan.get('Shared Read Blocks'),
+            'seq_scan': plan['Node Type'] == 'Seq Scan' and relation in SEQ_SCAN_WARN_TABLES,
+        })
+        for child in children:
+            walk(child, depth + 1)
+
+    walk(explain['Plan'], 0)
+    return {
+        'nodes': nodes,
+        'planning_ms': explain.get('Planning Time'),
+        'execution_ms': explain.get('Execution Time'),
+        'analyzed': True,
+    }
+
+
+def _sqlite_plan(rows):
+    """Дерево плана EXPLAIN QUERY PLAN (SQLite). Времени по узлам SQLite не даёт"""
+    seq_scan = re.compile(r'^SCAN (TABLE )?(%s)\b' % '|'.join(SEQ_SCAN_WARN_TABLES))
+    depths = {}
+    nodes = []
+    for node_id, parent, _, detail in rows:
+        depth = depths.get(parent, -1) + 1
+        depths[node_id] = depth
+        match = seq_scan.match(detail)
+        nodes.append({
+            'depth': depth,
+            'node_type': detail,
+            'relation': match.group(2) if match else None,
+            'seq_scan': bool(match) and 'USING' not in detail,
+        })
+    return {'nodes': nodes, 'planning_ms': None, 'execution_ms': None, 'analyzed': False}
+
+
+def explain_sql_query(query, timeout_ms=SQL_PANEL_TIMEOUT_MS):
+    """
+    План выполнения запроса.
+
+    PostgreSQL: EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) — запрос действительно
+    выполняется, поэтому транзакция всегда откатывается. Для каждого узла
+    есть время (общее и собственное), строки и буферы.
+    SQLite: EXPLAIN QUERY PLAN без выполнения.
+    Последовательные сканирования SEQ_SCAN_WARN_TABLES попадают в warnings.
+    """
+    if connection.vendor not in ('postgresql', 'sqlite'):
+        raise ValueError('План запроса доступен только для PostgreSQL и SQLite')
+
+    started = time.monotonic()
+    with db_transaction.atomic(), statement_timeout(timeout_ms):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ' + query)
+                raw = cursor.fetchone()[0]
+                if isinstance(raw, str):
+                    raw = json.loads(raw)
+                results = _postgres_plan(raw[0])
+            else:
+                cursor.execute('EXPLAIN QUERY PLAN ' + query)
+                results = _sqlite_plan(cursor.fetchall())
+        db_transaction.set_rollback(True)
+
+    results['type'] = 'explain'
+    results['elapsed_ms'] = round((time.monotonic() - started) * 1000, 1)
+    results['warnings'] = [
+        f'Последовательное сканирование {node["relation"]}'
+        + (f' ({node["rows"]} строк)' if node.get('rows') is not None else '')
+        + ' — стоит проверить индексы'
+        for node in results['nodes'] if node['seq_scan']
+    ]
+    return results
+
+
+def record_query_time(query, elapsed_ms, history_size=SLOW_QUERY_HISTORY_SIZE):
+    """
+    Добавляет время выполнения запроса из SQL панели в историю SlowQuery.
+    Одинаковые (с точностью до пробелов) запросы объединяются, хранятся
+    history_size самых медленных. Запрос, прерванный по таймауту,
+    записывается со временем таймаута (SQL_PANEL_TIMEOUT_MS).
+    """
+    normalized = ' '.join(query.split())
+    query_hash = hashlib.md5(normalized.encode('utf-8')).hexdigest()
+    updated = SlowQuery.objects.filter(query_hash=query_hash).update(
+        calls=F('calls') + 1,
+        total_ms=F('total_ms') + elapsed_ms,
+        max_ms=Greatest(F('max_ms'), elapsed_ms),
+        last_ms=elapsed_ms,
+        last_run_at=timezone.now(),
+    )
+    if not updated:
+        try:
+            with db_transaction.atomic():
+                SlowQuery.objects.create(
+                    query_hash=query_hash, query=normalized, calls=1,
+                    total_ms=elapsed_ms, max_ms=elapsed_ms, last_ms=elapsed_ms,
+                )
+        except IntegrityError:
+            return record_query_time(query, elapsed_ms, history_size)
+
+    fastest = SlowQuery.objects.values_list('pk', flat=True)[history_size:]
+    SlowQuery.objects.filter(pk__in=list(fastest)).delete()
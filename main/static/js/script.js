@@ -67,6 +67,9 @@ async function apiFetch(path, method='GET', body=null) {
     
     const resp = await fetch(path, opts)
     
+    // Изменение транзакций делает закэшированные сводки устаревшими
+    if (method !== 'GET' && path.startsWith('/api/transactions/')) invalidateSummary()
+    
     if (!resp.ok) {
         const text = await resp.text()
         throw new Error(`API ${method} ${path} failed: ${resp.status} ${text}`)
@@ -88,6 +91,7 @@ let viewingAccountIndex = null, viewingGoalIndex = null
 // === ЗАГРУЗКА ДАННЫХ ===
 
 async function loadDataFromServer() {
+    invalidateSummary()
     try {
         const [accountsRes, transactionsRes, goalsRes] = await Promise.all([
             apiFetch('/api/accounts/'),
@@ -799,14 +803,82 @@ function updateBalance() {
     }
 }
 
-function updateEconomy(period = 'month') {
+// === СВОДКА ЗА ПЕРИОД ===
+
+// Кэш ответов /forecast/api/summary/ по периодам; сбрасывается при изменении транзакций
+const summaryCache = {}
+
+function invalidateSummary() {
+    Object.keys(summaryCache).forEach(key => delete summaryCache[key])
+}
+
+function loadSummary(period = 'month') {
+    if (!summaryCache[period]) {
+        summaryCache[period] = apiFetch(`/forecast/api/summary/?period=${encodeURIComponent(period)}`)
+            .then(res => res.success ? res : summarizeLocally(period))
+            .catch(err => {
+                console.warn('Сводка с сервера недоступна, считаем локально:', err)
+                delete summaryCache[period]
+                return summarizeLocally(period)
+            })
+    }
+    return summaryCache[period]
+}
+
+// Та же сводка, что отдаёт сервер, но по загруженным в браузер транзакциям
+function summarizeLocally(period) {
     const filteredIncome = filterTransactions(incomeTransactions, period)
     const filteredExpenses = filterTransactions(expensesTransactions, period)
 
-    const periodIncome = filteredIncome.reduce((sum, t) => sum + t.amount, 0)
-    const periodExpenses = filteredExpenses.reduce((sum, t) => sum + t.amount, 0)
-    const periodSavings = periodIncome - periodExpenses
-    const periodPercent = periodIncome > 0 ? Math.round((periodSavings / periodIncome) * 100) : 0
+    let labels = []
+    let bucketOf = null
+
+    if (period === 'week') {
+        labels = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
+        bucketOf = d => (d.getDay() + 6) % 7
+    } else if (period === 'year') {
+        labels = ['Янв', 'Фев', 'Мар', 'Апр', 'Май', 'Июн', 'Июл', 'Авг', 'Сен', 'Окт', 'Ноя', 'Дек']
+        bucketOf = d => d.getMonth()
+    } else {
+        const daysInMonth = new Date(new Date().getFullYear(), new Date().getMonth() + 1, 0).getDate()
+        labels = Array.from({length: daysInMonth}, (_, i) => (i + 1).toString())
+        bucketOf = d => d.getDate() - 1
+    }
+
+    const incomeData = new Array(labels.length).fill(0)
+    const expenseData = new Array(labels.length).fill(0)
+
+    filteredIncome.forEach(t => {
+        const index = bucketOf(new Date(t.date))
+        if (index >= 0 && index < labels.length) incomeData[index] += t.amount || 0
+    })
+    filteredExpenses.forEach(t => {
+        const index = bucketOf(new Date(t.date))
+        if (index >= 0 && index < labels.length) expenseData[index] += t.amount || 0
+    })
+
+    const totalIncome = incomeData.reduce((sum, v) => sum + v, 0)
+    const totalExpense = expenseData.reduce((sum, v) => sum + v, 0)
+    const savings = totalIncome - totalExpense
+
+    return {
+        period,
+        labels,
+        income: incomeData,
+        expense: expenseData,
+        totals: { income: totalIncome, expense: totalExpense, savings },
+        averages: { income: totalIncome / labels.length, expense: totalExpense / labels.length },
+        savings_percent: totalIncome > 0 ? Math.round((savings / totalIncome) * 100) : 0
+    }
+}
+
+async function updateEconomy(period = 'month') {
+    const summary = await loadSummary(period)
+
+    const periodIncome = summary.totals.income
+    const periodExpenses = summary.totals.expense
+    const periodSavings = summary.totals.savings
+    const periodPercent = summary.savings_percent
 
     const incomeText = document.getElementById('incomeText')
     const expensesText = document.getElementById('expensesText')
@@ -840,27 +912,12 @@ function updateEconomy(period = 'month') {
 }
 
 // === СРЕДНИЕ ЗНАЧЕНИЯ ===
-function updateAverages(period = 'month') {
-    // Фильтруем транзакции по периоду
-    const filteredIncome = filterTransactions(incomeTransactions, period)
-    const filteredExpenses = filterTransactions(expensesTransactions, period)
-
-    const totalIncome = filteredIncome.reduce((sum, t) => sum + (t.amount || 0), 0)
-    const totalExpenses = filteredExpenses.reduce((sum, t) => sum + (t.amount || 0), 0)
-
-    // Делитель — количество единиц времени в выбранном периоде
-    let divisor = 1
-    if (period === 'week') {
-        divisor = 7
-    } else if (period === 'month') {
-        const now = new Date()
-        divisor = new Date(now.getFullYear(), now.getMonth() + 1, 0).getDate()
-    } else if (period === 'year') {
-        divisor = 12
-    }
+async function updateAverages(period = 'month') {
+    // Среднее за единицу времени периода (день недели/месяца или месяц года) считает сервер
+    const summary = await loadSummary(period)
 
-    const avgIncome = divisor ? totalIncome / divisor : 0
-    const avgExpenses = divisor ? totalExpenses / divisor : 0
+    const avgIncome = summary.averages.income
+    const avgExpenses = summary.averages.expense
 
     const avgIncomeEl = document.getElementById('avgIncomeText')
     const avgExpensesEl = document.getElementById('avgExpensesText')
@@ -915,61 +972,14 @@ function filterTransactions(transactions, period) {
     })
 }
 
-function updateChart(period) {
+async function updateChart(period) {
     if (!incomeExpenseChart) return
     
-    const filteredIncome = filterTransactions(incomeTransactions, period)
-    const filteredExpenses = filterTransactions(expensesTransactions, period)
-    
-    let labels = []
-    let incomeData = []
-    let expensesData = []
-    
-    if (period === 'week') {
-        labels = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
-        incomeData = new Array(7).fill(0)
-        expensesData = new Array(7).fill(0)
-        
-        filteredIncome.forEach(t => {
-            const day = (new Date(t.date).getDay() + 6) % 7
-            incomeData[day] += t.amount
-        })
-        filteredExpenses.forEach(t => {
-            const day = (new Date(t.date).getDay() + 6) % 7
-            expensesData[day] += t.amount
-        })
-    } else if (period === 'month') {
-        const daysInMonth = new Date(new Date().getFullYear(), new Date().getMonth() + 1, 0).getDate()
-        labels = Array.from({length: daysInMonth}, (_, i) => (i + 1).toString())
-        incomeData = new Array(daysInMonth).fill(0)
-        expensesData = new Array(daysInMonth).fill(0)
-        
-        filteredIncome.forEach(t => {
-            const day = new Date(t.date).getDate() - 1
-            if (day >= 0 && day < daysInMonth) incomeData[day] += t.amount
-        })
-        filteredExpenses.forEach(t => {
-            const day = new Date(t.date).getDate() - 1
-            if (day >= 0 && day < daysInMonth) expensesData[day] += t.amount
-        })
-    } else {
-        labels = ['Янв', 'Фев', 'Мар', 'Апр', 'Май', 'Июн', 'Июл', 'Авг', 'Сен', 'Окт', 'Ноя', 'Дек']
-        incomeData = new Array(12).fill(0)
-        expensesData = new Array(12).fill(0)
-        
-        filteredIncome.forEach(t => {
-            const month = new Date(t.date).getMonth()
-            incomeData[month] += t.amount
-        })
-        filteredExpenses.forEach(t => {
-            const month = new Date(t.date).getMonth()
-            expensesData[month] += t.amount
-        })
-    }
+    const summary = await loadSummary(period)
     
-    incomeExpenseChart.data.labels = labels
-    incomeExpenseChart.data.datasets[0].data = incomeData
-    incomeExpenseChart.data.datasets[1].data = expensesData
+    incomeExpenseChart.data.labels = summary.labels
+    incomeExpenseChart.data.datasets[0].data = summary.income
+    incomeExpenseChart.data.datasets[1].data = summary.expense
     incomeExpenseChart.update()
 }
 
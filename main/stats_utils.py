@@ -0,0 +1,145 @@
+"""
+Статистика для главной страницы админки.
+
+Тяжёлые запросы (размеры таблиц, объём по дням, топ пользователей) выполняет
+команда collect_admin_stats по расписанию и сохраняет результат в
+AdminStatsSnapshot. Страница читает последний снимок через кеш.
+"""
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDay
+from django.utils import timezone
+
+from .models import Account, AdminStatsSnapshot, Goal, Transaction, UserBalance
+
+
+STATS_CACHE_KEY = 'main:admin_stats'
+STATS_CACHE_TTL = 300
+STATS_DAYS = 30
+STATS_TOP_USERS = 10
+
+# Ключ в статистике -> модель, строки которой считаются
+COUNTED_MODELS = {
+    'users_count': User,
+    'accounts_count': Account,
+    'transactions_count': Transaction,
+    'goals_count': Goal,
+}
+
+
+def table_row_counts(estimate=True):
+    """
+    Количество строк в таблицах COUNTED_MODELS.
+
+    В PostgreSQL при estimate=True берётся оценка pg_class.reltuples (её
+    обновляют ANALYZE и autovacuum) вместо COUNT(*) со сканированием таблицы.
+    Для таблиц без статистики (reltuples < 0) выполняется обычный COUNT(*).
+    """
+    estimates = {}
+    if estimate and connection.vendor == 'postgresql':
+        tables = [model._meta.db_table for model in COUNTED_MODELS.values()]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT relname, reltuples::bigint FROM pg_class '
+                'WHERE relkind = %s AND relname = ANY(%s)',
+                ['r', tables],
+            )
+            estimates = {name: count for name, count in cursor.fetchall() if count >= 0}
+
+    counts = {}
+    for key, model in COUNTED_MODELS.items():
+        count = estimates.get(model._meta.db_table)
+        counts[key] = count if count is not None else model.objects.count()
+    return counts
+
+
+def table_sizes():
+    """Размер таблиц приложения на диске (только PostgreSQL), по убыванию"""
+    if connection.vendor != 'postgresql':
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT relname, pg_total_relation_size(relid), n_live_tup '
+            'FROM pg_stat_user_tables ORDER BY 2 DESC LIMIT 20'
+        )
+        return [
+            {'table': name, 'bytes': size, 'rows': rows}
+            for name, size, rows in cursor.fetchall()
+        ]
+
+
+def daily_volume(days=STATS_DAYS, now=None):
+    """Число и сумма транзакций по дням за последние days дней"""
+    now = now or timezone.now()
+    start = timezone.localtime(now).replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days - 1)
+    rows = (
+        Transaction.objects.filter(date__gte=start).order_by()
+        .annotate(day=TruncDay('date'))
+        .values('day')
+        .annotate(
+            count=Count('id'),
+            income=Sum('amount', filter=Q(transaction_type='income')),
+            expense=Sum('amount', filter=Q(transaction_type='expense')),
+        )
+        .order_by('day')
+    )
+    return [
+        {
+            'day': row['day'].date().isoformat(),
+            'count': row['count'],
+            'income': str(row['income'] or 0),
+            'expense': str(row['expense'] or 0),
+        }
+        for row in rows
+    ]
+
+
+def top_users(limit=STATS_TOP_USERS):
+    """Пользователи с наибольшим числом транзакций (по сводной таблице UserBalance)"""
+    rows = (
+        UserBalance.objects.select_related('user')
+        .order_by('-transactions_count')[:limit]
+    )
+    return [
+        {'username': row.user.username, 'transactions_count': row.transactions_count}
+        for row in rows
+    ]
+
+
+def collect_admin_stats(now=None):
+    """Собирает всю статистику главной страницы админки"""
+    now = now or timezone.now()
+    return {
+        'computed_at': now.isoformat(),
+        **table_row_counts(),
+        'daily_volume': daily_volume(now=now),
+        'top_users': top_users(),
+        'table_sizes': table_sizes(),
+    }
+
+
+def refresh_admin_stats(keep=STATS_DAYS):
+    """Собирает и сохраняет новый снимок, оставляя keep последних. Возвращает снимок"""
+    snapshot = AdminStatsSnapshot.objects.create(data=collect_admin_stats())
+    stale = AdminStatsSnapshot.objects.values_list('pk', flat=True)[keep:]
+    AdminStatsSnapshot.objects.filter(pk__in=list(stale)).delete()
+    cache.set(STATS_CACHE_KEY, snapshot.data, STATS_CACHE_TTL)
+    return snapshot
+
+
+def get_admin_stats():
+    """
+    Статистика для страницы: из кеша, иначе из последнего снимка.
+    Если команда ещё ни разу не запускалась, возвращаются только
+    оценки количества строк.
+    """
+    stats = cache.get(STATS_CACHE_KEY)
+    if stats is None:
+        snapshot = AdminStatsSnapshot.objects.first()
+        stats = snapshot.data if snapshot else table_row_counts()
+        cache.set(STATS_CACHE_KEY, stats, STATS_CACHE_TTL)
+    return stats
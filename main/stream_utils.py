@@ -0,0 +1,60 @@
+"""
+Утилиты для потоковой отдачи больших файлов (экспорт, бэкапы)
+"""
+import zlib
+from django.http import StreamingHttpResponse
+
+
+STREAM_BUFFER_SIZE = 64 * 1024
+GZIP_LEVEL = 6
+
+
+def encode_stream(chunks, buffer_size=STREAM_BUFFER_SIZE):
+    """
+    Кодирует строки в utf-8 и склеивает мелкие куски в блоки по buffer_size,
+    чтобы не отправлять клиенту тысячи крошечных фрагментов.
+    """
+    buffer = []
+    size = 0
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        buffer.append(chunk)
+        size += len(chunk)
+        if size >= buffer_size:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def gzip_stream(chunks, level=GZIP_LEVEL):
+    """Сжимает поток байтов в формат gzip по мере поступления данных"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def wants_gzip(request):
+    """Запрошено ли сжатие файла параметром ?gzip=1"""
+    return request.GET.get('gzip', '').lower() in ('1', 'true', 'yes')
+
+
+def streaming_attachment(chunks, filename, content_type, gzip=False):
+    """
+    StreamingHttpResponse для скачивания файла.
+    При gzip=True файл отдаётся сжатым с расширением .gz.
+    """
+    stream = encode_stream(chunks)
+    if gzip:
+        stream = gzip_stream(stream)
+        filename += '.gz'
+        content_type = 'application/gzip'
+    response = StreamingHttpResponse(stream, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,195 @@
+"""
+Генерация синтетических пользователей с правдоподобными данными
+для нагрузочных проверок и бенчмарков (команда generate_synthetic_data)
+"""
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction as db_transaction
+from django.utils import timezone
+
+from .models import Account, BudgetCategory, Goal, MonthlyCategoryRollup, Transaction, UserBalance, UserProfile
+
+
+SYNTHETIC_PREFIX = 'synthetic_'
+SYNTHETIC_PASSWORD = 'synthetic-password'
+SYNTHETIC_BATCH_SIZE = 5000
+# Пользователи создаются группами, каждая группа — одна транзакция БД
+SYNTHETIC_USERS_PER_CHUNK = 50
+
+FIRST_NAMES = ('Иван', 'Анна', 'Сергей', 'Мария', 'Дмитрий', 'Елена', 'Алексей', 'Ольга')
+LAST_NAMES = ('Иванов', 'Смирнова', 'Кузнецов', 'Попова', 'Васильев', 'Петрова', 'Соколов', 'Новикова')
+
+ACCOUNT_PRESETS = (
+    ('Основная карта', 'debit'),
+    ('Накопительный счёт', 'savings'),
+    ('Наличные', 'cash'),
+    ('Кредитная карта', 'credit'),
+    ('Брокерский счёт', 'investment'),
+    ('Вклад', 'deposit'),
+)
+
+# Категория расходов: эмодзи, месячный бюджет, названия транзакций,
+# параметры логнормального распределения суммы и относительная частота
+EXPENSE_CATEGORIES = {
+    'еда': ('🍔', 25000, ('Пятёрочка', 'Перекрёсток', 'Кафе', 'Доставка еды'), 6.2, 0.8, 40),
+    'транспорт': ('🚇', 6000, ('Метро', 'Такси', 'Бензин'), 5.5, 0.9, 20),
+    'развлечения': ('🎬', 8000, ('Кино', 'Подписка', 'Концерт'), 6.5, 0.9, 10),
+    'жилье': ('🏠', 40000, ('Аренда', 'Коммунальные платежи', 'Интернет'), 8.5, 1.0, 5),
+    'здоровье': ('💊', 5000, ('Аптека', 'Стоматолог', 'Анализы'), 7.0, 1.0, 6),
+    'одежда': ('👕', 7000, ('Одежда', 'Обувь'), 7.5, 0.8, 5),
+    'другое': ('📦', 5000, ('Подарок', 'Маркетплейс', 'Перевод'), 6.8, 1.1, 6),
+}
+INCOME_NAMES = ('Зарплата', 'Аванс', 'Премия', 'Кешбэк', 'Фриланс')
+INCOME_SHARE = 0.08
+
+GOAL_NAMES = ('Отпуск', 'Подушка безопасности', 'Новый ноутбук', 'Автомобиль', 'Ремонт', 'Первый взнос')
+
+
+def _money(value):
+    return max(Decimal(value).quantize(Decimal('0.01')), Decimal('0.01'))
+
+
+class SyntheticDataGenerator:
+    """Создаёт пользователей со счетами, транзакциями, целями и категориями через bulk_create"""
+
+    def __init__(self, accounts=3, transactions=1000, goals=2, categories=6, days=365,
+                 seed=None, prefix=SYNTHETIC_PREFIX, batch_size=SYNTHETIC_BATCH_SIZE):
+        self.accounts = min(accounts, len(ACCOUNT_PRESETS))
+        self.transactions = transactions
+        self.goals = goals
+        self.categories = min(categories, len(EXPENSE_CATEGORIES))
+        self.days = days
+        self.prefix = prefix
+        self.batch_size = batch_size
+        self.random = random.Random(seed)
+        self.now = timezone.now()
+        self.password = make_password(SYNTHETIC_PASSWORD)
+        self.expense_categories = list(EXPENSE_CATEGORIES)
+        self.expense_weights = [params[5] for params in EXPENSE_CATEGORIES.values()]
+        self.counts = {'users': 0, 'accounts': 0, 'transactions': 0, 'goals': 0, 'budget_categories': 0}
+
+    def generate(self, users, progress=None):
+        """Создаёт users пользователей. progress(counts) вызывается после каждой группы"""
+        first = self._next_number()
+        for start in range(0, users, SYNTHETIC_USERS_PER_CHUNK):
+            numbers = range(first + start, first + min(start + SYNTHETIC_USERS_PER_CHUNK, users))
+            with db_transaction.atomic():
+                user_ids = self._generate_chunk(numbers)
+                # bulk_create не вызывает сигналы, сводные таблицы пересчитываются явно
+                UserBalance.rebuild(user_ids=user_ids)
+                MonthlyCategoryRollup.rebuild(user_ids=user_ids)
+            if progress:
+                progress(self.counts)
+        return self.counts
+
+    def _next_number(self):
+        """Номер следующего пользователя: генерацию можно запускать повторно"""
+        numbers = [
+            int(username[len(self.prefix):])
+            for username in User.objects.filter(username__startswith=self.prefix).values_list('username', flat=True)
+            if username[len(self.prefix):].isdigit()
+        ]
+        return max(numbers) + 1 if numbers else 0
+
+    def _generate_chunk(self, numbers):
+        rnd = self.random
+        users = User.objects.bulk_create([
+            User(
+                username=f'{self.prefix}{number}',
+                email=f'{self.prefix}{number}@example.com',
+                password=self.password,
+                first_name=rnd.choice(FIRST_NAMES),
+                last_name=rnd.choice(LAST_NAMES),
+                date_joined=self.now - timedelta(days=self.days),
+            )
+            for number in numbers
+        ])
+        UserProfile.objects.bulk_create([
+            UserProfile(user=user, first_name=user.first_name, last_name=user.last_name)
+            for user in users
+        ])
+
+        accounts = Account.objects.bulk_create([
+            Account(
+                user=user,
+                name=name,
+                account_type=account_type,
+                amount=_money(rnd.lognormvariate(10.5, 1.2)),
+            )
+            for user in users
+            for name, account_type in ACCOUNT_PRESETS[:self.accounts]
+        ], batch_size=self.batch_size)
+        accounts_by_user = {}
+        for account in accounts:
+            accounts_by_user.setdefault(account.user_id, []).append(account.pk)
+
+        BudgetCategory.objects.bulk_create([
+            BudgetCategory(user=user, name=name, emoji=EXPENSE_CATEGORIES[name][0],
+                           budget=Decimal(EXPENSE_CATEGORIES[name][1]))
+            for user in users
+            for name in self.expense_categories[:self.categories]
+        ], batch_size=self.batch_size)
+
+        goals = Goal.objects.bulk_create([
+            Goal(
+                user=user,
+                name=GOAL_NAMES[index % len(GOAL_NAMES)],
+                target_amount=_money(rnd.uniform(50000, 2000000)),
+                use_only_linked_accounts=rnd.random() < 0.3,
+            )
+            for user in users
+            for index in range(self.goals)
+        ], batch_size=self.batch_size)
+        Goal.linked_accounts.through.objects.bulk_create([
+            Goal.linked_accounts.through(goal_id=goal.pk, account_id=rnd.choice(accounts_by_user[goal.user_id]))
+            for goal in goals
+            if accounts_by_user.get(goal.user_id) and rnd.random() < 0.5
+        ], batch_size=self.batch_size)
+
+        batch = []
+        for user in users:
+            for _ in range(self.transactions):
+                batch.append(self._transaction(user.pk, accounts_by_user.get(user.pk)))
+                if len(batch) >= self.batch_size:
+                    Transaction.objects.bulk_create(batch)
+                    batch = []
+        if batch:
+            Transaction.objects.bulk_create(batch)
+
+        self.counts['users'] += len(users)
+        self.counts['accounts'] += len(accounts)
+        self.counts['transactions'] += len(users) * self.transactions
+        self.counts['goals'] += len(goals)
+        self.counts['budget_categories'] += len(users) * self.categories
+        return [user.pk for user in users]
+
+    def _transaction(self, user_id, account_ids):
+        rnd = self.random
+        date = self.now - timedelta(seconds=rnd.uniform(0, self.days * 86400))
+        account_id = rnd.choice(account_ids) if account_ids and rnd.random() < 0.9 else None
+        if rnd.random() < INCOME_SHARE:
+            return Transaction(
+                user_id=user_id, account_id=account_id, date=date,
+                name=rnd.choice(INCOME_NAMES), transaction_type='income', category='доход',
+                amount=_money(rnd.lognormvariate(10.8, 0.5)),
+            )
+        category = rnd.choices(self.expense_categories, weights=self.expense_weights)[0]
+        _, _, names, mu, sigma, _ = EXPENSE_CATEGORIES[category]
+        return Transaction(
+            user_id=user_id, account_id=account_id, date=date,
+            name=rnd.choice(names), transaction_type='expense', category=category,
+            amount=_money(rnd.lognormvariate(mu, sigma)),
+        )
+
+
+def delete_synthetic_data(prefix=SYNTHETIC_PREFIX):
+    """Удаляет синтетических пользователей по одному (со всеми данными). Возвращает их число"""
+    user_ids = list(User.objects.filter(username__startswith=prefix).values_list('pk', flat=True))
+    for user_id in user_ids:
+        with db_transaction.atomic():
+            User.objects.filter(pk=user_id).delete()
+    return len(user_ids)
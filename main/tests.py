@@ -1,18 +1,41 @@
 """
 Тесты для системы блокировки аккаунтов
 """
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
+from unittest import mock, skipUnless
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.utils import timezone
-from main.models import UserProfile
-from datetime import timedelta
+from main.models import UserProfile, Account, Transaction, Goal, UserBalance, MonthlyCategoryRollup
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+import json
+import time
 
+try:
+    import PIL
+except ImportError:
+    PIL = None
+
+
+def solved_captcha():
+    """Поля формы с правильно собранным пазлом новой капчи"""
+    from main.captcha_utils import get_captcha_pieces
+
+    pieces = get_captcha_pieces()
+    return {
+        'captcha_token': pieces.token,
+        'captcha_answer': ','.join(piece['id'] for piece in sorted(pieces, key=lambda piece: piece['number'])),
+    }
 
 class AccountBlockingTests(TestCase):
     """Тесты функциональности блокировки аккаунтов"""
     
     def setUp(self):
         """Подготовка к тестам"""
+        # Счетчики ограничения частоты входа живут в кеше между тестами
+        cache.clear()
         self.client = Client()
         self.user = User.objects.create_user(
             username='testuser',
@@ -34,7 +57,7 @@ class AccountBlockingTests(TestCase):
         response = self.client.post('/login/', {
             'username': 'testuser',
             'password': 'wrongpassword',
-            'captcha_passed': '1'
+            **solved_captcha(),
         }, follow=True)
         
         self.profile.refresh_from_db()
@@ -47,7 +70,7 @@ class AccountBlockingTests(TestCase):
             self.client.post('/login/', {
                 'username': 'testuser',
                 'password': 'wrongpassword',
-                'captcha_passed': '1'
+                **solved_captcha(),
             })
         
         self.profile.refresh_from_db()
@@ -57,7 +80,7 @@ class AccountBlockingTests(TestCase):
         response = self.client.post('/login/', {
             'username': 'testuser',
             'password': 'correctpassword123',
-            'captcha_passed': '1'
+            **solved_captcha(),
         })
         
         self.profile.refresh_from_db()
@@ -69,7 +92,7 @@ class AccountBlockingTests(TestCase):
             self.client.post('/login/', {
                 'username': 'testuser',
                 'password': 'wrongpassword',
-                'captcha_passed': '1'
+                **solved_captcha(),
             })
         
         self.profile.refresh_from_db()
@@ -88,7 +111,7 @@ class AccountBlockingTests(TestCase):
         response = self.client.post('/login/', {
             'username': 'testuser',
             'password': 'correctpassword123',
-            'captcha_passed': '1'
+            **solved_captcha(),
         }, follow=True)
         
         self.assertIn('/account-locked/', response.request['PATH_INFO'])
@@ -132,6 +155,41 @@ class AccountBlockingTests(TestCase):
         self.assertIn('аккаунт', response.content.decode('utf-8').lower())
 
 
+    def test_failed_login_is_cheap(self):
+        """Неудачный вход: пользователь с профилем одним запросом и счетчик одним UPDATE"""
+        captcha = solved_captcha()
+        with self.assertNumQueries(2):
+            self.client.post('/login/', {'username': 'testuser', 'password': 'wrongpassword', **captcha})
+        
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.failed_login_attempts, 1)
+    
+    def test_blocked_user_rejected_before_password_check(self):
+        """Заблокированный аккаунт отклоняется без вычисления хеша пароля"""
+        self.profile.is_blocked = True
+        self.profile.save()
+        
+        with mock.patch.object(User, 'check_password') as check_password:
+            response = self.client.post('/login/', {
+                'username': 'testuser',
+                'password': 'correctpassword123',
+                **solved_captcha(),
+            })
+        
+        check_password.assert_not_called()
+        self.assertRedirects(response, '/account-locked/?username=testuser', fetch_redirect_response=False)
+    
+    def test_superuser_is_never_blocked(self):
+        """Неудачные попытки не блокируют суперюзера"""
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'adminpass123')
+        for _ in range(4):
+            self.client.post('/login/', {'username': 'admin', 'password': 'wrong', **solved_captcha()})
+        
+        admin.profile.refresh_from_db()
+        self.assertFalse(admin.profile.is_blocked)
+        self.assertEqual(admin.profile.failed_login_attempts, 0)
+
+
 class LoginViewTests(TestCase):
     """Тесты представления входа"""
     
@@ -153,7 +211,7 @@ class LoginViewTests(TestCase):
         response = self.client.post('/login/', {
             'username': 'testuser',
             'password': 'testpass123',
-            'captcha_passed': '0'
+            'captcha_answer': '',
         })
         
         self.assertEqual(response.status_code, 200)
@@ -164,3 +222,1435 @@ class LoginViewTests(TestCase):
         response = self.client.get('/register/')
         self.assertEqual(response.status_code, 200)
         self.assertIn(b'register', response.content.lower())
+
+
+class GoalProgressTests(TestCase):
+    """Тесты расчёта прогресса целей на стороне БД"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='goaluser', password='pass12345')
+        now = timezone.now()
+        Transaction.objects.create(user=self.user, name='Зарплата', amount=Decimal('1000'),
+                                   transaction_type='income', category='доход', date=now)
+        Transaction.objects.create(user=self.user, name='Обед', amount=Decimal('300'),
+                                   transaction_type='expense', category='еда', date=now)
+        self.account = Account.objects.create(user=self.user, name='Вклад', amount=Decimal('500'))
+        self.goal = Goal.objects.create(user=self.user, name='Отпуск', target_amount=Decimal('2400'))
+        self.goal.linked_accounts.add(self.account)
+
+    def test_with_progress_matches_calculated_amount(self):
+        """Аннотации with_progress() дают тот же результат, что и расчёт без них"""
+        plain = Goal.objects.get(pk=self.goal.pk)
+        annotated = Goal.objects.with_progress().get(pk=self.goal.pk)
+
+        self.assertEqual(plain.calculated_amount, Decimal('1200'))
+        self.assertEqual(annotated.calculated_amount, Decimal('1200'))
+        self.assertEqual(annotated.progress_percent, 50)
+
+    def test_only_linked_accounts(self):
+        """При use_only_linked_accounts учитываются только подключённые счета"""
+        Goal.objects.filter(pk=self.goal.pk).update(use_only_linked_accounts=True)
+        annotated = Goal.objects.with_progress().get(pk=self.goal.pk)
+        self.assertEqual(annotated.calculated_amount, Decimal('500'))
+
+    def test_with_progress_uses_single_query(self):
+        """Прогресс всех целей считается без дополнительных запросов"""
+        Goal.objects.create(user=self.user, name='Машина', target_amount=Decimal('10000'))
+        with self.assertNumQueries(1):
+            percents = [g.progress_percent for g in Goal.objects.with_progress()]
+        self.assertEqual(sorted(percents), [7, 50])
+
+
+class UserBalanceTests(TestCase):
+    """Тесты инкрементального баланса пользователя"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='balanceuser', password='pass12345')
+
+    def _balance(self):
+        return UserBalance.objects.get(user=self.user)
+
+    def test_balance_follows_transaction_changes(self):
+        """Создание, изменение и удаление транзакций обновляют баланс"""
+        now = timezone.now()
+        income = Transaction.objects.create(user=self.user, name='Зарплата', amount=Decimal('1000'),
+                                            transaction_type='income', category='доход', date=now)
+        expense = Transaction.objects.create(user=self.user, name='Такси', amount=Decimal('200'),
+                                             transaction_type='expense', category='транспорт', date=now)
+        balance = self._balance()
+        self.assertEqual(balance.free_money, Decimal('800'))
+        self.assertEqual(balance.transactions_count, 2)
+
+        expense.amount = Decimal('250')
+        expense.save()
+        income.transaction_type = 'expense'
+        income.save()
+        balance = self._balance()
+        self.assertEqual(balance.total_income, Decimal('0'))
+        self.assertEqual(balance.total_expense, Decimal('1250'))
+
+        expense.delete()
+        balance = self._balance()
+        self.assertEqual(balance.total_expense, Decimal('1000'))
+        self.assertEqual(balance.transactions_count, 1)
+
+    def test_balance_follows_account_changes(self):
+        """Суммы по счетам учитываются в accounts_total"""
+        account = Account.objects.create(user=self.user, name='Карта', amount=Decimal('300'))
+        Account.objects.create(user=self.user, name='Наличные', amount=Decimal('50'))
+        account.amount = Decimal('100')
+        account.save()
+        self.assertEqual(self._balance().accounts_total, Decimal('150'))
+
+        account.delete()
+        self.assertEqual(self._balance().accounts_total, Decimal('50'))
+
+    def test_save_does_not_reread_previous_values(self):
+        """Предыдущие значения берутся из загруженного объекта, без SELECT строки перед UPDATE"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        account = Account.objects.create(user=self.user, name='Карта', amount=Decimal('300'))
+        Transaction.objects.create(user=self.user, name='Такси', amount=Decimal('200'),
+                                   transaction_type='expense', category='транспорт', date=timezone.now())
+        expense = Transaction.objects.get(user=self.user)
+        expense.amount = 250.5
+        with CaptureQueriesContext(connection) as queries:
+            expense.save()
+        self.assertFalse([q for q in queries.captured_queries
+                          if q['sql'].startswith('SELECT') and 'FROM "main_transaction"' in q['sql']])
+
+        # Повторное сохранение того же объекта вычитает уже сохранённую сумму
+        expense.amount = Decimal('100')
+        expense.save()
+        account.amount = Decimal('120')
+        account.save()
+        # Отложенные поля дочитываются из БД
+        partial = Account.objects.only('name').get(pk=account.pk)
+        partial.amount = Decimal('80')
+        partial.save()
+
+        balance = self._balance()
+        self.assertEqual(balance.total_expense, Decimal('100'))
+        self.assertEqual(balance.accounts_total, Decimal('80'))
+        self.assertEqual(MonthlyCategoryRollup.objects.get(user=self.user).total, Decimal('100'))
+
+    def test_user_deletion_cascades(self):
+        """Удаление пользователя не оставляет «осиротевший» баланс"""
+        Transaction.objects.create(user=self.user, name='Кофе', amount=Decimal('5'),
+                                   transaction_type='expense', date=timezone.now())
+        self.user.delete()
+        self.assertFalse(UserBalance.objects.exists())
+
+    def test_user_deletion_skips_balance_updates(self):
+        """При каскадном удалении пользователя баланс и итоги не обновляются построчно"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        other = User.objects.create_user(username='keeper', password='pass12345')
+        for user in (self.user, other):
+            Account.objects.create(user=user, name='Карта', amount=Decimal('10'))
+            for i in range(5):
+                Transaction.objects.create(user=user, name=f'Кофе {i}', amount=Decimal('5'),
+                                           transaction_type='expense', date=timezone.now())
+
+        with CaptureQueriesContext(connection) as queries:
+            self.user.delete()
+        self.assertFalse([q for q in queries.captured_queries
+                          if q['sql'].startswith('UPDATE "main_userbalance"')
+                          or q['sql'].startswith('UPDATE "main_monthlycategoryrollup"')])
+        self.assertFalse(MonthlyCategoryRollup.objects.filter(user_id=self.user.pk).exists())
+
+        # Удаление отдельной строки по-прежнему вычитается из баланса и итогов
+        Transaction.objects.filter(user=other).first().delete()
+        balance = UserBalance.objects.get(user=other)
+        self.assertEqual((balance.total_expense, balance.transactions_count), (Decimal('20'), 4))
+        self.assertEqual(MonthlyCategoryRollup.objects.get(user=other).total, Decimal('20'))
+
+    def test_rebuild_command_repairs_drift(self):
+        """Команда rebuild_balances находит и исправляет расхождения"""
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+
+        Transaction.objects.create(user=self.user, name='Бонус', amount=Decimal('70'),
+                                   transaction_type='income', date=timezone.now())
+        UserBalance.objects.filter(user=self.user).update(total_income=Decimal('1'))
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_balances', verify=True, stdout=StringIO())
+
+        call_command('rebuild_balances', stdout=StringIO())
+        self.assertEqual(self._balance().total_income, Decimal('70'))
+        call_command('rebuild_balances', verify=True, stdout=StringIO())
+
+
+class MonthlyCategoryRollupTests(TestCase):
+    """Тесты помесячных итогов по категориям"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='rollupuser', password='pass12345')
+        self.january = timezone.make_aware(datetime(2025, 1, 15, 12, 0))
+        self.february = timezone.make_aware(datetime(2025, 2, 3, 12, 0))
+
+    def _rollup(self, month, category, transaction_type='expense'):
+        return MonthlyCategoryRollup.objects.filter(
+            user=self.user, month=month, category=category, transaction_type=transaction_type
+        ).values_list('total', 'transactions_count').first()
+
+    def test_rollup_follows_transaction_changes(self):
+        """Итоги переносятся между месяцами и категориями при изменении транзакции"""
+        tx = Transaction.objects.create(user=self.user, name='Продукты', amount=Decimal('100'),
+                                        transaction_type='expense', category='еда', date=self.january)
+        Transaction.objects.create(user=self.user, name='Кафе', amount=Decimal('50'),
+                                   transaction_type='expense', category='еда', date=self.january)
+        self.assertEqual(self._rollup(date(2025, 1, 1), 'еда'), (Decimal('150'), 2))
+
+        tx.date = self.february
+        tx.category = 'развлечения'
+        tx.save()
+        self.assertEqual(self._rollup(date(2025, 1, 1), 'еда'), (Decimal('50'), 1))
+        self.assertEqual(self._rollup(date(2025, 2, 1), 'развлечения'), (Decimal('100'), 1))
+
+        tx.delete()
+        self.assertIsNone(self._rollup(date(2025, 2, 1), 'развлечения'))
+
+    def test_rebuild_command_matches_incremental_state(self):
+        """Пересчёт с нуля совпадает с инкрементально накопленными итогами"""
+        from django.core.management import call_command
+
+        for day in (1, 2, 3):
+            Transaction.objects.create(user=self.user, name='Зарплата', amount=Decimal('10'),
+                                       transaction_type='income', category='доход',
+                                       date=self.january.replace(day=day))
+        call_command('rebuild_rollups', verify=True, stdout=StringIO())
+
+        MonthlyCategoryRollup.objects.all().delete()
+        call_command('rebuild_rollups', stdout=StringIO())
+        self.assertEqual(MonthlyCategoryRollup.objects.get().transactions_count, 3)
+
+
+class BulkJsonImportTests(TestCase):
+    """Тесты массового импорта JSON"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='importuser', password='pass12345')
+
+    def _payload(self, transactions_count):
+        return json.dumps({
+            'accounts': [{'name': 'Карта', 'amount': 1000, 'account_type': 'debit'}],
+            'transactions': [
+                {
+                    'name': f'Покупка {i}',
+                    'amount': 10 + i % 7,
+                    'transaction_type': 'expense' if i % 3 else 'income',
+                    'category': 'еда' if i % 3 else 'доход',
+                    'date': f'2025-0{1 + i % 9}-15T12:00:00',
+                }
+                for i in range(transactions_count)
+            ],
+            'goals': [{'name': 'Отпуск', 'target_amount': 50000}],
+            'budget_categories': [{'name': 'еда', 'budget': 5000}, {'name': 'еда', 'budget': 1}],
+        })
+
+    def test_bulk_import_reports_row_errors(self):
+        """Некорректные строки попадают в errors, остальные импортируются"""
+        from main.json_utils import import_user_data_from_json
+
+        payload = json.dumps({'transactions': [
+            {'name': 'Кофе', 'amount': 5, 'transaction_type': 'expense', 'category': 'еда'},
+            {'name': 'Ошибка', 'amount': -1},
+            {'name': 'Без типа', 'amount': 5, 'transaction_type': 'refund'},
+        ]})
+        result = import_user_data_from_json(payload, self.user, bulk=True)
+
+        self.assertTrue(result['success'])
+        self.assertEqual(result['results']['transactions']['created'], 1)
+        errors = result['results']['transactions']['errors']
+        self.assertEqual(len(errors), 2)
+        self.assertTrue(errors[0].startswith('Строка 2:'))
+        self.assertEqual(UserBalance.objects.get(user=self.user).total_expense, Decimal('5'))
+
+    def test_bulk_import_matches_row_mode(self):
+        """Оба режима создают одинаковые данные и пересчитывают сводные таблицы"""
+        from django.core.management import call_command
+        from main.json_utils import import_user_data_from_json
+
+        other = User.objects.create_user(username='rowuser', password='pass12345')
+        bulk = import_user_data_from_json(self._payload(50), self.user, bulk=True)
+        rows = import_user_data_from_json(self._payload(50), other)
+
+        self.assertEqual(bulk['results'], rows['results'])
+        self.assertEqual(
+            UserBalance.objects.get(user=self.user).free_money,
+            UserBalance.objects.get(user=other).free_money,
+        )
+        call_command('rebuild_balances', verify=True, stdout=StringIO())
+        call_command('rebuild_rollups', verify=True, stdout=StringIO())
+
+    def test_bulk_import_batches_inserts(self):
+        """Массовый импорт вставляет строки пачками: INSERT-ов O(строк / batch_size)"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from main.json_utils import import_user_data_from_json
+
+        rows = 3000
+        payload = self._payload(rows)
+
+        with CaptureQueriesContext(connection) as queries:
+            result = import_user_data_from_json(payload, self.user, bulk=True, batch_size=500)
+        self.assertEqual(result['results']['transactions']['created'], rows)
+
+        inserts = [q for q in queries.captured_queries if q['sql'].startswith('INSERT INTO "main_transaction"')]
+        # SQLite дробит пачки по лимиту параметров, поэтому оцениваем порядок величины
+        self.assertGreaterEqual(len(inserts), rows // 500)
+        self.assertLess(len(inserts), rows // 20)
+        self.assertLess(len(queries), rows // 20)
+
+    def test_stream_import_matches_bulk_mode(self):
+        """Потоковый импорт даёт тот же результат, что и массовый"""
+        from io import BytesIO
+        from main.json_utils import import_user_data_from_json, import_user_data_from_stream
+
+        other = User.objects.create_user(username='streamuser', password='pass12345')
+        payload = self._payload(120)
+        bulk = import_user_data_from_json(payload, self.user, bulk=True)
+        stream = import_user_data_from_stream(BytesIO(payload.encode('utf-8')), other,
+                                              batch_size=25, chunk_size=97)
+
+        self.assertTrue(stream['success'])
+        self.assertEqual(bulk['results'], stream['results'])
+        self.assertEqual(Transaction.objects.filter(user=other).count(), 120)
+
+    def test_stream_import_rolls_back_on_bad_structure(self):
+        """Ошибка структуры в конце файла откатывает уже вставленные строки"""
+        from main.json_utils import import_user_data_from_stream
+
+        payload = json.dumps({
+            'transactions': [{'name': 'Кофе', 'amount': 5}] * 10,
+            'unexpected': [],
+        })
+        result = import_user_data_from_stream(StringIO(payload), self.user, batch_size=3)
+
+        self.assertFalse(result['success'])
+        self.assertIn('unexpected', result['error'])
+        self.assertEqual(result['results']['transactions']['created'], 0)
+        self.assertFalse(Transaction.objects.filter(user=self.user).exists())
+
+    def test_import_view_streams_uploaded_file(self):
+        """POST /api/import-json/ передаёт загруженный файл потоковому импорту"""
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        client = Client()
+        client.force_login(self.user)
+        upload = SimpleUploadedFile('export.json', self._payload(40).encode('utf-8'), 'application/json')
+        response = client.post('/api/import-json/', {'json_file': upload})
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(data['success'])
+        self.assertEqual(data['results']['transactions']['created'], 40)
+        self.assertEqual(data['results']['budget_categories']['errors'][0][:8], 'Строка 2')
+        self.assertEqual(Transaction.objects.filter(user=self.user).count(), 40)
+
+    def test_import_view_accepts_own_export(self):
+        """Файл /api/export-json/ (с полями user и exported_at) импортируется обратно"""
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from main.json_utils import import_user_data_from_json
+
+        import_user_data_from_json(self._payload(15), self.user, bulk=True)
+        client = Client()
+        client.force_login(self.user)
+        exported = b''.join(client.get('/api/export-json/').streaming_content)
+
+        other = User.objects.create_user(username='restored', password='pass12345')
+        client.force_login(other)
+        response = client.post('/api/import-json/', {
+            'json_file': SimpleUploadedFile('export.json', exported, 'application/json'),
+        })
+
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(Transaction.objects.filter(user=other).count(), 15)
+        self.assertEqual(Account.objects.filter(user=other).count(), 1)
+
+    def test_import_view_rejects_bad_requests(self):
+        """Без файла или с битым JSON импорт отвечает 400, анонимный — редирект"""
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        client = Client()
+        self.assertEqual(client.post('/api/import-json/').status_code, 302)
+
+        client.force_login(self.user)
+        self.assertEqual(client.get('/api/import-json/').status_code, 405)
+        response = client.post('/api/import-json/')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.json()['success'])
+
+        upload = SimpleUploadedFile('broken.json', b'{"transactions": [', 'application/json')
+        response = client.post('/api/import-json/', {'json_file': upload})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('JSON', response.json()['error'])
+
+
+class JsonExportTests(TestCase):
+    """Тесты потокового экспорта данных в JSON"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='exporter', password='pass12345')
+        account = Account.objects.create(user=self.user, name='Карта', amount=Decimal('100.50'))
+        for i in range(5):
+            Transaction.objects.create(
+                user=self.user, account=account, name=f'Покупка {i}', amount=Decimal('10'),
+                transaction_type='expense', category='еда', date=timezone.now(),
+            )
+        Goal.objects.create(user=self.user, name='Отпуск', target_amount=Decimal('5000'))
+
+    def test_export_matches_legacy_format(self):
+        """Потоковый экспорт совпадает с json.dumps(indent=2) того же словаря"""
+        from main.json_utils import export_user_data_to_json, iter_user_data_json
+
+        exported = export_user_data_to_json(self.user)
+        data = json.loads(exported)
+
+        self.assertEqual(exported, json.dumps(data, ensure_ascii=False, indent=2))
+        self.assertEqual(data['user'], 'exporter')
+        self.assertEqual(data['accounts'][0]['amount'], '100.50')
+        self.assertEqual(len(data['transactions']), 5)
+        self.assertEqual(data['budget_categories'], [])
+        self.assertGreater(len(list(iter_user_data_json(self.user, chunk_size=2))), 5)
+
+    def test_export_view_streams_optionally_gzipped(self):
+        """Представление отдаёт файл потоково, ?gzip=1 — в сжатом виде"""
+        import gzip
+
+        self.client.force_login(self.user)
+        response = self.client.get('/api/export-json/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertIn('.json"', response['Content-Disposition'])
+        plain = b''.join(response.streaming_content)
+        self.assertEqual(json.loads(plain)['user'], 'exporter')
+
+        response = self.client.get('/api/export-json/?gzip=1')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('.json.gz"', response['Content-Disposition'])
+        data = json.loads(gzip.decompress(b''.join(response.streaming_content)))
+        self.assertEqual(len(data['transactions']), 5)
+
+
+class BackupStreamingTests(TestCase):
+    """Тесты потоковой выгрузки SQL бэкапов"""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='root', password='pass12345')
+        self.user = User.objects.create_user(username='owner', password='pass12345')
+        account = Account.objects.create(user=self.user, name="Карта O'Neil", amount=Decimal('10'))
+        for i in range(7):
+            Transaction.objects.create(
+                user=self.user, account=account, name=f'Покупка {i}', amount=Decimal('1'),
+                transaction_type='expense', category='еда', date=timezone.now(),
+            )
+        self.client.force_login(self.admin)
+
+    def test_backup_generator_reads_tables_in_chunks(self):
+        """Бэкап строится генератором, каждая строка заканчивается переводом строки"""
+        from main.backup_utils import generate_sql_backup_all
+
+        lines = list(generate_sql_backup_all(chunk_size=3))
+
+        self.assertTrue(all(line.endswith('\n') for line in lines))
+        self.assertEqual(sum(line.startswith('INSERT INTO main_transaction ') for line in lines), 7)
+        self.assertIn("'Карта O''Neil'", ''.join(lines))
+        self.assertEqual(lines[-1], 'COMMIT;\n')
+
+    def test_boolean_literals(self):
+        """Булевы поля выгружаются как TRUE/FALSE: PostgreSQL не принимает 1/0 для boolean"""
+        from main.backup_utils import BackupWriter, copy_literal, sql_literal
+
+        self.assertEqual((sql_literal(True), sql_literal(False)), ('TRUE', 'FALSE'))
+        self.assertEqual((copy_literal(True), copy_literal(False)), ('t', 'f'))
+        lines = ''.join(BackupWriter('batch').section(
+            'USERS', 'auth_user', User.objects.filter(pk=self.user.pk),
+        ))
+        # is_superuser, is_staff и is_active
+        self.assertIn(", FALSE, 'owner', ", lines)
+        self.assertIn(", FALSE, TRUE, ", lines)
+
+    def test_full_backup_view_streams_gzip(self):
+        """Полный бэкап отдаётся StreamingHttpResponse, ?gzip=1 сжимает поток"""
+        import gzip
+
+        response = self.client.get('/admin/backup/full/')
+        self.assertTrue(response.streaming)
+        plain = b''.join(response.streaming_content).decode('utf-8')
+        self.assertIn('INSERT INTO auth_user ', plain)
+
+        response = self.client.get('/admin/backup/full/?gzip=1')
+        self.assertTrue(response.streaming)
+        self.assertIn('.sql.gz"', response['Content-Disposition'])
+        unpacked = gzip.decompress(b''.join(response.streaming_content)).decode('utf-8')
+        self.assertEqual(unpacked.split('\n')[3:], plain.split('\n')[3:])
+
+    def test_user_backup_view(self):
+        """Бэкап пользователя содержит только его данные, для неизвестного id — 404"""
+        response = self.client.get(f'/admin/backup/user/{self.user.id}/')
+        content = b''.join(response.streaming_content).decode('utf-8')
+
+        self.assertIn('-- User: owner', content)
+        self.assertEqual(content.count('INSERT INTO auth_user '), 1)
+        self.assertEqual(self.client.get('/admin/backup/user/999999/').status_code, 404)
+
+    def _restore_into_sqlite(self, *scripts):
+        """Выполняет бэкапы по порядку в пустой SQLite базе и возвращает содержимое таблиц"""
+        import sqlite3
+        from main.backup_utils import BACKUP_TABLES
+
+        db = sqlite3.connect(':memory:')
+        for table, (columns, _) in BACKUP_TABLES.items():
+            db.execute(f"CREATE TABLE {table} ({', '.join(columns)})")
+        for script in scripts:
+            db.executescript(script)
+        return {
+            table: db.execute(f'SELECT * FROM {table} ORDER BY id').fetchall()
+            for table in BACKUP_TABLES
+        }
+
+    def test_batched_inserts_restore_same_data(self):
+        """Пакетный INSERT восстанавливает те же строки меньшим числом инструкций"""
+        from main.backup_utils import generate_sql_backup_all
+
+        rows = ''.join(generate_sql_backup_all())
+        batched = ''.join(generate_sql_backup_all(format='batch', batch_size=3))
+
+        self.assertEqual(batched.count('INSERT INTO main_transaction '), 3)
+        self.assertLess(len(batched), len(rows))
+        self.assertEqual(self._restore_into_sqlite(batched), self._restore_into_sqlite(rows))
+
+    def test_copy_format_escapes_values(self):
+        """COPY: NULL как \\N, спецсимволы экранированы, блок закрыт \\."""
+        from main.backup_utils import generate_sql_backup_by_user
+
+        Transaction.objects.filter(user=self.user).update(account=None, name='a\tb\\c')
+        lines = ''.join(generate_sql_backup_by_user(self.user, format='copy')).split('\n')
+
+        start = lines.index(
+            'COPY main_transaction (id, user_id, name, amount, transaction_type, category, '
+            'date, account_id, created_at, updated_at) FROM stdin;'
+        )
+        data = lines[start + 1:start + 8]
+        self.assertEqual(lines[start + 8], '\\.')
+        fields = data[0].split('\t')
+        self.assertEqual(fields[2], 'a\\tb\\\\c')
+        self.assertEqual(fields[7], '\\N')
+
+    def test_backup_view_rejects_unknown_format(self):
+        """Неизвестный формат или размер пачки — 400"""
+        self.assertEqual(self.client.get('/admin/backup/full/?format=xml').status_code, 400)
+        self.assertEqual(self.client.get('/admin/backup/full/?format=batch&batch_size=0').status_code, 400)
+        response = self.client.get('/admin/backup/full/?format=copy')
+        self.assertIn('FROM stdin;', b''.join(response.streaming_content).decode('utf-8'))
+
+    def test_incremental_backup_chain_restores_current_state(self):
+        """Полный бэкап + инкрементальный дают то же, что свежий полный бэкап"""
+        from main.backup_utils import generate_sql_backup_all, generate_sql_backup_incremental
+        from main.models import BackupRun
+
+        # Старые строки не должны попадать в инкрементальный бэкап
+        old = timezone.now() - timedelta(days=1)
+        for model in (Account, Transaction, UserProfile):
+            model.objects.update(updated_at=old)
+        User.objects.update(date_joined=old)
+
+        full = ''.join(generate_sql_backup_all())
+        base = BackupRun.objects.get()
+        self.assertEqual(base.kind, 'full')
+
+        Transaction.objects.filter(user=self.user).first().delete()
+        account = Account.objects.get(user=self.user)
+        account.amount = Decimal('99')
+        account.save()
+        Transaction.objects.create(
+            user=self.user, account=account, name='Новая', amount=Decimal('3'),
+            transaction_type='income', category='доход', date=timezone.now(),
+        )
+
+        incremental = ''.join(generate_sql_backup_incremental(format='batch'))
+        run = BackupRun.objects.first()
+        self.assertEqual((run.kind, run.base, run.since), ('incremental', base, base.watermark))
+        self.assertEqual(run.tombstones_count, 1)
+        self.assertEqual(run.rows_count, 2)
+        self.assertEqual(incremental.count('INSERT INTO '), 2)
+
+        self.assertEqual(
+            self._restore_into_sqlite(full, incremental),
+            self._restore_into_sqlite(''.join(generate_sql_backup_all())),
+        )
+
+    def test_user_deletion_writes_tombstones_in_bulk(self):
+        """Удаление пользователя пишет надгробия одним INSERT на таблицу, инкрементальный бэкап их применяет"""
+        from django.db import connection
+        from django.db.models import Count
+        from django.test.utils import CaptureQueriesContext
+        from main.backup_utils import generate_sql_backup_all, generate_sql_backup_incremental
+        from main.models import DeletedRecord
+
+        full = ''.join(generate_sql_backup_all())
+        with CaptureQueriesContext(connection) as queries:
+            self.user.delete()
+
+        inserts = [q for q in queries.captured_queries if q['sql'].startswith('INSERT INTO "main_deletedrecord"')]
+        self.assertEqual(len(inserts), 6)
+        self.assertEqual(
+            dict(DeletedRecord.objects.values_list('table').annotate(count=Count('id')).order_by()),
+            {'auth_user': 1, 'main_userprofile': 1, 'main_account': 1, 'main_transaction': 7},
+        )
+
+        incremental = ''.join(generate_sql_backup_incremental())
+        self.assertEqual(
+            self._restore_into_sqlite(full, incremental),
+            self._restore_into_sqlite(''.join(generate_sql_backup_all())),
+        )
+
+    def test_full_backup_prunes_old_runs_and_tombstones(self):
+        """Новый полный бэкап удаляет запуски и надгробия старше keep_full полных бэкапов"""
+        from main.backup_utils import BACKUP_KEEP_FULL, generate_sql_backup_all, prune_backup_history
+        from main.models import BackupRun, DeletedRecord
+
+        now = timezone.now()
+        days = [now - timedelta(days=d) for d in range(10, 0, -1)]
+        old_full = BackupRun.objects.create(kind='full', watermark=days[0])
+        BackupRun.objects.create(kind='incremental', base=old_full, since=days[0], watermark=days[1])
+        kept = BackupRun.objects.create(kind='full', watermark=days[2])
+        kept_increment = BackupRun.objects.create(kind='incremental', base=kept, since=days[2], watermark=days[3])
+        DeletedRecord.objects.create(table='main_transaction', object_id=1, deleted_at=days[1])
+        DeletedRecord.objects.create(table='main_transaction', object_id=2, deleted_at=days[2] - timedelta(minutes=1))
+        DeletedRecord.objects.create(table='main_transaction', object_id=3, deleted_at=days[3])
+
+        # Пока полных бэкапов не больше BACKUP_KEEP_FULL, удалять нечего
+        self.assertEqual(prune_backup_history(keep_full=3), (0, 0))
+        for _ in range(BACKUP_KEEP_FULL - 1):
+            ''.join(generate_sql_backup_all())
+
+        self.assertEqual(BackupRun.objects.filter(kind='full').count(), BACKUP_KEEP_FULL)
+        self.assertEqual(BackupRun.objects.filter(pk__in=[kept.pk, kept_increment.pk]).count(), 2)
+        self.assertFalse(BackupRun.objects.filter(watermark__lt=kept.watermark).exists())
+        # Надгробие за минуту до водяного знака попадает в запас перекрытия
+        self.assertEqual(sorted(DeletedRecord.objects.values_list('object_id', flat=True)), [2, 3])
+
+    def test_incremental_backup_view_requires_base(self):
+        """Без полного бэкапа инкрементальный недоступен"""
+        self.assertEqual(self.client.get('/admin/backup/incremental/').status_code, 400)
+        b''.join(self.client.get('/admin/backup/full/').streaming_content)
+        response = self.client.get('/admin/backup/incremental/?gzip=1')
+        self.assertTrue(response.streaming)
+        self.assertEqual(self.client.get('/admin/backup/incremental/?base=999').status_code, 404)
+
+    def test_parallel_backup_command_writes_manifest(self):
+        """backup_parallel: части по таблицам и диапазонам id, манифест с числом строк и SHA-256"""
+        import gzip
+        import hashlib
+        import os
+        import tempfile
+        from django.core.management import call_command
+        from main.backup_utils import generate_sql_backup_all
+        from main.models import BackupRun
+
+        with tempfile.TemporaryDirectory() as directory:
+            call_command('backup_parallel', directory, workers=1, partition_size=3,
+                         format='batch', stdout=StringIO())
+            with open(os.path.join(directory, 'manifest.json'), encoding='utf-8') as f:
+                manifest = json.load(f)
+
+            parts = [part for part in manifest['files'] if part['table'] == 'main_transaction']
+            self.assertEqual(len(parts), 3)
+            self.assertEqual(sum(part['rows'] for part in parts), 7)
+            self.assertEqual(manifest['total_rows'], 2 + 2 + 1 + 7)
+
+            scripts = []
+            for part in manifest['files']:
+                path = os.path.join(directory, part['file'])
+                with open(path, 'rb') as f:
+                    self.assertEqual(hashlib.sha256(f.read()).hexdigest(), part['sha256'])
+                with gzip.open(path, 'rt', encoding='utf-8') as f:
+                    scripts.append(f.read())
+
+        self.assertEqual(
+            self._restore_into_sqlite(*scripts),
+            self._restore_into_sqlite(''.join(generate_sql_backup_all())),
+        )
+        self.assertTrue(BackupRun.objects.filter(kind='full', rows_count=12).exists())
+
+    def test_parallel_backup_in_process_with_snapshot(self):
+        """--workers 1 со снимком: части выгружаются в уже открытой транзакции без SET TRANSACTION"""
+        import os
+        import tempfile
+        from django.core.management import call_command
+        from main.backup_utils import dump_backup_part
+        from main.management.commands.backup_parallel import Command
+
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch.object(Command, 'export_snapshot', return_value='00000003-0000001B-1'), \
+                mock.patch('main.management.commands.backup_parallel.dump_backup_part',
+                           wraps=dump_backup_part) as dump:
+            call_command('backup_parallel', directory, workers=1, partition_size=3, stdout=StringIO())
+            with open(os.path.join(directory, 'manifest.json'), encoding='utf-8') as f:
+                manifest = json.load(f)
+
+        self.assertTrue(manifest['consistent_snapshot'])
+        self.assertEqual(manifest['total_rows'], 12)
+        self.assertTrue(dump.called)
+        self.assertTrue(all(call.kwargs['snapshot'] is None for call in dump.call_args_list))
+
+
+class QueryCountRegressionTests(TestCase):
+    """Число запросов бэкапа и списков админки не должно расти с числом пользователей"""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='root', password='pass12345')
+        self.client.force_login(self.admin)
+
+    def _add_users(self, count):
+        start = User.objects.count()
+        for i in range(start, start + count):
+            user = User.objects.create_user(username=f'user{i}', password='pass12345')
+            account = Account.objects.create(user=user, name='Карта', amount=Decimal('1'))
+            Transaction.objects.create(
+                user=user, account=account, name='Кофе', amount=Decimal('1'),
+                transaction_type='expense', category='еда', date=timezone.now(),
+            )
+
+    def _queries(self, action):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            action()
+        return len(queries)
+
+    def _assert_constant(self, action):
+        self._add_users(2)
+        few = self._queries(action)
+        self._add_users(10)
+        self.assertEqual(self._queries(action), few)
+
+    def test_full_backup_queries_do_not_depend_on_users(self):
+        """Профили выгружаются одним запросом, а не user.profile на каждого"""
+        from main.backup_utils import generate_sql_backup_all
+
+        self._assert_constant(lambda: ''.join(generate_sql_backup_all()))
+
+    def test_user_changelist_queries_do_not_depend_on_users(self):
+        """Статус блокировки в списке пользователей не делает запрос на строку"""
+        self._assert_constant(lambda: self.client.get('/admin/auth/user/'))
+
+    def test_transaction_changelist_queries_do_not_depend_on_rows(self):
+        """Пользователь и счёт в списке транзакций подгружаются одним запросом"""
+        self._assert_constant(lambda: self.client.get('/admin/main/transaction/'))
+
+
+class AdminStatsTests(TestCase):
+    """Тесты предварительно собранной статистики админки"""
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.admin = User.objects.create_superuser(username='root', password='pass12345')
+        self.user = User.objects.create_user(username='spender', password='pass12345')
+        for i in range(3):
+            Transaction.objects.create(
+                user=self.user, name='Кофе', amount=Decimal('2'),
+                transaction_type='expense', category='еда', date=timezone.now() - timedelta(days=i),
+            )
+        self.client.force_login(self.admin)
+
+    def test_command_collects_snapshot(self):
+        """collect_admin_stats сохраняет счётчики, объём по дням и топ пользователей"""
+        from django.core.management import call_command
+        from main.models import AdminStatsSnapshot
+
+        for _ in range(3):
+            call_command('collect_admin_stats', keep=2, stdout=StringIO())
+
+        self.assertEqual(AdminStatsSnapshot.objects.count(), 2)
+        data = AdminStatsSnapshot.objects.first().data
+        self.assertEqual(data['users_count'], 2)
+        self.assertEqual(data['transactions_count'], 3)
+        self.assertEqual(sum(day['count'] for day in data['daily_volume']), 3)
+        self.assertEqual(data['top_users'][0], {'username': 'spender', 'transactions_count': 3})
+
+    def test_index_does_not_count_tables_per_request(self):
+        """Главная страница админки читает снимок, а не считает строки таблиц"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from main.stats_utils import refresh_admin_stats
+
+        refresh_admin_stats()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/admin/')
+
+        self.assertContains(response, 'Самые активные пользователи')
+        self.assertContains(response, 'spender')
+        self.assertFalse([q for q in queries if 'COUNT(' in q['sql'].upper()])
+
+
+class SqlPanelTests(TestCase):
+    """Тесты ограничений SQL панели: страницы, таймаут, CSV"""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='root', password='pass12345')
+        Transaction.objects.bulk_create([
+            Transaction(
+                user=self.admin, name=f'Строка {i}', amount=Decimal('1'),
+                transaction_type='expense', category='еда', date=timezone.now(),
+            )
+            for i in range(25)
+        ])
+        self.client.force_login(self.admin)
+
+    def test_select_is_paged(self):
+        """SELECT возвращает не больше limit строк и смещение следующей страницы"""
+        from main.sql_utils import execute_sql_query
+
+        query = 'SELECT id FROM main_transaction ORDER BY id'
+        first = execute_sql_query(query, limit=10)
+        self.assertEqual((first['row_count'], first['has_more'], first['next_offset']), (10, True, 10))
+
+        last = execute_sql_query(query, offset=20, limit=10)
+        self.assertEqual(last['row_count'], 5)
+        self.assertFalse(last['has_more'])
+        self.assertEqual(last['rows'][0][0], first['rows'][0][0] + 20)
+        self.assertIn('elapsed_ms', last)
+
+        with self.assertRaises(ValueError):
+            execute_sql_query('DELETE FROM main_transaction', offset=10)
+
+    def test_long_query_is_interrupted(self):
+        """Запрос дольше таймаута прерывается"""
+        from django.db import OperationalError
+        from main.sql_utils import execute_sql_query
+
+        endless = 'WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT count(*) FROM n'
+        started = time.monotonic()
+        with self.assertRaises(OperationalError):
+            execute_sql_query(endless, timeout_ms=100)
+        self.assertLess(time.monotonic() - started, 5)
+
+    def test_admin_panel_pages_and_streams_csv(self):
+        """Админка показывает страницу результата и отдаёт весь результат в CSV"""
+        import csv
+
+        query = 'SELECT id, name FROM main_transaction ORDER BY id'
+        response = self.client.post('/admin/', {'query': query})
+        self.assertContains(response, 'строки 1–25')
+
+        response = self.client.post('/admin/', {'query': query, 'action': 'csv'})
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content).decode('utf-8-sig')
+        rows = list(csv.reader(StringIO(content)))
+        self.assertEqual(rows[0], ['id', 'name'])
+        self.assertEqual(len(rows), 26)
+
+        response = self.client.post('/admin/', {'query': 'DELETE FROM main_goal', 'action': 'csv'})
+        self.assertContains(response, 'только для SELECT')
+
+    def test_explain_flags_sequential_scan(self):
+        """План подсвечивает полное сканирование main_transaction, но не поиск по индексу"""
+        from main.sql_utils import explain_sql_query
+
+        plan = explain_sql_query("SELECT * FROM main_transaction WHERE name = 'Строка 1'")
+        self.assertEqual(plan['type'], 'explain')
+        self.assertTrue(any(node['seq_scan'] for node in plan['nodes']))
+        self.assertEqual(len(plan['warnings']), 1)
+
+        plan = explain_sql_query('SELECT * FROM main_transaction WHERE id = 1')
+        self.assertFalse(plan['warnings'])
+
+    def test_explain_rolls_back_changes(self):
+        """EXPLAIN выполняется в откатываемой транзакции"""
+        from main.sql_utils import explain_sql_query
+
+        explain_sql_query('DELETE FROM main_transaction')
+        self.assertEqual(Transaction.objects.count(), 25)
+
+    def test_postgres_plan_is_flattened_with_self_time(self):
+        """JSON-план PostgreSQL разворачивается в узлы с собственным временем"""
+        from main.sql_utils import _postgres_plan
+
+        plan = _postgres_plan({
+            'Plan': {
+                'Node Type': 'Hash Join', 'Actual Total Time': 10.0, 'Actual Loops': 1, 'Actual Rows': 5,
+                'Plans': [
+                    {'Node Type': 'Seq Scan', 'Relation Name': 'main_transaction',
+                     'Actual Total Time': 6.0, 'Actual Loops': 1, 'Actual Rows': 1000},
+                    {'Node Type': 'Index Scan', 'Relation Name': 'auth_user', 'Index Name': 'auth_user_pkey',
+                     'Actual Total Time': 0.5, 'Actual Loops': 2, 'Actual Rows': 1},
+                ],
+            },
+            'Planning Time': 0.2,
+            'Execution Time': 10.5,
+        })
+
+        self.assertEqual([node['depth'] for node in plan['nodes']], [0, 1, 1])
+        self.assertEqual(plan['nodes'][0]['self_ms'], 3.0)
+        self.assertEqual([node['seq_scan'] for node in plan['nodes']], [False, True, False])
+        self.assertEqual(plan['execution_ms'], 10.5)
+
+    def test_panel_keeps_slowest_query_history(self):
+        """История объединяет одинаковые запросы и хранит только самые медленные"""
+        from main.models import SlowQuery
+        from main.sql_utils import record_query_time
+
+        record_query_time('SELECT 1', 5)
+        record_query_time('SELECT   1', 15)
+        record_query_time('SELECT 2', 1, history_size=1)
+
+        self.assertEqual(SlowQuery.objects.count(), 1)
+        slow = SlowQuery.objects.get()
+        self.assertEqual((slow.query, slow.calls, slow.max_ms, slow.avg_ms), ('SELECT 1', 2, 15, 10))
+
+        response = self.client.post('/admin/', {'query': 'SELECT * FROM main_transaction', 'action': 'explain'})
+        self.assertContains(response, 'Последовательное сканирование main_transaction')
+        self.assertContains(response, 'Самые медленные запросы')
+
+    def test_timed_out_query_is_recorded(self):
+        """Запрос, прерванный по таймауту, попадает в историю со временем таймаута"""
+        from main.models import SlowQuery
+        from main.sql_utils import SQL_PANEL_TIMEOUT_MS, execute_sql_query, is_query_timeout
+
+        query = ('WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) '
+                 'SELECT count(*) FROM n')
+        with self.assertRaises(Exception) as raised:
+            execute_sql_query(query, timeout_ms=50)
+        timeout = raised.exception
+        self.assertTrue(is_query_timeout(timeout))
+        self.assertFalse(is_query_timeout(ValueError('no such table: missing')))
+
+        with mock.patch('main.admin.execute_sql_query', side_effect=timeout):
+            response = self.client.post('/admin/', {'query': query})
+        self.assertContains(response, 'interrupted')
+
+        slow = SlowQuery.objects.get()
+        self.assertEqual((slow.calls, slow.max_ms, slow.last_ms), (1, SQL_PANEL_TIMEOUT_MS, SQL_PANEL_TIMEOUT_MS))
+
+
+class RequestMetricsTests(TestCase):
+    """Тесты замеров запросов: Server-Timing, сохранение по имени URL, перцентили"""
+
+    def setUp(self):
+        from main.metrics_utils import flush_request_metrics
+        flush_request_metrics()
+
+    def test_request_is_measured_by_url_name(self):
+        """Замер сохраняется под именем URL, Server-Timing получают только сотрудники"""
+        from main.metrics_utils import flush_request_metrics
+        from main.models import RequestMetric
+
+        response = self.client.get('/login/')
+        self.assertNotIn('Server-Timing', response)
+        with self.settings(SERVER_TIMING_PUBLIC=True):
+            public = self.client.get('/account-locked/')
+        self.assertIn('db;dur=', public['Server-Timing'])
+
+        staff = User.objects.create_user(username='staff', password='pass12345', is_staff=True)
+        self.client.force_login(staff)
+        self.assertIn('total;dur=', self.client.get('/account-locked/')['Server-Timing'])
+        self.client.logout()
+
+        self.client.get('/no-such-page/')
+        flush_request_metrics()
+
+        metric = RequestMetric.objects.get(view_name='main:login')
+        self.assertEqual((metric.method, metric.status_code), ('GET', 200))
+        self.assertEqual(metric.response_bytes, len(response.content))
+        self.assertGreaterEqual(metric.duration_ms, metric.db_ms)
+        self.assertTrue(RequestMetric.objects.filter(view_name='unresolved', status_code=404).exists())
+
+    def test_counts_database_queries(self):
+        """Число SQL запросов в замере совпадает с реально выполненными"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from main.metrics_utils import flush_request_metrics
+        from main.models import RequestMetric
+
+        user = User.objects.create_user(username='measured', password='pass12345')
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/forecast/api/transactions/')
+        flush_request_metrics()
+
+        metric = RequestMetric.objects.get(view_name='forecast:api_transactions')
+        self.assertEqual(metric.db_queries, len(queries))
+
+    def test_summary_percentiles(self):
+        """Перцентили считаются отдельно для каждого имени URL"""
+        from main.metrics_utils import request_metrics_summary
+        from main.models import RequestMetric
+
+        RequestMetric.objects.bulk_create([
+            RequestMetric(view_name='forecast:api_transactions', method='GET', status_code=200,
+                          duration_ms=ms, db_ms=ms / 2, db_queries=ms % 5, response_bytes=100)
+            for ms in range(1, 101)
+        ] + [
+            RequestMetric(view_name='main:login', method='POST', status_code=500,
+                          duration_ms=1, db_ms=0, db_queries=1, response_bytes=None),
+        ])
+
+        with self.assertNumQueries(2):
+            summary = {row['view_name']: row for row in request_metrics_summary(hours=1)}
+        api = summary['forecast:api_transactions']
+        self.assertEqual((api['count'], api['p50_ms'], api['p95_ms'], api['p99_ms']), (100, 50, 95, 99))
+        self.assertEqual((api['max_queries'], api['p50_bytes']), (4, 100))
+        self.assertEqual(summary['main:login']['errors'], 1)
+        self.assertIsNone(summary['main:login']['p95_bytes'])
+
+        # Большие окна: перцентили по выборке, итоги — точные
+        with mock.patch('main.metrics_utils.METRICS_SUMMARY_SAMPLE', 20):
+            sampled = {row['view_name']: row for row in request_metrics_summary(hours=1)}
+        self.assertEqual(sampled['forecast:api_transactions']['count'], 100)
+        self.assertEqual(sampled['forecast:api_transactions']['max_ms'], 100)
+        self.assertAlmostEqual(sampled['forecast:api_transactions']['p50_ms'], 50, delta=10)
+
+    def test_requests_do_not_write_metrics(self):
+        """Запрос пользователя не пишет замеры в БД, это делает фоновый поток"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from main import metrics_utils
+
+        with self.settings(REQUEST_METRICS_WRITER=True), \
+                mock.patch.object(metrics_utils, 'METRICS_FLUSH_SIZE', 1), \
+                mock.patch.object(metrics_utils, '_ensure_writer') as ensure_writer, \
+                CaptureQueriesContext(connection) as queries:
+            self.client.get('/login/')
+        self.assertFalse([query for query in queries if 'main_requestmetric' in query['sql']])
+        # Буфер заполнен: фоновый поток разбужен
+        ensure_writer.assert_called()
+        self.assertTrue(metrics_utils._flush_needed.is_set())
+        metrics_utils._flush_needed.clear()
+        self.assertEqual(metrics_utils.flush_request_metrics(), 1)
+
+    def test_admin_page(self):
+        """Страница админки показывает замеры, в том числе ещё не записанные в БД"""
+        admin = User.objects.create_superuser(username='root', password='pass12345')
+        self.client.force_login(admin)
+        self.client.get('/login/')
+
+        response = self.client.get('/admin/request-metrics/?hours=1')
+        self.assertContains(response, 'main:login')
+
+
+class PrometheusMetricsTests(TestCase):
+    """Тесты страницы /metrics и счётчиков приложения"""
+
+    def test_text_format(self):
+        """Счётчики и гистограммы выводятся в формате экспозиции Prometheus"""
+        from main.prometheus_utils import Counter, Histogram, render_metrics
+
+        registry = []
+        counter = Counter('test_total', 'Тестовый счётчик', ('kind',), registry=registry)
+        histogram = Histogram('test_seconds', 'Тестовая гистограмма', buckets=(0.1, 1), registry=registry)
+        counter.inc(kind='a "quoted"')
+        counter.inc(2, kind='a "quoted"')
+        for value in (0.05, 0.1, 0.5, 3):
+            histogram.observe(value)
+
+        lines = render_metrics(registry).splitlines()
+        self.assertIn('# TYPE test_total counter', lines)
+        self.assertIn('test_total{kind="a \\"quoted\\""} 3', lines)
+        self.assertIn('# TYPE test_seconds histogram', lines)
+        self.assertIn('test_seconds_bucket{le="0.1"} 2', lines)
+        self.assertIn('test_seconds_bucket{le="1"} 3', lines)
+        self.assertIn('test_seconds_bucket{le="+Inf"} 4', lines)
+        self.assertIn('test_seconds_sum 3.65', lines)
+        self.assertIn('test_seconds_count 4', lines)
+        with self.assertRaises(ValueError):
+            counter.inc(other='x')
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_login_outcomes_and_requests(self):
+        """Исходы входа и HTTP запросы попадают в /metrics"""
+        from main.prometheus_utils import HTTP_REQUESTS, LOGIN_ATTEMPTS
+
+        User.objects.create_user(username='metered', password='pass12345')
+        failed = LOGIN_ATTEMPTS.value(outcome='failed')
+        success = LOGIN_ATTEMPTS.value(outcome='success')
+        requests_before = HTTP_REQUESTS.value(view='main:login', method='POST', status='200')
+
+        self.client.post('/login/', {'username': 'metered', 'password': 'wrong', **solved_captcha()})
+        self.client.post('/login/', {'username': 'metered', 'password': 'pass12345', **solved_captcha()})
+
+        self.assertEqual(LOGIN_ATTEMPTS.value(outcome='failed'), failed + 1)
+        self.assertEqual(LOGIN_ATTEMPTS.value(outcome='success'), success + 1)
+        self.assertEqual(HTTP_REQUESTS.value(view='main:login', method='POST', status='200'), requests_before + 1)
+
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn('ctrlmoney_login_attempts_total{outcome="success"}', body)
+        self.assertIn('ctrlmoney_http_request_duration_seconds_bucket{view="main:login",le="+Inf"}', body)
+        self.assertIn('ctrlmoney_db_queries_per_request_count{view="main:login"}', body)
+
+    def test_export_rows_are_counted(self):
+        """Экспорт JSON увеличивает счётчик выгруженных строк"""
+        from main.json_utils import export_user_data_to_json
+        from main.prometheus_utils import JSON_DURATION, JSON_ROWS
+
+        user = User.objects.create_user(username='exporter', password='pass12345')
+        Account.objects.create(user=user, name='Карта', amount=Decimal('10'), account_type='debit')
+        rows = JSON_ROWS.value(direction='export', section='accounts')
+        exports = JSON_DURATION.count(direction='export')
+
+        export_user_data_to_json(user)
+
+        self.assertEqual(JSON_ROWS.value(direction='export', section='accounts'), rows + 1)
+        self.assertEqual(JSON_DURATION.count(direction='export'), exports + 1)
+
+    @override_settings(METRICS_TOKEN='secret', METRICS_ALLOWED_IPS=[])
+    def test_access(self):
+        """Без токена и не с разрешённого адреса /metrics недоступна"""
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+    def test_loopback_is_not_trusted_by_default(self):
+        """Адрес 127.0.0.1 (прокси на том же сервере) сам по себе не даёт доступа"""
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='127.0.0.1').status_code, 403)
+        with override_settings(METRICS_ALLOWED_IPS=['10.0.0.5']):
+            self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.5').status_code, 200)
+
+
+class SyntheticDataAndBenchmarkTests(TestCase):
+    """Тесты генератора синтетических данных и бенчмарков"""
+
+    def test_generator_creates_consistent_data(self):
+        """Генератор создаёт заданный объём данных и пересчитывает сводные таблицы"""
+        from django.core.management import call_command
+
+        call_command('generate_synthetic_data', users=3, transactions=40, goals=2, categories=4,
+                     seed=7, stdout=StringIO())
+        call_command('generate_synthetic_data', users=1, transactions=5, seed=7, stdout=StringIO())
+
+        users = User.objects.filter(username__startswith='synthetic_')
+        self.assertEqual(sorted(users.values_list('username', flat=True)),
+                         ['synthetic_0', 'synthetic_1', 'synthetic_2', 'synthetic_3'])
+        self.assertEqual(UserProfile.objects.filter(user__in=users).count(), 4)
+        self.assertEqual(Transaction.objects.filter(user__in=users).count(), 3 * 40 + 5)
+        self.assertEqual(Account.objects.filter(user__username='synthetic_0').count(), 3)
+        self.assertEqual(Goal.objects.filter(user__username='synthetic_0').count(), 2)
+        self.assertEqual(
+            {user_id: values['transactions_count'] for user_id, values in UserBalance.calculate().items()},
+            dict(UserBalance.objects.values_list('user_id', 'transactions_count')),
+        )
+        self.assertEqual(len(MonthlyCategoryRollup.calculate()), MonthlyCategoryRollup.objects.count())
+
+        call_command('generate_synthetic_data', delete=True, stdout=StringIO())
+        self.assertFalse(users.exists())
+
+    def test_benchmarks_run_and_roll_back(self):
+        """Бенчмарки считают SQL запросы и не оставляют изменений в базе"""
+        from main.benchmark_utils import BENCHMARKS, run_benchmarks
+        from main.synthetic_utils import SyntheticDataGenerator
+
+        SyntheticDataGenerator(transactions=20, seed=1).generate(1)
+        user = User.objects.get(username='synthetic_0')
+        counts = (User.objects.count(), Transaction.objects.count(), Goal.objects.count())
+
+        results = run_benchmarks(user, repeat=1)
+
+        self.assertEqual(set(results), set(BENCHMARKS))
+        self.assertEqual(results['forecast:api_accounts']['queries'], 1)
+        self.assertGreater(results['json:export']['peak_kb'], 0)
+        # Потоковые пути, которыми пользуются /api/export-json/ и /api/import-json/
+        self.assertGreater(results['json:export_stream']['peak_kb'], 0)
+        self.assertLess(results['json:import_stream']['queries'], results['json:import']['queries'])
+        self.assertEqual((User.objects.count(), Transaction.objects.count(), Goal.objects.count()), counts)
+
+    def test_compare_with_baseline(self):
+        """Ухудшением считается рост времени или памяти сверх допуска и любой рост числа запросов"""
+        from main.benchmark_utils import compare_with_baseline
+
+        baseline = {
+            'fast': {'median_ms': 100, 'queries': 3, 'peak_kb': 1000},
+            'noisy': {'median_ms': 1, 'queries': 3, 'peak_kb': 10},
+        }
+        results = {
+            'fast': {'median_ms': 130, 'queries': 4, 'peak_kb': 2000},
+            'noisy': {'median_ms': 3, 'queries': 3, 'peak_kb': 30},
+            'new': {'median_ms': 1, 'queries': 1, 'peak_kb': 1},
+        }
+
+        regressions = compare_with_baseline(results, baseline, tolerance=0.25)
+        self.assertEqual(len(regressions), 3)
+        self.assertTrue(all(regression.startswith('fast:') for regression in regressions))
+
+
+class CaptchaTileTests(TestCase):
+    """Тесты фрагментов пазла капчи"""
+
+    def setUp(self):
+        import tempfile
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        from pathlib import Path
+        self.tiles_dir = Path(tmp.name)
+        settings_override = override_settings(CAPTCHA_TILES_DIR=self.tiles_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_fallback_without_manifest(self):
+        """Пока пазлы не собраны, исходные картинки отдаются по адресам капчи, а не static"""
+        from django.contrib.staticfiles import finders
+        from main.captcha_utils import get_captcha_pieces
+
+        pieces = get_captcha_pieces()
+        self.assertEqual(sorted(piece['number'] for piece in pieces), [1, 2, 3, 4])
+        for piece in pieces:
+            self.assertNotIn('/static/', piece['src'])
+            tile = self.client.get(piece['src'])
+            self.assertEqual(tile['Content-Type'], 'image/png')
+            with open(finders.find(f'img/{piece["number"]}.png'), 'rb') as source:
+                self.assertEqual(b''.join(tile.streaming_content), source.read())
+
+    def test_unknown_tile(self):
+        """Чужие, поддельные и некорректные адреса фрагментов — 404"""
+        from main.captcha_utils import get_captcha_pieces
+
+        pieces = get_captcha_pieces()
+        other = get_captcha_pieces()
+        name = pieces[0]['src'].rsplit('/', 1)[1]
+        self.assertEqual(self.client.get(f'/captcha/{other.token}/{name}').status_code, 404)
+        self.assertEqual(self.client.get(f'/captcha/{pieces.token}x/{name}').status_code, 404)
+        self.assertEqual(self.client.get(f'/captcha/{pieces.token}/' + '0' * 16 + '.png').status_code, 404)
+        self.assertEqual(self.client.get(f'/captcha/{pieces.token}/manifest.json').status_code, 404)
+
+    @skipUnless(PIL, 'Pillow не установлен')
+    def test_build_and_serve_tiles(self):
+        """Собранные фрагменты отдаются по адресам капчи, страница входа остаётся лёгкой"""
+        from main.captcha_utils import build_captcha_tiles, get_captcha_pieces
+
+        first = build_captcha_tiles(tiles_dir=self.tiles_dir, variants=2, seed=1)
+        self.assertEqual(len(first['puzzles']), 2)
+
+        pieces = get_captcha_pieces()
+        self.assertEqual(sorted(piece['number'] for piece in pieces), [1, 2, 3, 4])
+        self.assertEqual(pieces[0]['width'], 256)
+        self.assertIn('image/webp', [source['type'] for source in pieces[0]['sources']])
+
+        response = self.client.get('/login/')
+        page_bytes = len(response.content)
+        self.assertContains(response, 'type="image/webp"')
+        for piece in pieces:
+            webp = next(source['url'] for source in piece['sources'] if source['type'] == 'image/webp')
+            tile = self.client.get(webp)
+            self.assertEqual(tile.status_code, 200)
+            self.assertEqual(tile['Content-Type'], 'image/webp')
+            self.assertEqual(tile['Cache-Control'], 'private, max-age=600')
+            page_bytes += len(b''.join(tile.streaming_content))
+        self.assertLess(page_bytes, 100 * 1024)
+
+        # У каждой капчи свои адреса фрагментов
+        other = get_captcha_pieces()
+        self.assertFalse({piece['src'] for piece in pieces} & {piece['src'] for piece in other})
+
+        # Пазлы предыдущего набора остаются доступны, более старые удаляются
+        first_files = {name for puzzle in first['puzzles'] for tile in puzzle['tiles'] for name in tile.values()}
+        build_captcha_tiles(tiles_dir=self.tiles_dir, variants=2, seed=2)
+        self.assertEqual(self.client.get(pieces[0]['src']).status_code, 200)
+        build_captcha_tiles(tiles_dir=self.tiles_dir, variants=2, seed=3)
+        remaining = {path.name for path in self.tiles_dir.iterdir()}
+        self.assertFalse(first_files & remaining)
+        self.assertEqual(self.client.get(pieces[0]['src']).status_code, 404)
+
+    def test_captcha_token(self):
+        """Токен принимает только правильный порядок, один раз и до истечения срока"""
+        from main.captcha_utils import get_captcha_pieces, verify_captcha_token
+
+        def ordered_ids(challenge):
+            return ','.join(piece['id'] for piece in sorted(challenge, key=lambda piece: piece['number']))
+
+        pieces = get_captcha_pieces()
+        self.assertNotIn(str(pieces[0]['number']), [piece['id'] for piece in pieces])
+        self.assertFalse(verify_captcha_token(pieces.token + 'x', ordered_ids(pieces)))
+        self.assertFalse(verify_captcha_token(pieces.token, ordered_ids(pieces), max_age=-1))
+        self.assertTrue(verify_captcha_token(pieces.token, ordered_ids(pieces)))
+        # Повторно тот же решённый токен не принимается
+        self.assertFalse(verify_captcha_token(pieces.token, ordered_ids(pieces)))
+
+        # Каждый токен — одна попытка: после неверного порядка верный уже не принимается
+        for wrong in (lambda ids: ','.join(reversed(ids.split(','))), lambda ids: ids.rsplit(',', 1)[0]):
+            pieces = get_captcha_pieces()
+            self.assertFalse(verify_captcha_token(pieces.token, wrong(ordered_ids(pieces))))
+            self.assertFalse(verify_captcha_token(pieces.token, ordered_ids(pieces)))
+
+        # Фрагменты другой капчи к этому токену не подходят
+        other = get_captcha_pieces()
+        self.assertFalse(verify_captcha_token(other.token, ordered_ids(pieces)))
+
+    def test_login_page_hides_order(self):
+        """На странице входа нет номеров мест фрагментов, только токен и идентификаторы"""
+        response = self.client.get('/login/')
+        pieces = response.context['captcha_pieces']
+        self.assertContains(response, f'value="{pieces.token}"')
+        for piece in pieces:
+            self.assertContains(response, f'data-piece="{piece["id"]}"')
+        self.assertNotContains(response, 'correctOrder')
+
+
+@override_settings(RATE_LIMITS={
+    'login': {'ip': (5, 60), 'username': (2, 60)},
+    'register': {'subnet': (1, 60)},
+})
+class RateLimitTests(TestCase):
+    """Тесты ограничения частоты попыток входа и регистрации"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='limited', password='pass12345')
+
+    def test_sliding_window(self):
+        """Лимит по скользящему окну: вклад прошлого окна убывает со временем"""
+        from main.ratelimit_utils import check_rate_limit
+
+        subjects = {'ip': '10.0.0.1'}
+        start = 6000.0
+        for offset in range(5):
+            self.assertEqual(check_rate_limit('login', subjects, now=start + offset), 0)
+        retry_after = check_rate_limit('login', subjects, now=start + 10)
+        # Текущее окно заполнено: ждать до начала следующего
+        self.assertEqual(retry_after, 60 - 10 + 1)
+        # В начале следующего окна прошлое ещё весит полностью, затем убывает
+        self.assertGreater(check_rate_limit('login', subjects, now=start + 60), 0)
+        self.assertEqual(check_rate_limit('login', subjects, now=start + 10 + retry_after), 0)
+        self.assertGreater(check_rate_limit('login', subjects, now=start + 62), 0)
+        # Другой адрес считается отдельно
+        self.assertEqual(check_rate_limit('login', {'ip': '10.0.0.2'}, now=start + 10), 0)
+
+    def test_login_limited_by_username_without_db(self):
+        """Перебор пароля упирается в лимит по имени: 429, Retry-After и ни одного SQL запроса"""
+        for _ in range(2):
+            self.client.post('/login/', {'username': 'limited', 'password': 'wrong', **solved_captcha()})
+
+        captcha = solved_captcha()
+        with self.assertNumQueries(0):
+            response = self.client.post('/login/', {'username': 'limited', 'password': 'pass12345', **captcha})
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        self.assertEqual(User.objects.get(username='limited').profile.failed_login_attempts, 2)
+
+        # Несуществующие имена тоже ограничиваются
+        for _ in range(2):
+            self.client.post('/login/', {'username': 'ghost', 'password': 'wrong', **solved_captcha()})
+        response = self.client.post('/login/', {'username': 'ghost', 'password': 'wrong', **solved_captcha()})
+        self.assertEqual(response.status_code, 429)
+
+        # Лимит по адресу: отклонённые попытки не засчитываются, пятая разрешённая — последняя
+        response = self.client.post('/login/', {'username': 'other', 'password': 'wrong', **solved_captcha()})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post('/login/', {'username': 'another', 'password': 'wrong', **solved_captcha()})
+        self.assertEqual(response.status_code, 429)
+
+    def test_register_limited_by_subnet(self):
+        """Регистрации ограничиваются по подсети /24"""
+        data = {'username': 'newbie', 'password': 'x', 'password_confirm': 'y'}
+        response = self.client.post('/register/', {**data, **solved_captcha()}, REMOTE_ADDR='192.0.2.10')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post('/register/', {**data, **solved_captcha()}, REMOTE_ADDR='192.0.2.77')
+        self.assertEqual(response.status_code, 429)
+        response = self.client.post('/register/', {**data, **solved_captcha()}, REMOTE_ADDR='198.51.100.1')
+        self.assertEqual(response.status_code, 200)
+
+
+    def test_client_ip_behind_trusted_proxy(self):
+        """За доверенным прокси адрес клиента — крайний правый недоверенный в X-Forwarded-For"""
+        from django.test import RequestFactory
+        from main.ratelimit_utils import client_ip
+
+        factory = RequestFactory()
+        # Прокси на том же сервере: левую часть заголовка клиент подставил сам
+        request = factory.get('/', REMOTE_ADDR='127.0.0.1', HTTP_X_FORWARDED_FOR='1.1.1.1, 203.0.113.7')
+        self.assertEqual(client_ip(request), '203.0.113.7')
+        # Без заголовка и от недоверенного адреса заголовок не используется
+        self.assertEqual(client_ip(factory.get('/', REMOTE_ADDR='127.0.0.1')), '127.0.0.1')
+        request = factory.get('/', REMOTE_ADDR='198.51.100.9', HTTP_X_FORWARDED_FOR='203.0.113.7')
+        self.assertEqual(client_ip(request), '198.51.100.9')
+        # Цепочка доверенных прокси (сеть) пропускается
+        with self.settings(RATELIMIT_TRUSTED_PROXIES=['127.0.0.1', '10.0.0.0/8']):
+            request = factory.get('/', REMOTE_ADDR='127.0.0.1', HTTP_X_FORWARDED_FOR='203.0.113.7, 10.1.2.3')
+            self.assertEqual(client_ip(request), '203.0.113.7')
+
+    def test_proxied_clients_have_separate_limits(self):
+        """Клиенты за прокси на 127.0.0.1 не делят один лимит по адресу"""
+        for i in range(5):
+            response = self.client.post('/login/', {'username': f'bot{i}', 'password': 'wrong', **solved_captcha()},
+                                        HTTP_X_FORWARDED_FOR='203.0.113.66')
+            self.assertEqual(response.status_code, 200)
+        response = self.client.post('/login/', {'username': 'bot', 'password': 'wrong', **solved_captcha()},
+                                    HTTP_X_FORWARDED_FOR='203.0.113.66')
+        self.assertEqual(response.status_code, 429)
+
+        response = self.client.post('/login/', {'username': 'limited', 'password': 'pass12345', **solved_captcha()},
+                                    HTTP_X_FORWARDED_FOR='198.51.100.20')
+        self.assertEqual(response.status_code, 302)
+
+
+TUNED_HASHERS = [
+    'main.password_utils.TunedPBKDF2PasswordHasher',
+    'main.password_utils.TunedScryptPasswordHasher',
+    'django.contrib.auth.hashers.MD5PasswordHasher',
+]
+
+
+@override_settings(PASSWORD_HASHERS=TUNED_HASHERS, PASSWORD_PBKDF2_ITERATIONS=1000)
+class PasswordHasherPolicyTests(TestCase):
+    """Тесты настраиваемой стоимости хеширования паролей"""
+
+    def setUp(self):
+        cache.clear()
+
+    def login(self, username, password):
+        return self.client.post('/login/', {'username': username, 'password': password, **solved_captcha()})
+
+    def test_iterations_from_settings_and_rehash_on_login(self):
+        """Число итераций берётся из настроек, после изменения хеш пересчитывается при входе"""
+        user = User.objects.create_user(username='hashed', password='pass12345')
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$1000$'))
+
+        with self.settings(PASSWORD_PBKDF2_ITERATIONS=2000):
+            response = self.login('hashed', 'pass12345')
+        self.assertEqual(response.status_code, 302)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$2000$'))
+        self.assertTrue(user.check_password('pass12345'))
+
+        # Неверный пароль хеш не меняет
+        password = user.password
+        self.login('hashed', 'wrong')
+        user.refresh_from_db()
+        self.assertEqual(user.password, password)
+
+    def test_algorithm_switch_on_login(self):
+        """Пароль со старым алгоритмом проверяется и пересохраняется основным"""
+        user = User.objects.create_user(username='legacy', password='pass12345')
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$'))
+
+        with self.settings(
+            PASSWORD_HASHERS=[TUNED_HASHERS[1], TUNED_HASHERS[0]], PASSWORD_SCRYPT_WORK_FACTOR=2 ** 10,
+        ):
+            self.assertEqual(self.login('legacy', 'pass12345').status_code, 302)
+            user.refresh_from_db()
+            self.assertTrue(user.password.startswith('scrypt$1024$'))
+            self.assertTrue(user.check_password('pass12345'))
+
+    def test_calibration(self):
+        """Калибровка подбирает параметры и печатает настройки"""
+        from django.core.management import call_command
+        from main.password_utils import calibrate_password_hasher
+
+        params, elapsed = calibrate_password_hasher('pbkdf2_sha256', target_ms=5, repeat=1)
+        self.assertIsInstance(params['PASSWORD_PBKDF2_ITERATIONS'], int)
+        self.assertGreaterEqual(params['PASSWORD_PBKDF2_ITERATIONS'], 10000)
+        self.assertGreater(elapsed, 0)
+
+        out = StringIO()
+        call_command('calibrate_password_hasher', algorithm='scrypt', target_ms=5, repeat=1, stdout=out)
+        self.assertIn('PASSWORD_SCRYPT_WORK_FACTOR = ', out.getvalue())
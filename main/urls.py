@@ -11,4 +11,8 @@ urlpatterns = [
     path('account-locked/', views.account_locked, name='account_locked'),
     path('', views.index, name='index'),
     path('profile/', views.profile, name='profile'),
+    path('api/export-json/', views.export_json, name='export_json'),
+    path('api/import-json/', views.import_json, name='import_json'),
+    path('metrics', views.metrics, name='metrics'),
+    path('captcha/<str:token>/<str:name>', views.captcha_tile, name='captcha_tile'),
 ]
@@ -1,18 +1,32 @@
 from django.shortcuts import render, redirect
-from django.contrib.auth import authenticate, login as auth_login
+from django.contrib.auth import login as auth_login
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import ensure_csrf_cookie, csrf_protect
-from django.http import JsonResponse
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
+from django.conf import settings
+from django.db.models import Case, F, Q, Value, When
 from django.utils import timezone
 from django.urls import reverse
 from datetime import timedelta
 from .models import UserProfile
-from .captcha_utils import get_captcha_pieces
+from .captcha_utils import (
+    CAPTCHA_TILE_MIME, CAPTCHA_TOKEN_MAX_AGE, captcha_tile_path, get_captcha_pieces, verify_captcha_token,
+)
+from .json_utils import import_user_data_from_stream, iter_user_data_json
+from .stream_utils import streaming_attachment, wants_gzip
+from .prometheus_utils import CONTENT_TYPE, LOGIN_ATTEMPTS, render_metrics
+from .ratelimit_utils import check_rate_limit, rate_limit_subjects
+import hmac
+import math
 import random
 
 
+# После стольких неудачных попыток подряд аккаунт блокируется
+MAX_FAILED_LOGIN_ATTEMPTS = 3
+
+
 @require_http_methods(["GET"])
 @ensure_csrf_cookie
 def account_locked(request):
@@ -23,6 +37,38 @@ def account_locked(request):
     })
 
 
+def _register_failed_login(user, profile):
+    """
+    Увеличивает счетчик неудачных попыток одним UPDATE и на последней
+    допустимой попытке блокирует аккаунт. Счетчик считается в БД, поэтому
+    параллельные попытки не теряются. Возвращает число попыток с учетом
+    текущей. Суперюзеры не блокируются (как в UserProfile.save).
+    """
+    if user.is_superuser:
+        return 1
+    now = timezone.now()
+    # Условие считается по значению до увеличения счетчика
+    last_attempt = Q(failed_login_attempts__gte=MAX_FAILED_LOGIN_ATTEMPTS - 1)
+    UserProfile.objects.filter(pk=profile.pk).update(
+        failed_login_attempts=F('failed_login_attempts') + 1,
+        is_blocked=Case(When(last_attempt, then=Value(True)), default=F('is_blocked')),
+        blocked_at=Case(When(last_attempt, then=Value(now)), default=F('blocked_at')),
+        updated_at=now,
+    )
+    return profile.failed_login_attempts + 1
+
+
+def _too_many_attempts(request, template, retry_after, context=None):
+    """Ответ 429 с формой и заголовком Retry-After"""
+    response = render(request, template, {
+        'error': f'Слишком много попыток, повторите через {math.ceil(retry_after / 60)} мин.',
+        'captcha_pieces': get_captcha_pieces(),
+        **(context or {}),
+    }, status=429)
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
 @require_http_methods(["GET", "POST"])
 @ensure_csrf_cookie
 @csrf_protect
@@ -31,49 +77,57 @@ def login(request):
     if request.method == 'POST':
         username = request.POST.get('username', '')
         password = request.POST.get('password', '')
-        captcha_passed = request.POST.get('captcha_passed', '0')
+        captcha_token = request.POST.get('captcha_token', '')
+        captcha_answer = request.POST.get('captcha_answer', '')
         
-        # Проверяем что капча пройдена
-        if captcha_passed != '1':
+        # Ограничиваем частоту попыток по адресу, подсети и имени (счетчики в кеше, не в БД)
+        retry_after = check_rate_limit('login', rate_limit_subjects(request, username))
+        if retry_after:
+            LOGIN_ATTEMPTS.inc(outcome='ratelimited')
+            return _too_many_attempts(request, 'main/login.html', retry_after, {'username': username})
+        
+        # Проверяем собранный пазл по подписанному токену
+        if not verify_captcha_token(captcha_token, captcha_answer):
+            LOGIN_ATTEMPTS.inc(outcome='captcha')
             return render(request, 'main/login.html', {
-                'error': 'Пожалуйста, пройдите проверку капчей',
+                'error': 'Пазл собран неверно или устарел, соберите его ещё раз',
                 'username': username,
                 'captcha_pieces': get_captcha_pieces(),
             })
         
         try:
-            user = User.objects.get(username=username)
+            # Пользователь и профиль одним запросом
+            user = User.objects.select_related('profile').get(username=username)
             profile = user.profile
             
-            # Проверяем что аккаунт не заблокирован
+            # Проверяем что аккаунт не заблокирован (до дорогой проверки пароля)
             if profile.is_blocked:
+                LOGIN_ATTEMPTS.inc(outcome='blocked')
                 return redirect(f"{reverse('main:account_locked')}?username={username}")
             
-            # Пытаемся аутентифицировать пользователя
-            authenticated_user = authenticate(username=username, password=password)
-            
-            if authenticated_user is not None:
+            # Проверяем пароль на уже загруженном пользователе (как ModelBackend,
+            # но без повторного поиска пользователя)
+            if user.is_active and user.check_password(password):
                 # Успешный вход - сбрасываем счетчик неудачных попыток
-                profile.failed_login_attempts = 0
-                profile.save()
+                if profile.failed_login_attempts:
+                    UserProfile.objects.filter(pk=profile.pk).update(
+                        failed_login_attempts=0, updated_at=timezone.now(),
+                    )
                 
                 # Логируемся
-                auth_login(request, authenticated_user)
+                auth_login(request, user)
+                LOGIN_ATTEMPTS.inc(outcome='success')
                 return redirect('main:index')
             else:
                 # Неудачная попытка входа
-                profile.failed_login_attempts += 1
+                failed_attempts = _register_failed_login(user, profile)
                 
-                if profile.failed_login_attempts >= 3:
-                    # Блокируем аккаунт после 3 неудачных попыток
-                    profile.is_blocked = True
-                    profile.blocked_at = timezone.now()
-                    profile.save()
-                    
+                if failed_attempts >= MAX_FAILED_LOGIN_ATTEMPTS:
+                    LOGIN_ATTEMPTS.inc(outcome='blocked')
                     return redirect(f"{reverse('main:account_locked')}?username={username}")
                 else:
-                    remaining_attempts = 3 - profile.failed_login_attempts
-                    profile.save()
+                    remaining_attempts = MAX_FAILED_LOGIN_ATTEMPTS - failed_attempts
+                    LOGIN_ATTEMPTS.inc(outcome='failed')
                     
                     return render(request, 'main/login.html', {
                         'error': f'Неверные данные. Осталось попыток: {remaining_attempts}',
@@ -83,6 +137,7 @@ def login(request):
         
         except User.DoesNotExist:
             # Пользователь не найден
+            LOGIN_ATTEMPTS.inc(outcome='failed')
             return render(request, 'main/login.html', {
                 'error': 'Пользователь не найден',
                 'username': username,
@@ -106,12 +161,18 @@ def register(request):
         password_confirm = request.POST.get('password_confirm', '')
         first_name = request.POST.get('first_name', '')
         last_name = request.POST.get('last_name', '')
-        captcha_passed = request.POST.get('captcha_passed', '0')
+        captcha_token = request.POST.get('captcha_token', '')
+        captcha_answer = request.POST.get('captcha_answer', '')
         
-        # Проверяем что капча пройдена
-        if captcha_passed != '1':
+        # Ограничиваем частоту регистраций с одного адреса и подсети
+        retry_after = check_rate_limit('register', rate_limit_subjects(request))
+        if retry_after:
+            return _too_many_attempts(request, 'main/register.html', retry_after)
+        
+        # Проверяем собранный пазл по подписанному токену
+        if not verify_captcha_token(captcha_token, captcha_answer):
             return render(request, 'main/register.html', {
-                'error': 'Пожалуйста, пройдите проверку капчей',
+                'error': 'Пазл собран неверно или устарел, соберите его ещё раз',
                 'captcha_pieces': get_captcha_pieces(),
             })
         
@@ -170,3 +231,68 @@ def index(request):
 def profile(request):
     """Страница профиля пользователя"""
     return render(request, 'main/profile.html')
+
+
+@login_required(login_url='main:login')
+@require_http_methods(["GET"])
+def export_json(request):
+    """Потоковый экспорт данных пользователя в JSON (?gzip=1 — сжатый файл)"""
+    timestamp = timezone.now().strftime('%Y%m%d_%H%M%S')
+    return streaming_attachment(
+        iter_user_data_json(request.user),
+        f'ctrlmoney_export_{timestamp}.json',
+        'application/json; charset=utf-8',
+        gzip=wants_gzip(request),
+    )
+
+
+@login_required(login_url='main:login')
+@require_http_methods(["POST"])
+def import_json(request):
+    """Импорт данных пользователя из загруженного JSON файла (поле json_file)"""
+    upload = request.FILES.get('json_file')
+    if upload is None:
+        return JsonResponse({'success': False, 'error': 'Файл не выбран'}, status=400)
+
+    # Файл читается потоково и вставляется пачками (BulkImporter), поэтому
+    # большие выгрузки не загружаются в память целиком
+    result = import_user_data_from_stream(upload, request.user)
+    return JsonResponse(result, status=200 if result['success'] else 400)
+
+
+def _metrics_allowed(request):
+    """Доступ к /metrics: адреса из METRICS_ALLOWED_IPS, суперпользователи или Bearer токен"""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    authorization = request.headers.get('Authorization', '')
+    if token and hmac.compare_digest(authorization.encode(), f'Bearer {token}'.encode()):
+        return True
+    if request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', ()):
+        return True
+    return request.user.is_authenticated and request.user.is_superuser
+
+
+@require_http_methods(["GET"])
+def metrics(request):
+    """Метрики приложения в формате Prometheus"""
+    if not _metrics_allowed(request):
+        return HttpResponse('Доступ запрещён', status=403, content_type='text/plain; charset=utf-8')
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE)
+
+
+@require_http_methods(["GET", "HEAD"])
+def captcha_tile(request, token, name):
+    """
+    Фрагмент пазла капчи по адресу, уникальному для каждой капчи (токен и
+    непрозрачный идентификатор фрагмента). Кешируется только браузером
+    и только на время жизни токена.
+    """
+    path = captcha_tile_path(token, name)
+    if path is None:
+        raise Http404
+    try:
+        tile = open(path, 'rb')
+    except FileNotFoundError:
+        raise Http404
+    response = FileResponse(tile, content_type=CAPTCHA_TILE_MIME[path.suffix[1:]])
+    response['Cache-Control'] = f'private, max-age={CAPTCHA_TOKEN_MAX_AGE}'
+    return response